@@ -0,0 +1,93 @@
+# bench_startup.py
+"""
+Startup-time benchmark for main_server.
+
+Measures, each in a fresh interpreter:
+  * import time of main_server
+  * time from launching the server process until the first GET / succeeds
+
+Usage:
+    python bench_startup.py [--runs 5] [--max-import 2.0] [--max-first-request 5.0]
+
+Exits with status 1 when a median exceeds its --max-* budget, so it can guard
+startup regressions in CI.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).resolve().parent
+
+
+def measure_import() -> float:
+    code = (
+        "import time; started = time.perf_counter(); import main_server; "
+        "print(time.perf_counter() - started)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=CURRENT_DIR,
+        capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(timeout: float = 60.0) -> float:
+    port = free_port()
+    env = dict(os.environ, MAIN_SERVICE=str(port), PROMPT_HOST="127.0.0.1")
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "main_server.py"], cwd=CURRENT_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"server did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import", type=float, default=None, help="budget in seconds for the median import time")
+    parser.add_argument("--max-first-request", type=float, default=None, help="budget in seconds for the median time-to-first-request")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    first_requests = [measure_first_request() for _ in range(args.runs)]
+
+    results = {"import": imports, "first_request": first_requests}
+    budgets = {"import": args.max_import, "first_request": args.max_first_request}
+    failed = False
+    for name, samples in results.items():
+        median = statistics.median(samples)
+        budget = budgets[name]
+        verdict = ""
+        if budget is not None:
+            verdict = "OK" if median <= budget else f"OVER BUDGET ({budget:.2f}s)"
+            failed = failed or median > budget
+        print(f"{name:>14}: median {median:.3f}s  min {min(samples):.3f}s  max {max(samples):.3f}s  {verdict}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
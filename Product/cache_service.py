@@ -0,0 +1,701 @@
+import asyncio
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a user prompt so trivially different spellings share a cache entry.
+
+    Lowercases the text and collapses all runs of whitespace to single spaces.
+
+    Args:
+        prompt: The raw user prompt.
+
+    Returns:
+        The normalized prompt string.
+    """
+    return " ".join((prompt or "").lower().split())
+
+
+def hash_text(text: str) -> str:
+    """
+    Returns the hex SHA-256 digest of a string.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(prompt: str, template_hash: str, model_name: str) -> str:
+    """
+    Builds the cache key for a generation.
+
+    Args:
+        prompt: The raw user prompt (normalized here).
+        template_hash: Hash of the assembled instruction block sent with every prompt.
+        model_name: The model that produces the response.
+
+    Returns:
+        A hex digest identifying the (prompt, template, model) combination.
+    """
+    return hash_text(f"{model_name}\x00{template_hash}\x00{normalize_prompt(prompt)}")
+
+
+class ResponseCache:
+    """
+    Thread-safe, bounded LRU cache with a per-entry time to live.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0):
+        """
+        Initializes an empty cache.
+
+        Args:
+            max_entries: Maximum number of entries kept before evicting the least recently used.
+            ttl_seconds: Seconds an entry stays valid after being stored.
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive.")
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        """
+        Returns the cached value for key, or None when absent or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value) -> None:
+        """
+        Stores value under key, evicting the least recently used entries if full.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def purge(self) -> int:
+        """
+        Removes every entry and returns how many were dropped.
+        """
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+    def stats(self) -> dict:
+        """
+        Returns the current size and hit/miss/eviction counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls that share a key into one execution.
+
+    The first caller for a key starts the work; callers arriving while it is
+    in flight await the same task and receive its result or its exception.
+    When every caller has been cancelled (e.g. all clients disconnected) the
+    work is cancelled too, since nobody is left to read its result. The work
+    runs with the context, and so the request deadline, of the first caller.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._waiters = {}
+        self.started = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn):
+        """
+        Runs fn() for key unless a call for key is already in flight.
+
+        Args:
+            key: Identity of the work, e.g. the prompt cache key.
+            fn: Zero-argument callable returning an awaitable.
+
+        Returns:
+            The result of the shared call.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        # Shielded so one caller giving up does not cancel the work for the others
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def stats(self) -> dict:
+        """
+        Returns the number of in-flight keys and started/coalesced/abandoned call counters.
+        """
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+
+class SQLiteCache:
+    """
+    Persistent generation cache in a local SQLite file, shared by all workers.
+
+    The database runs in WAL mode so several uvicorn workers can read while one
+    writes. Entries are evicted least recently used first once the stored
+    values exceed max_bytes.
+
+    Reads do not write: hit times are collected in memory and stored in
+    batches of touch_batch (and before every write), so a hit never waits
+    for the write lock. Every method blocks; call them from a thread.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, touch_batch: int = 64):
+        """
+        Opens (and creates if needed) the cache database.
+
+        Args:
+            path: Location of the SQLite file.
+            max_bytes: Upper bound on the total size of stored values.
+            touch_batch: Hits collected before their access times are written.
+        """
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self._local = threading.local()
+        self._touched = {}
+        self._touch_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " key TEXT PRIMARY KEY,"
+            " namespace TEXT NOT NULL,"
+            " prompt TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS generations_accessed ON generations (accessed_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """
+        Returns the stored value for key, or None when absent.
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM generations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        with self._touch_lock:
+            self._touched[key] = time.time()
+            full = len(self._touched) >= self.touch_batch
+        if full:
+            self.flush_access_times()
+        return row[0]
+
+    def flush_access_times(self, conn: sqlite3.Connection = None) -> None:
+        """
+        Writes the collected hit times. They only steer eviction, so a batch
+        that cannot get the write lock is dropped rather than retried.
+        """
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        own_transaction = conn is None
+        conn = conn or self._connect()
+        try:
+            conn.executemany(
+                "UPDATE generations SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in touched.items()]
+            )
+            if own_transaction:
+                conn.commit()
+        except sqlite3.OperationalError as e:
+            print(f"[CACHE] dropped {len(touched)} access times: {e}")
+
+    def set(self, key: str, value: str, prompt: str = "", namespace: str = "") -> None:
+        """
+        Stores value under key, then evicts old entries if over max_bytes.
+
+        Args:
+            key: Cache key of the generation.
+            value: The serialized schema.
+            prompt: Original user prompt, kept for warm-starting the similarity cache.
+            namespace: Model/template scope of the entry.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO generations"
+            " (key, namespace, prompt, value, size, created_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, namespace, prompt or "", value, len(value.encode("utf-8")), now, now)
+        )
+        # Eviction goes by access time, so pending hits count
+        self.flush_access_times(conn)
+        self._evict(conn)
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute("SELECT key, size FROM generations ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def warm(self, limit: int) -> list:
+        """
+        Returns the most recently used entries for warm-starting in-memory caches.
+
+        Returns:
+            A list of (key, prompt, namespace, value) tuples, most recent first.
+        """
+        conn = self._connect()
+        return conn.execute(
+            "SELECT key, prompt, namespace, value FROM generations"
+            " ORDER BY accessed_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+    def purge(self) -> int:
+        """
+        Removes every entry and returns how many were dropped.
+        """
+        conn = self._connect()
+        count = conn.execute("DELETE FROM generations").rowcount
+        conn.commit()
+        return count
+
+    def stats(self) -> dict:
+        """
+        Returns the stored entry count, total size and this worker's counters.
+        """
+        conn = self._connect()
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations"
+        ).fetchone()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+#======================================
+# Near-duplicate prompt cache (shingling + MinHash + LSH)
+
+# Words that carry no information about the requested UI
+FILLER_WORDS = {
+    "a", "an", "the", "me", "my", "i", "want", "need", "please", "pls",
+    "make", "build", "create", "generate", "give", "show", "can", "you",
+    "could", "would", "for", "of", "to", "some", "simple", "basic",
+    "page", "screen", "app", "ui", "view", "interface", "component", "widget",
+}
+
+# Words that flip or count what is asked for. Shingling barely notices them
+# ("says yes" / "says no", "3 inputs" / "5 inputs"), so prompts are only
+# near-duplicates when they agree on them exactly.
+NEGATION_WORDS = {"no", "not", "without", "never", "none", "nor", "dont", "except", "excluding"}
+NUMBER_WORDS = {
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+    "single", "double", "twice", "triple", "dozen", "hundred",
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def shingle_prompt(prompt: str, k: int = 3) -> set:
+    """
+    Turns a prompt into a set of word and character shingles.
+
+    Filler words are dropped, then every remaining word contributes itself plus
+    its character k-grams (with boundary markers), so small spelling and
+    inflection differences ("form" / "forms") still overlap.
+
+    Args:
+        prompt: The raw user prompt.
+        k: Character shingle length.
+
+    Returns:
+        The set of shingles for the prompt.
+    """
+    words = [w for w in normalize_prompt(prompt).split() if w not in FILLER_WORDS]
+    shingles = set()
+    for word in words:
+        word = "".join(ch for ch in word if ch.isalnum())
+        if not word:
+            continue
+        shingles.add("w:" + word)
+        padded = f"^{word}$"
+        for i in range(max(1, len(padded) - k + 1)):
+            shingles.add("c:" + padded[i:i + k])
+    return shingles
+
+
+def guard_terms(prompt: str) -> frozenset:
+    """
+    Returns the negations and numbers of a prompt, which must match exactly
+    for two prompts to count as near-duplicates.
+    """
+    terms = set()
+    for word in normalize_prompt(prompt).split():
+        word = "".join(ch for ch in word if ch.isalnum())
+        if word in NEGATION_WORDS or word in NUMBER_WORDS or any(ch.isdigit() for ch in word):
+            terms.add(word)
+    return frozenset(terms)
+
+
+def jaccard(a: set, b: set) -> float:
+    """
+    Returns the Jaccard similarity of two sets.
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """
+    Computes fixed-length MinHash signatures from shingle sets.
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        """
+        Args:
+            num_perm: Number of hash permutations (signature length).
+            seed: Seed for the permutation coefficients, fixed for reproducibility.
+        """
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, shingles: set) -> tuple:
+        """
+        Returns the MinHash signature of a shingle set.
+        """
+        if not shingles:
+            return tuple([_MAX_HASH] * self.num_perm)
+
+        base = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+            for s in shingles
+        ]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in base)
+            for a, b in self._params
+        )
+
+
+class SimilarityCache:
+    """
+    Serves stored responses for prompts that are near-duplicates of earlier ones.
+
+    Prompts are indexed by MinHash signatures split into LSH bands; candidates
+    sharing a band bucket are confirmed with the exact Jaccard similarity of
+    their shingle sets. Candidates whose negations or numbers differ (see
+    guard_terms) never match.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = 1024,
+                 num_perm: int = 64, bands: int = 32):
+        """
+        Args:
+            threshold: Minimum Jaccard similarity for a prompt to be served from the cache.
+            max_entries: Maximum number of stored prompts, oldest evicted first.
+            num_perm: MinHash signature length.
+            bands: Number of LSH bands; must divide num_perm.
+        """
+        if num_perm % bands != 0:
+            raise ValueError("bands must divide num_perm.")
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._hasher = MinHasher(num_perm=num_perm)
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _band_keys(self, namespace: str, signature: tuple):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield (namespace, band, signature[start:start + self.rows])
+
+    def lookup(self, prompt: str, namespace: str = ""):
+        """
+        Finds the stored response of the most similar earlier prompt.
+
+        Args:
+            prompt: The raw user prompt.
+            namespace: Scope of the lookup, e.g. template hash and model.
+
+        Returns:
+            A (value, similarity, matched_prompt) tuple, or None when nothing
+            reaches the threshold.
+        """
+        shingles = shingle_prompt(prompt)
+        signature = self._hasher.signature(shingles)
+        guard = guard_terms(prompt)
+
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(namespace, signature):
+                candidates.update(self._buckets.get(band_key, ()))
+
+            best = None
+            for entry_key in candidates:
+                entry = self._entries[entry_key]
+                if entry["guard"] != guard:
+                    continue
+                similarity = jaccard(shingles, entry["shingles"])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (entry_key, similarity)
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entry = self._entries[best[0]]
+            self._entries.move_to_end(best[0])
+            return entry["value"], best[1], entry["prompt"]
+
+    def add(self, prompt: str, value, namespace: str = "") -> None:
+        """
+        Indexes a prompt and the response it produced.
+        """
+        shingles = shingle_prompt(prompt)
+        if not shingles:
+            return
+        signature = self._hasher.signature(shingles)
+        entry_key = (namespace, normalize_prompt(prompt))
+
+        with self._lock:
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            self._entries[entry_key] = {
+                "prompt": prompt,
+                "value": value,
+                "shingles": shingles,
+                "guard": guard_terms(prompt),
+                "signature": signature,
+            }
+            for band_key in self._band_keys(namespace, signature):
+                self._buckets.setdefault(band_key, set()).add(entry_key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_key) -> None:
+        entry = self._entries.pop(entry_key)
+        for band_key in self._band_keys(entry_key[0], entry["signature"]):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def purge(self) -> int:
+        """
+        Removes every entry and returns how many were dropped.
+        """
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._buckets.clear()
+            return count
+
+    def stats(self) -> dict:
+        """
+        Returns the current size, threshold and hit/miss/eviction counters.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Sample prompts grouped by the UI they ask for, used to tune the threshold
+SAMPLE_PROMPT_CORPUS = [
+    ("make a login form", "login"),
+    ("login form please", "login"),
+    ("build me a login page", "login"),
+    ("create a simple login form", "login"),
+    ("login screen", "login"),
+    ("login form with username, password and remember me", "login_remember"),
+    ("make a signup form", "signup"),
+    ("sign up form please", "signup"),
+    ("registration form", "registration"),
+    ("make a calculator", "calculator"),
+    ("calculator please", "calculator"),
+    ("build me a simple calculator app", "calculator"),
+    ("a calculator with add and multiply only", "calculator_add_mul"),
+    ("todo list", "todo"),
+    ("make a todo list app", "todo"),
+    ("create a todo list", "todo"),
+    ("todo list with due dates", "todo_dates"),
+    ("a button that says hi", "button_hi"),
+    ("button that says hi please", "button_hi"),
+    ("button that says hello", "button_hello"),
+    ("make a counter with plus and minus buttons", "counter"),
+    ("counter with plus and minus buttons", "counter"),
+    ("contact form with name email and message", "contact"),
+    ("make a contact form with name, email and message", "contact"),
+    ("comments list with a post form", "comments"),
+    ("comment list with post form", "comments"),
+    # Near-identical wording, different UI
+    ("button that says yes", "button_yes"),
+    ("button that says no", "button_no"),
+    ("login form without remember me", "login_no_remember"),
+    ("login form with remember me", "login_remember"),
+    ("form with 3 inputs", "form_3"),
+    ("form with 5 inputs", "form_5"),
+    ("contact form with name and email", "contact_name_email"),
+    ("contact form with name, email and phone", "contact_phone"),
+]
+
+
+def threshold_report(corpus=None, thresholds=None) -> list:
+    """
+    Scores candidate thresholds on a labelled prompt corpus.
+
+    Every pair of prompts is a positive when both carry the same label. A
+    threshold predicts a positive when the pair's Jaccard similarity reaches
+    it and, as in SimilarityCache, their guard_terms agree.
+
+    Args:
+        corpus: List of (prompt, label) tuples. Defaults to SAMPLE_PROMPT_CORPUS.
+        thresholds: Thresholds to evaluate. Defaults to 0.3 .. 0.9.
+
+    Returns:
+        One dict per threshold with precision, recall, and false positive count.
+    """
+    corpus = corpus or SAMPLE_PROMPT_CORPUS
+    thresholds = thresholds or [0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+    shingled = [(shingle_prompt(prompt), guard_terms(prompt), label) for prompt, label in corpus]
+    pairs = []
+    for i in range(len(shingled)):
+        for j in range(i + 1, len(shingled)):
+            same_guard = shingled[i][1] == shingled[j][1]
+            similarity = jaccard(shingled[i][0], shingled[j][0]) if same_guard else 0.0
+            pairs.append((similarity, shingled[i][2] == shingled[j][2]))
+
+    positives = sum(1 for _, same in pairs if same)
+    report = []
+    for threshold in thresholds:
+        true_pos = sum(1 for sim, same in pairs if sim >= threshold and same)
+        false_pos = sum(1 for sim, same in pairs if sim >= threshold and not same)
+        predicted = true_pos + false_pos
+        report.append({
+            "threshold": threshold,
+            "precision": true_pos / predicted if predicted else 1.0,
+            "recall": true_pos / positives if positives else 0.0,
+            "false_positives": false_pos,
+        })
+    return report
+
+
+if __name__ == "__main__":
+    print("threshold  precision  recall  false_positives")
+    for row in threshold_report():
+        print(f"{row['threshold']:>9.2f}  {row['precision']:>9.2f}  {row['recall']:>6.2f}  {row['false_positives']:>15}")
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class JobQueue:
+    """
+    Durable work queue for generation jobs, stored in a local SQLite file.
+
+    Workers claim a job with a time-limited lease and renew it while they work.
+    A job whose lease runs out (its worker crashed or the process restarted)
+    is handed to the next worker, so queued and running jobs survive restarts.
+    Any number of processes may share the same file.
+
+    A job may carry a deadline (wall-clock expires_at); once it has passed the
+    job is failed instead of being handed to a worker.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_attempts: int = 3):
+        """
+        Opens (and creates if needed) the queue database.
+
+        Args:
+            path: Location of the SQLite file.
+            lease_seconds: How long a claimed job stays with its worker without a renewal.
+            max_attempts: Claims allowed per job before it is marked failed.
+        """
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " prompt TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " expires_at REAL)"
+        )
+        # Queue files created before job deadlines existed
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "expires_at" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN expires_at REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, prompt: str, timeout: float = None) -> str:
+        """
+        Adds a job to the queue and returns its id.
+
+        Args:
+            prompt: The user request to generate.
+            timeout: Optional seconds from now after which the job is no longer wanted.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, prompt, status, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, prompt, self.QUEUED, now, now + timeout if timeout is not None else None)
+        )
+        return job_id
+
+    def get(self, job_id: str):
+        """
+        Returns the public view of a job, or None if the id is unknown.
+        """
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "prompt": row["prompt"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "expires_at": row["expires_at"],
+        }
+
+    def claim(self, worker_id: str):
+        """
+        Leases the oldest runnable job to a worker.
+
+        Runnable means queued, or running with an expired lease. Jobs that have
+        used up max_attempts or are past their deadline are marked failed
+        instead of being handed out.
+
+        Returns:
+            A (job_id, prompt, expires_at) tuple, or None when nothing is runnable.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT id, prompt, attempts, expires_at FROM jobs"
+                    " WHERE status = ? OR (status = ? AND lease_until < ?)"
+                    " ORDER BY created_at LIMIT 1",
+                    (self.QUEUED, self.RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                        (self.FAILED, "Gave up after repeated worker failures", now, row["id"])
+                    )
+                    continue
+                if row["expires_at"] is not None and row["expires_at"] <= now:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                        (self.FAILED, "Deadline passed before a worker could run the job", now, row["id"])
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_until = ?,"
+                    " attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (self.RUNNING, worker_id, now + self.lease_seconds, now, row["id"])
+                )
+                conn.execute("COMMIT")
+                return row["id"], row["prompt"], row["expires_at"]
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def renew(self, job_id: str, worker_id: str) -> None:
+        """
+        Extends the lease of a job the worker is still processing.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+            (time.time() + self.lease_seconds, job_id, worker_id, self.RUNNING)
+        )
+
+    def finish(self, job_id: str, worker_id: str, result: dict, failed: bool = False, error: str = None) -> None:
+        """
+        Stores a job's outcome, unless another worker has taken it over.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL"
+            " WHERE id = ? AND worker = ?",
+            (self.FAILED if failed else self.DONE, json.dumps(result) if result is not None else None,
+             error, time.time(), job_id, worker_id)
+        )
+
+    def release(self, job_id: str, worker_id: str) -> None:
+        """
+        Puts a claimed job back in the queue, e.g. on shutdown, without using up an attempt.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, attempts = attempts - 1"
+            " WHERE id = ? AND worker = ? AND status = ?",
+            (self.QUEUED, job_id, worker_id, self.RUNNING)
+        )
+
+    def stats(self) -> dict:
+        """
+        Returns the number of jobs in each status.
+        """
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {self.QUEUED: 0, self.RUNNING: 0, self.DONE: 0, self.FAILED: 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+
+async def run_worker(queue: JobQueue, handler, worker_id: str, poll_interval: float = 0.5) -> None:
+    """
+    Claims and processes jobs until cancelled.
+
+    Queue calls run on a thread: a claim may wait up to the busy timeout for
+    another process's write lock, which must not stall the event loop.
+
+    Args:
+        queue: The JobQueue to work on.
+        handler: Async callable(prompt, timeout) -> (payload, status_code);
+            timeout is the seconds left until the job's deadline, or None.
+        worker_id: Unique name of this worker, recorded on claimed jobs.
+        poll_interval: Seconds to sleep when the queue is empty.
+    """
+    while True:
+        claimed = await asyncio.to_thread(queue.claim, worker_id)
+        if claimed is None:
+            await asyncio.sleep(poll_interval)
+            continue
+
+        job_id, prompt, expires_at = claimed
+        print(f"[JOBS] {worker_id} started job {job_id}")
+        timeout = expires_at - time.time() if expires_at is not None else None
+        task = asyncio.ensure_future(handler(prompt, timeout))
+        try:
+            # Keep the lease alive for as long as the generation runs
+            while not task.done():
+                await asyncio.wait({task}, timeout=queue.lease_seconds / 3)
+                if not task.done():
+                    await asyncio.to_thread(queue.renew, job_id, worker_id)
+            payload, status_code = task.result()
+            await asyncio.to_thread(
+                queue.finish, job_id, worker_id, payload,
+                failed=status_code >= 400 or payload.get("success") != "true", error=payload.get("error")
+            )
+            print(f"[JOBS] {worker_id} finished job {job_id} with status {status_code}")
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.to_thread(queue.release, job_id, worker_id)
+            raise
+        except Exception as e:
+            print(f"[JOBS] {worker_id} job {job_id} crashed: {e}")
+            await asyncio.to_thread(queue.finish, job_id, worker_id, None, failed=True, error=str(e))
+
+
+def start_workers(queue: JobQueue, handler, count: int, name: str = "worker") -> list:
+    """
+    Starts count worker tasks on the running event loop and returns them.
+    """
+    prefix = f"{name}-{uuid.uuid4().hex[:6]}"
+    return [asyncio.ensure_future(run_worker(queue, handler, f"{prefix}-{i}")) for i in range(count)]
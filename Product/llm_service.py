@@ -1,5 +1,341 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
-from google import genai
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+# google.genai is imported lazily by GeminiService; it is slow to import and
+# not needed by the other backends.
+
+
+# Bounded pool used to run sync-only backends off the event loop.
+SYNC_FALLBACK_WORKERS = int(os.getenv("LLM_SYNC_WORKERS", "8"))
+_sync_executor = None
+
+
+def _get_sync_executor() -> ThreadPoolExecutor:
+    """
+    Returns the shared executor for sync-only backends, creating it on first use.
+    """
+    global _sync_executor
+    if _sync_executor is None:
+        _sync_executor = ThreadPoolExecutor(
+            max_workers=SYNC_FALLBACK_WORKERS,
+            thread_name_prefix="llm-sync"
+        )
+    return _sync_executor
+
+
+# --- Typed Errors ---
+
+class LLMError(Exception):
+    """
+    Base class for failures raised by LLMInterface implementations.
+
+    Attributes:
+        retryable: Whether repeating the identical call may succeed.
+    """
+    retryable = False
+
+
+class RateLimitedError(LLMError):
+    """
+    The provider rejected the call because a quota was exhausted (HTTP 429).
+
+    Attributes:
+        retry_after: Seconds the provider asked us to wait, when known.
+    """
+    retryable = True
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeoutError(LLMError):
+    """
+    The call did not complete within its time limit.
+    """
+    retryable = True
+
+
+class LLMServerError(LLMError):
+    """
+    The provider failed (HTTP 5xx) or could not be reached.
+    """
+    retryable = True
+
+
+class RateLimitQueueTimeout(RateLimitedError):
+    """
+    A call waited longer than allowed in the local rate-limit queue.
+
+    Retrying immediately would only rejoin the same queue, so it is not retryable.
+    """
+    retryable = False
+
+
+class KeysCoolingDownError(RateLimitedError):
+    """
+    Every usable API key is cooling down after a 429, so the call was not sent.
+
+    The 429s themselves already counted against the upstream; this one is local.
+    """
+
+
+class InvalidRequestError(LLMError):
+    """
+    The provider rejected the request itself (HTTP 4xx other than 429).
+    """
+    retryable = False
+
+
+class CircuitOpenError(LLMError):
+    """
+    The circuit breaker is open and the call was not attempted.
+    """
+    retryable = False
+
+
+class DeadlineExceededError(LLMTimeoutError):
+    """
+    The request's deadline passed before the call could complete.
+
+    Nobody is waiting for the answer any more, so it is not retryable and
+    does not count against the health of the upstream.
+    """
+    retryable = False
+
+
+def translate_error(error: Exception) -> LLMError:
+    """
+    Maps SDK, HTTP and network exceptions onto the typed LLMError hierarchy.
+
+    Args:
+        error: The exception raised by the underlying client.
+
+    Returns:
+        The matching LLMError, chained to the original exception.
+    """
+    if isinstance(error, LLMError):
+        return error
+
+    message = str(error) or type(error).__name__
+    # Only loaded if a GeminiService exists, in which case it is already imported
+    genai_errors = sys.modules.get("google.genai.errors")
+    if genai_errors is not None and isinstance(error, genai_errors.APIError):
+        code = error.code or 0
+        if code == 429:
+            typed = RateLimitedError(message)
+        elif code in (408, 504):
+            typed = LLMTimeoutError(message)
+        elif code >= 500:
+            typed = LLMServerError(message)
+        else:
+            typed = InvalidRequestError(message)
+    elif isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "timeout" in type(error).__name__.lower():
+        typed = LLMTimeoutError(message)
+    elif isinstance(error, (ConnectionError, OSError)) or "connect" in type(error).__name__.lower():
+        typed = LLMServerError(message)
+    else:
+        typed = LLMError(message)
+    if type(typed) is LLMTimeoutError and deadline_passed():
+        # The per-call timeout was cut short by the request deadline
+        typed = DeadlineExceededError(message)
+    typed.__cause__ = error
+    return typed
+
+
+# --- Request Deadlines ---
+
+# Absolute time.monotonic() deadline of the request being served, if any.
+# Context variables follow asyncio tasks and anyio worker threads, so every
+# LLM call made on behalf of a request sees its deadline without an argument.
+_request_deadline = contextvars.ContextVar("llm_request_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """
+    Sets the deadline of every LLM call made inside the block, including
+    tasks started from it. A nested scope can only shorten the deadline.
+
+    Args:
+        seconds: Time allowed from now; None leaves the current deadline as is.
+    """
+    if seconds is None:
+        yield _request_deadline.get()
+        return
+    deadline = time.monotonic() + seconds
+    current = _request_deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _request_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _request_deadline.reset(token)
+
+
+def time_remaining():
+    """
+    Seconds left until the current request deadline, or None without one.
+    """
+    deadline = _request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_passed() -> bool:
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def check_deadline(what: str = "LLM call") -> None:
+    """
+    Raises DeadlineExceededError when the request deadline has passed, so
+    queued work is dropped instead of started.
+    """
+    if deadline_passed():
+        raise DeadlineExceededError(f"Request deadline passed before the {what} started.")
+
+
+def clip_to_deadline(delay: float):
+    """
+    For simulated backends: the part of a delay that fits before the request
+    deadline, and whether the deadline cut it short (the backend should then
+    fail the way a real per-call timeout would).
+
+    Returns:
+        (seconds to wait, cut_short)
+    """
+    remaining = time_remaining()
+    if remaining is not None and delay > remaining:
+        return max(0.0, remaining), True
+    return delay, False
+
+
+# --- Per-Call Response Format ---
+
+_free_text = contextvars.ContextVar("llm_free_text", default=False)
+
+
+@contextmanager
+def free_text_scope():
+    """
+    Calls made inside the block ask for plain text even from backends built
+    with a response schema. A continuation of a cut-off JSON answer needs
+    this, since the schema would make the model start a new object.
+    """
+    token = _free_text.set(True)
+    try:
+        yield
+    finally:
+        _free_text.reset(token)
+
+
+def free_text_requested() -> bool:
+    return _free_text.get()
+
+
+_schema_override = contextvars.ContextVar("llm_response_schema", default=None)
+
+
+@contextmanager
+def response_schema_scope(schema: dict):
+    """
+    Calls made inside the block ask backends built with a response schema for
+    this one instead, e.g. a packed prompt whose answer holds several results.
+    free_text_scope still takes precedence.
+    """
+    token = _schema_override.set(schema)
+    try:
+        yield
+    finally:
+        _schema_override.reset(token)
+
+
+def requested_response_schema(default: dict) -> dict:
+    """
+    The schema a backend built with default should ask for in this context.
+    """
+    return _schema_override.get() or default
+
+
+# --- Result Type ---
+
+class LLMResponse(str):
+    """
+    Generated text plus the usage metadata of the call that produced it.
+
+    A str subclass, so code that only needs the text keeps working unchanged.
+    Token counts are None when the backend does not report them; latency is
+    the backend call time in seconds.
+    """
+
+    FIELDS = ("model", "prompt_tokens", "output_tokens", "thinking_tokens",
+              "cached_tokens", "latency", "finish_reason")
+
+    def __new__(cls, text: str, model: str = None, prompt_tokens: int = None,
+                output_tokens: int = None, thinking_tokens: int = None,
+                cached_tokens: int = None, latency: float = None, finish_reason: str = None):
+        response = super().__new__(cls, text or "")
+        response.model = model
+        response.prompt_tokens = prompt_tokens
+        response.output_tokens = output_tokens
+        response.thinking_tokens = thinking_tokens
+        response.cached_tokens = cached_tokens
+        response.latency = latency
+        response.finish_reason = finish_reason
+        return response
+
+    @property
+    def text(self) -> str:
+        return str.__str__(self)
+
+    def usage(self) -> dict:
+        """
+        Returns the metadata fields as a dict (the LLMResponse kwargs).
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def share(self, text: str, parts: int) -> "LLMResponse":
+        """
+        A response for one of `parts` answers produced by this single call,
+        carrying an equal share of its token counts.
+        """
+        usage = self.usage()
+        for field in ("prompt_tokens", "output_tokens", "thinking_tokens", "cached_tokens"):
+            if usage[field] is not None:
+                usage[field] = usage[field] // parts
+        return LLMResponse(text, **usage)
+
+    @classmethod
+    def combine(cls, text: str, parts, concurrent: bool = False) -> str:
+        """
+        A response for text produced by several calls (an answer and its
+        continuations), carrying their summed usage and the last finish reason.
+        Plain str parts carry no usage and are skipped. For concurrent calls
+        the latency is the slowest call's rather than the sum.
+        """
+        parts = [part for part in parts if isinstance(part, LLMResponse)]
+        if not parts:
+            return text
+        usage = parts[-1].usage()
+        for field in ("prompt_tokens", "output_tokens", "thinking_tokens", "cached_tokens", "latency"):
+            values = [getattr(part, field) for part in parts if getattr(part, field) is not None]
+            total = max if concurrent and field == "latency" else sum
+            usage[field] = total(values) if values else None
+        return cls(text, **usage)
 
 
 # --- Abstract Base Class (The Interface) ---
@@ -7,72 +343,2082 @@ from google import genai
 class LLMInterface(ABC):
     """
     Abstract base class defining the required interface for all LLM services.
+
+    Every call takes an optional system_prompt: the static instruction block,
+    sent ahead of the variable user prompt so providers can cache it.
+    Backends that know their usage return an LLMResponse instead of a bare str.
     """
 
     @abstractmethod
-    def get_response(self, prompt: str) -> str:
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
         """
         Generates a text response from the LLM based on the input prompt.
 
         Args:
             prompt: The string input/question for the LLM.
+            system_prompt: Optional static instructions placed before the prompt.
+
+        Returns:
+            A string containing only the generated text response.
+        """
+        pass
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Async variant of get_response.
+
+        Backends with a native async client should override this. The default
+        runs get_response on a bounded thread pool so sync-only backends never
+        block the event loop.
+
+        Args:
+            prompt: The string input/question for the LLM.
+            system_prompt: Optional static instructions placed before the prompt.
 
         Returns:
             A string containing only the generated text response.
         """
+        loop = asyncio.get_running_loop()
+        # Executor threads do not inherit the caller's context (and its deadline) by themselves
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            _get_sync_executor(),
+            functools.partial(context.run, self._queued_get_response, prompt, system_prompt)
+        )
+
+    def _queued_get_response(self, prompt: str, system_prompt: str = None) -> str:
+        # The pool may be backed up; a call whose deadline passed meanwhile is dropped
+        check_deadline("queued LLM call")
+        return self.get_response(prompt, system_prompt=system_prompt)
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Yields the generated text in chunks as the LLM produces them.
+
+        Backends that support streaming should override this. The default
+        yields the full get_response result as a single chunk. Backends that
+        report usage end the stream with an empty LLMResponse carrying it.
+
+        Args:
+            prompt: The string input/question for the LLM.
+            system_prompt: Optional static instructions placed before the prompt.
+
+        Yields:
+            Consecutive text chunks of the generated response.
+        """
+        yield self.get_response(prompt, system_prompt=system_prompt)
+
+
+# --- Outbound Rate Limiting ---
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for quota accounting (about four characters per token).
+    """
+    return max(1, len(text or "") // 4)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and tokens per minute.
+
+    Callers queue in strict arrival order, so a large request at the head is
+    never starved by small ones behind it. A caller that would wait longer
+    than max_wait gives up with RateLimitQueueTimeout instead of being
+    rejected upstream, and one that would outlive its request deadline gives
+    up with DeadlineExceededError. Works from both threads and coroutines.
+    """
+
+    def __init__(self, rpm: float = None, tpm: float = None, max_wait: float = 60.0,
+                 expected_output_tokens: int = 0):
+        """
+        Args:
+            rpm: Requests per minute allowed, or None for no request limit.
+            tpm: Tokens per minute allowed, or None for no token limit.
+            max_wait: Longest a caller may queue, in seconds.
+            expected_output_tokens: Output tokens added to every estimate.
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_wait = max_wait
+        self.expected_output_tokens = expected_output_tokens
+        self._requests = float(rpm) if rpm else 0.0
+        self._tokens = float(tpm) if tpm else 0.0
+        self._updated = time.monotonic()
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._waits = deque(maxlen=500)
+        self.acquired = 0
+        self.timed_out = 0
+        self.expired = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(float(self.rpm), self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60.0)
+
+    def _cost(self, tokens: int) -> int:
+        tokens += self.expected_output_tokens
+        # A request bigger than the whole bucket could never run otherwise
+        return min(tokens, int(self.tpm)) if self.tpm else tokens
+
+    def _try_take(self, ticket, tokens: int) -> float:
+        """
+        Takes capacity for ticket if it is at the head of the queue.
+
+        Must be called with the condition held. Returns 0 on success, otherwise
+        the number of seconds until the head could proceed.
+        """
+        self._refill()
+        if self._queue[0] is not ticket:
+            return 0.05
+        waits = [0.0]
+        if self.rpm and self._requests < 1:
+            waits.append((1 - self._requests) * 60.0 / self.rpm)
+        if self.tpm and self._tokens < tokens:
+            waits.append((tokens - self._tokens) * 60.0 / self.tpm)
+        wait = max(waits)
+        if wait > 0:
+            return wait
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+        self._queue.popleft()
+        return 0.0
+
+    def _enqueue(self):
+        ticket = object()
+        self._queue.append(ticket)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        return ticket
+
+    def _done(self, waited: float) -> None:
+        self.acquired += 1
+        self.total_wait += waited
+        self._waits.append(waited)
+        self._cond.notify_all()
+
+    def _limit(self, max_wait: float):
+        """
+        Returns (longest wait allowed, whether the request deadline set it).
+        """
+        limit = self.max_wait if max_wait is None else max_wait
+        remaining = time_remaining()
+        if remaining is not None and remaining < limit:
+            return max(0.0, remaining), True
+        return limit, False
+
+    def _give_up(self, ticket, waited: float, by_deadline: bool = False):
+        self._queue.remove(ticket)
+        self.timed_out += 1
+        self._cond.notify_all()
+        if by_deadline:
+            self.expired += 1
+            return DeadlineExceededError(
+                f"Request deadline passed after {waited:.1f}s in the LLM rate-limit queue."
+            )
+        return RateLimitQueueTimeout(
+            f"Waited {waited:.1f}s in the LLM rate-limit queue (max_wait={self.max_wait}s)."
+        )
+
+    def acquire(self, tokens: int = 1, max_wait: float = None) -> float:
+        """
+        Blocks until one request and the given tokens fit in the quota.
+
+        Args:
+            tokens: Estimated input tokens of the call.
+            max_wait: Overrides the limiter's max_wait for this call.
+
+        Returns:
+            Seconds spent waiting.
+
+        Raises:
+            RateLimitQueueTimeout: The wait would exceed max_wait.
+            DeadlineExceededError: The wait would outlive the request deadline.
+        """
+        if not self.rpm and not self.tpm:
+            return 0.0
+        tokens = self._cost(tokens)
+        limit, by_deadline = self._limit(max_wait)
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue()
+            while True:
+                wait = self._try_take(ticket, tokens)
+                waited = time.monotonic() - start
+                if wait == 0:
+                    self._done(waited)
+                    return waited
+                if waited + wait > limit and self._queue[0] is ticket:
+                    raise self._give_up(ticket, waited, by_deadline)
+                if waited >= limit:
+                    raise self._give_up(ticket, waited, by_deadline)
+                self._cond.wait(min(wait, limit - waited))
+
+    async def aacquire(self, tokens: int = 1, max_wait: float = None) -> float:
+        """
+        Async variant of acquire; queues in the same order as sync callers.
+        """
+        if not self.rpm and not self.tpm:
+            return 0.0
+        tokens = self._cost(tokens)
+        limit, by_deadline = self._limit(max_wait)
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue()
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket, tokens)
+                    waited = time.monotonic() - start
+                    if wait == 0:
+                        self._done(waited)
+                        return waited
+                    if (waited + wait > limit and self._queue[0] is ticket) or waited >= limit:
+                        raise self._give_up(ticket, waited, by_deadline)
+                await asyncio.sleep(min(wait, limit - waited))
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+    def record_usage(self, estimated: int, actual: int) -> None:
+        """
+        Corrects the token bucket once a call reports its real token usage.
+        """
+        if not self.tpm or actual is None:
+            return
+        with self._cond:
+            self._refill()
+            self._tokens = min(float(self.tpm), self._tokens - (actual - self._cost(estimated)))
+
+    def stats(self) -> dict:
+        """
+        Returns queue depth, wait-time and remaining-capacity metrics.
+        """
+        with self._cond:
+            self._refill()
+            waits = sorted(self._waits)
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "acquired": self.acquired,
+                "timed_out": self.timed_out,
+                "expired": self.expired,
+                "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+                "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "max_wait_seen": waits[-1] if waits else 0.0,
+                "requests_available": self._requests if self.rpm else None,
+                "tokens_available": self._tokens if self.tpm else None,
+            }
+
+
+# --- Context (Prefix) Caching ---
+
+class ContextCache(ABC):
+    """
+    Registers a static prompt prefix with the provider once and reuses it.
+
+    get() returns a handle for the prefix, creating it on first use and
+    extending its lifetime when it is within refresh_margin of expiring, so
+    every call can reference the cached prefix instead of resending it.
+    When registration fails (unsupported model, prefix too small, ...) get()
+    returns None for retry_seconds and callers send the prefix inline.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0, refresh_margin: float = 300.0,
+                 retry_seconds: float = 300.0):
+        """
+        Args:
+            ttl_seconds: Lifetime requested for a registered prefix.
+            refresh_margin: Refresh a prefix once it has less than this many seconds left.
+            retry_seconds: How long to send prefixes inline after a failed registration.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.retry_seconds = retry_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._disabled_until = 0.0
+        self.hits = 0
+        self.registrations = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    @abstractmethod
+    def _create(self, prefix: str, ttl_seconds: float) -> str:
+        """
+        Registers the prefix with the provider and returns its handle.
+        """
+        pass
+
+    @abstractmethod
+    def _refresh(self, handle: str, ttl_seconds: float) -> None:
+        """
+        Extends the lifetime of a registered prefix.
+        """
         pass
 
+    @staticmethod
+    def _key(prefix: str) -> str:
+        return hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    def _fresh(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires_at"] - now > self.refresh_margin:
+            return entry["handle"]
+        return None
+
+    def get(self, prefix: str):
+        """
+        Returns the handle of the registered prefix, or None to send it inline.
+        """
+        key = self._key(prefix)
+        # Held across the provider call so concurrent callers register a prefix only once
+        with self._lock:
+            now = time.monotonic()
+            handle = self._fresh(key, now)
+            if handle is not None:
+                self.hits += 1
+                return handle
+            if now < self._disabled_until:
+                return None
+
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry["expires_at"] > now:
+                try:
+                    self._refresh(entry["handle"], self.ttl_seconds)
+                    self.refreshes += 1
+                except Exception as e:
+                    print(f"[CONTEXT] refresh of {entry['handle']} failed, registering again: {e}")
+                    entry = None
+            else:
+                entry = None
+            if entry is None:
+                try:
+                    entry = {"handle": self._create(prefix, self.ttl_seconds)}
+                    self.registrations += 1
+                except Exception as e:
+                    self.failures += 1
+                    self._disabled_until = now + self.retry_seconds
+                    print(f"[CONTEXT] prefix cache unavailable, sending it inline: {e}")
+                    return None
+            entry["expires_at"] = now + self.ttl_seconds
+            self._entries[key] = entry
+            return entry["handle"]
+
+    async def aget(self, prefix: str):
+        """
+        Async variant of get(); provider calls run off the event loop.
+        """
+        with self._lock:
+            handle = self._fresh(self._key(prefix), time.monotonic())
+            if handle is not None:
+                self.hits += 1
+                return handle
+        return await asyncio.to_thread(self.get, prefix)
+
+    def invalidate(self, prefix: str) -> None:
+        """
+        Forgets a prefix whose handle the provider no longer accepts.
+        """
+        with self._lock:
+            self._entries.pop(self._key(prefix), None)
+
+    def stats(self) -> dict:
+        """
+        Returns registration, refresh and reuse counters.
+        """
+        with self._lock:
+            return {
+                "prefixes": len(self._entries),
+                "hits": self.hits,
+                "registrations": self.registrations,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+            }
+
+
+class GeminiContextCache(ContextCache):
+    """
+    ContextCache backed by Gemini explicit context caching (client.caches).
+    """
+
+    def __init__(self, client, model_name: str, **kwargs):
+        """
+        Args:
+            client: The genai.Client the prefix is registered with.
+            model_name: Cached content is tied to one model.
+            **kwargs: ttl_seconds, refresh_margin and retry_seconds of ContextCache.
+        """
+        super().__init__(**kwargs)
+        self.client = client
+        self.model_name = model_name
+
+    def _create(self, prefix: str, ttl_seconds: float) -> str:
+        from google.genai import types as genai_types
+        cached = self.client.caches.create(
+            model=self.model_name,
+            config=genai_types.CreateCachedContentConfig(
+                system_instruction=prefix,
+                ttl=f"{int(ttl_seconds)}s",
+                display_name="flexiframe-prompt-prefix"
+            )
+        )
+        return cached.name
+
+    def _refresh(self, handle: str, ttl_seconds: float) -> None:
+        from google.genai import types as genai_types
+        self.client.caches.update(
+            name=handle,
+            config=genai_types.UpdateCachedContentConfig(ttl=f"{int(ttl_seconds)}s")
+        )
+
+
+class LocalContextCache(ContextCache):
+    """
+    In-process stand-in for a provider context cache, for tests and simulators.
+
+    Handles are local names; registered prefixes are kept in `prefixes`.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prefixes = {}
+
+    def _create(self, prefix: str, ttl_seconds: float) -> str:
+        # Never reuse a handle, even for a prefix registered again after it was dropped
+        handle = f"local-context/{self.registrations + 1}"
+        self.prefixes[handle] = prefix
+        return handle
+
+    def _refresh(self, handle: str, ttl_seconds: float) -> None:
+        if handle not in self.prefixes:
+            raise KeyError(handle)
+
+
 # --- Concrete Implementation (Gemini API) ---
 
+class _KeySlot:
+    """
+    One API key of a GeminiService pool: its client, quota limiter and health.
+    """
+
+    def __init__(self, index: int, client, rate_limiter: RateLimiter = None,
+                 context_cache: ContextCache = None):
+        self.index = index
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.context_cache = context_cache
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.healthy = True
+        self.cooldown_until = 0.0
+        self.cooldowns = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    def headroom(self) -> float:
+        """
+        Fraction (0-1) of this key's quota currently available.
+        """
+        if self.rate_limiter is None:
+            return 1.0
+        stats = self.rate_limiter.stats()
+        fractions = [1.0]
+        if stats["rpm"]:
+            fractions.append(stats["requests_available"] / stats["rpm"])
+        if stats["tpm"]:
+            fractions.append(stats["tokens_available"] / stats["tpm"])
+        # Queued callers will consume capacity before a new one gets any
+        return min(fractions) / (1 + stats["queue_depth"])
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "key": self.index,
+            "healthy": self.healthy,
+            "cooling_down_for": max(0.0, self.cooldown_until - now),
+            "cooldowns": self.cooldowns,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "headroom": self.headroom(),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "rate_limiter": self.rate_limiter.stats() if self.rate_limiter else None,
+            "context_cache": self.context_cache.stats() if self.context_cache else None,
+        }
+
+
 class GeminiService(LLMInterface):
     """
     Concrete implementation of LLMInterface using the Google GenAI SDK (Gemini API).
+
+    Accepts a pool of API keys. Every key has its own client, quota limiter
+    and health state, and each call goes to the healthy key with the most
+    quota headroom. A key that gets rate limited cools down automatically.
+
+    A system_prompt is registered once per key as cached content and every
+    call references it, so the static prefix is neither resent nor billed
+    at the full input rate.
     """
 
-    def __init__(self, api_key: str, model_name: str = 'gemini-2.5-pro'):
+    def __init__(self, api_key, model_name: str = 'gemini-2.5-pro', timeout: float = None,
+                 rate_limiter=None, cooldown_seconds: float = 30.0, check_api_key: bool = True,
+                 context_cache: bool = True, context_cache_ttl: float = 3600.0,
+                 thinking_budget: int = None, max_output_tokens: int = None, temperature: float = None,
+                 response_schema: dict = None):
         """
-        Initializes the Gemini client.
+        Initializes one Gemini client per API key.
 
         Args:
-            api_key: Your Google AI API key.
+            api_key: Your Google AI API key, or a list of keys to pool.
             model_name: The specific Gemini model to use.
+            timeout: Optional per-request HTTP timeout in seconds.
+            rate_limiter: Optional RateLimiter every call queues through first,
+                shared by all keys; or a zero-argument factory giving each key
+                its own limiter.
+            cooldown_seconds: How long a rate-limited key is skipped when the
+                provider gives no retry hint.
+            check_api_key: Validate the keys on a background thread after startup.
+            context_cache: Register system prompts as Gemini cached content;
+                when False they are sent inline with every call.
+            context_cache_ttl: Lifetime of a registered system prompt in seconds;
+                it is refreshed before it expires.
+            thinking_budget: Thinking tokens allowed per call (0 disables thinking
+                on models that allow it); None keeps the model default.
+            max_output_tokens: Output token limit per call; None keeps the model default.
+            temperature: Sampling temperature; None keeps the model default.
+            response_schema: Optional JSON Schema the response must follow; the
+                call then asks for application/json (structured output). It is
+                dropped if the model rejects it.
         """
-        if not api_key:
+        from google import genai
+        from google.genai import types as genai_types
+
+        api_keys = [api_key] if isinstance(api_key, str) else list(api_key or [])
+        if not api_keys or not all(api_keys):
             raise ValueError("API key cannot be empty.")
         
-        # Configure the client using the provided API key
-        self.client = genai.Client(api_key=api_key)
+        # Configure one client per provided API key
+        http_options = genai_types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None
+        self._slots = []
+        for index, key in enumerate(api_keys):
+            limiter = rate_limiter() if callable(rate_limiter) else rate_limiter
+            client = genai.Client(api_key=key, http_options=http_options)
+            # Cached content belongs to the key's project, so every key registers its own
+            prefix_cache = GeminiContextCache(
+                client, model_name, ttl_seconds=context_cache_ttl
+            ) if context_cache else None
+            self._slots.append(_KeySlot(index, client, limiter, prefix_cache))
+        self._types = genai_types
+        self.client = self._slots[0].client
         self.model_name = model_name
-        self._check_api_key()
+        self.timeout = timeout
+        self.thinking_budget = thinking_budget
+        self.max_output_tokens = max_output_tokens
+        self.temperature = temperature
+        self.response_schema = response_schema
+        self.structured_output = response_schema is not None
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        if check_api_key:
+            # Listing models is a blocking network call; never hold up startup for it
+            threading.Thread(target=self._check_api_key, name="gemini-key-check", daemon=True).start()
 
     def _check_api_key(self):
         """
         Attempts a small call to verify the API key is valid, but prints a non-blocking warning on failure.
         """
-        try:
-            # Simple list operation to verify connection and key
-            list(self.client.models.list())
-        except Exception as e:
-            # Catch other potential errors (e.g., network)
-            print(f"Warning: An unexpected error occurred during API key check: {e}")
+        for slot in self._slots:
+            try:
+                # Simple list operation to verify connection and key
+                list(slot.client.models.list())
+            except Exception as e:
+                # Catch other potential errors (e.g., network)
+                print(f"Warning: An unexpected error occurred during API key check for key #{slot.index}: {e}")
 
-    def get_response(self, prompt: str) -> str:
+    def _pick_slot(self) -> _KeySlot:
         """
-        Overrides the abstract method to call the Gemini API and return only text.
+        Chooses the key for the next call and marks it in flight.
 
-        Args:
-            prompt: The string input/question for the LLM.
+        Raises:
+            KeysCoolingDownError: Every usable key is cooling down.
+        """
+        with self._lock:
+            now = time.monotonic()
+            usable = [slot for slot in self._slots if slot.healthy] or self._slots
+            ready = [slot for slot in usable if slot.cooldown_until <= now]
+            if not ready:
+                retry_after = min(slot.cooldown_until for slot in usable) - now
+                raise KeysCoolingDownError(
+                    f"All {len(usable)} API keys are cooling down.", retry_after=retry_after
+                )
+            slot = max(ready, key=lambda slot: (slot.headroom(), -slot.in_flight))
+            slot.in_flight += 1
+            slot.requests += 1
+            return slot
+
+    def _release_slot(self, slot: _KeySlot, error: LLMError = None) -> None:
+        """
+        Updates key health from the outcome of a call.
+        """
+        with self._lock:
+            slot.in_flight -= 1
+            if error is None:
+                return
+            slot.errors += 1
+            if isinstance(error, RateLimitedError) and not isinstance(error, RateLimitQueueTimeout):
+                cooldown = error.retry_after or self.cooldown_seconds
+                slot.cooldown_until = time.monotonic() + cooldown
+                slot.cooldowns += 1
+                print(f"[GEMINI] key #{slot.index} rate limited; cooling down for {cooldown:.1f}s")
+            elif getattr(error.__cause__, "code", None) in (401, 403):
+                slot.healthy = False
+                print(f"[GEMINI] key #{slot.index} rejected by the API; removed from the pool")
+
+    def _record_usage(self, slot: _KeySlot, estimated: int, response) -> None:
+        """
+        Feeds the real token count of a response back into the key's rate limiter.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        with self._lock:
+            slot.prompt_tokens += getattr(usage, "prompt_token_count", None) or 0
+            slot.cached_tokens += getattr(usage, "cached_content_token_count", None) or 0
+        if slot.rate_limiter:
+            slot.rate_limiter.record_usage(estimated, usage.total_token_count)
+
+    def _result(self, text: str, response, latency: float) -> LLMResponse:
+        """
+        Wraps text with the token counts and finish reason of a Gemini response.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        candidates = getattr(response, "candidates", None) or []
+        finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+        return LLMResponse(
+            text,
+            model=self.model_name,
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            output_tokens=getattr(usage, "candidates_token_count", None),
+            thinking_tokens=getattr(usage, "thoughts_token_count", None),
+            cached_tokens=getattr(usage, "cached_content_token_count", None),
+            latency=latency,
+            finish_reason=getattr(finish_reason, "name", finish_reason)
+        )
+
+    def _config(self, system_prompt: str, handle: str):
+        """
+        Generation config with the service's generation settings, referencing
+        the cached prefix or carrying it inline. None when nothing is set.
+        """
+        options = {}
+        remaining = time_remaining()
+        if remaining is not None:
+            # The HTTP call may not outlive the request deadline, nor the configured timeout
+            seconds = remaining if self.timeout is None else min(self.timeout, remaining)
+            options["http_options"] = self._types.HttpOptions(timeout=max(1, int(seconds * 1000)))
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        if self.max_output_tokens is not None:
+            options["max_output_tokens"] = self.max_output_tokens
+        if self.thinking_budget is not None:
+            options["thinking_config"] = self._types.ThinkingConfig(thinking_budget=self.thinking_budget)
+        if self.structured_output and not free_text_requested():
+            options["response_mime_type"] = "application/json"
+            options["response_json_schema"] = requested_response_schema(self.response_schema)
+        if handle:
+            options["cached_content"] = handle
+        elif system_prompt:
+            options["system_instruction"] = system_prompt
+        return self._types.GenerateContentConfig(**options) if options else None
+
+    def _stale_prefix(self, slot: _KeySlot, system_prompt: str, handle: str, error: Exception) -> bool:
+        """
+        True when a call failed because the provider dropped the cached prefix;
+        the prefix is forgotten so the call can be repeated inline.
+        """
+        if handle is None or not isinstance(translate_error(error), InvalidRequestError):
+            return False
+        print(f"[GEMINI] cached prefix {handle} rejected on key #{slot.index}; sending it inline")
+        slot.context_cache.invalidate(system_prompt)
+        return True
+
+    def _schema_rejected(self, error: Exception) -> bool:
+        """
+        True when the model refused the response schema; structured output is
+        turned off so the call can be repeated as plain text.
+        """
+        if not self.structured_output or not isinstance(translate_error(error), InvalidRequestError):
+            return False
+        message = str(error).lower()
+        if "schema" not in message and "mime" not in message:
+            return False
+        print(f"[GEMINI] {self.model_name} rejected the response schema; falling back to plain text")
+        self.structured_output = False
+        return True
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Overrides the abstract method to call the Gemini API and return only text.
+
+        Args:
+            prompt: The string input/question for the LLM.
+            system_prompt: Optional static instructions, served from the context cache.
 
         Returns:
-            A string containing only the generated text response.
+            An LLMResponse: the generated text with its token counts and finish reason.
+
+        Raises:
+            LLMError: A typed subclass describing why the call failed.
         """
+        tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt or "")
+        slot = self._pick_slot()
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt
-            )
-            # Return only the text part of the response object
-            return response.text
+            if slot.rate_limiter:
+                slot.rate_limiter.acquire(tokens)
+            check_deadline()
+            handle = slot.context_cache.get(system_prompt) if system_prompt and slot.context_cache else None
+            start = time.monotonic()
+            while True:
+                try:
+                    response = slot.client.models.generate_content(
+                        model=self.model_name,
+                        contents=prompt,
+                        config=self._config(system_prompt, handle)
+                    )
+                    break
+                except Exception as e:
+                    # Each fallback fires at most once, so this ends after three calls
+                    if self._stale_prefix(slot, system_prompt, handle, e):
+                        handle = None
+                    elif not self._schema_rejected(e):
+                        raise
+        except Exception as e:
+            error = translate_error(e)
+            self._release_slot(slot, error)
+            raise error
+        self._release_slot(slot)
+        self._record_usage(slot, tokens, response)
+        # Return only the text part of the response object, with its usage
+        return self._result(response.text, response, time.monotonic() - start)
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Overrides the async method to call the Gemini API through the SDK's
+        native async client.
+
+        Args:
+            prompt: The string input/question for the LLM.
+            system_prompt: Optional static instructions, served from the context cache.
+
+        Returns:
+            An LLMResponse: the generated text with its token counts and finish reason.
+
+        Raises:
+            LLMError: A typed subclass describing why the call failed.
+        """
+        tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt or "")
+        slot = self._pick_slot()
+        try:
+            if slot.rate_limiter:
+                await slot.rate_limiter.aacquire(tokens)
+            check_deadline()
+            handle = await slot.context_cache.aget(system_prompt) if system_prompt and slot.context_cache else None
+            start = time.monotonic()
+            while True:
+                try:
+                    response = await slot.client.aio.models.generate_content(
+                        model=self.model_name,
+                        contents=prompt,
+                        config=self._config(system_prompt, handle)
+                    )
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if self._stale_prefix(slot, system_prompt, handle, e):
+                        handle = None
+                    elif not self._schema_rejected(e):
+                        raise
+        except asyncio.CancelledError:
+            self._release_slot(slot)
+            raise
+        except Exception as e:
+            error = translate_error(e)
+            self._release_slot(slot, error)
+            raise error
+        self._release_slot(slot)
+        self._record_usage(slot, tokens, response)
+        return self._result(response.text, response, time.monotonic() - start)
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Overrides the streaming method to forward Gemini chunks as they arrive.
+
+        Args:
+            prompt: The string input/question for the LLM.
+            system_prompt: Optional static instructions, served from the context cache.
+
+        Yields:
+            Consecutive text chunks of the generated response, then an empty
+            LLMResponse carrying the usage of the whole stream.
+
+        Raises:
+            LLMError: A typed subclass describing why the call failed.
+        """
+        tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt or "")
+        slot = self._pick_slot()
+        last_chunk = None
+        try:
+            if slot.rate_limiter:
+                slot.rate_limiter.acquire(tokens)
+            check_deadline()
+            handle = slot.context_cache.get(system_prompt) if system_prompt and slot.context_cache else None
+            start = time.monotonic()
+            while True:
+                try:
+                    for chunk in slot.client.models.generate_content_stream(
+                        model=self.model_name,
+                        contents=prompt,
+                        config=self._config(system_prompt, handle)
+                    ):
+                        last_chunk = chunk
+                        # Some chunks only carry metadata and have no text
+                        if chunk.text:
+                            yield chunk.text
+                    break
+                except Exception as e:
+                    # A dropped prefix or refused schema fails before any chunk, so the call can be repeated
+                    if last_chunk is not None:
+                        raise
+                    if self._stale_prefix(slot, system_prompt, handle, e):
+                        handle = None
+                    elif not self._schema_rejected(e):
+                        raise
+        except GeneratorExit:
+            self._release_slot(slot)
+            raise
+        except Exception as e:
+            error = translate_error(e)
+            self._release_slot(slot, error)
+            raise error
+        self._release_slot(slot)
+        # The final chunk carries the usage totals
+        self._record_usage(slot, tokens, last_chunk)
+        yield self._result("", last_chunk, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        """
+        Returns the model name and per-key health and quota metrics.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "model": self.model_name,
+                "generation": {
+                    "thinking_budget": self.thinking_budget,
+                    "max_output_tokens": self.max_output_tokens,
+                    "temperature": self.temperature,
+                    "structured_output": self.structured_output,
+                },
+                "keys": [slot.snapshot(now) for slot in self._slots],
+            }
+
+
+# --- Latency-Aware Router ---
+
+class _BackendState:
+    """
+    Live health and latency statistics for one RouterService backend.
+    """
+
+    def __init__(self, name: str, backend: LLMInterface):
+        self.name = name
+        self.backend = backend
+        self.ewma_latency = None
+        self.ewma_error = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.samples = 0
+        self.ejected = False
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.probing = False
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "name": self.name,
+            "healthy": not self.ejected,
+            "ejected_for": max(0.0, self.ejected_until - now) if self.ejected else 0.0,
+            "ewma_latency": self.ewma_latency,
+            "ewma_error": self.ewma_error,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+        }
+
+
+class RouterService(LLMInterface):
+    """
+    LLMInterface that spreads requests over several backends.
+
+    Each request goes to the backend with the lowest expected cost, scored from
+    its EWMA latency, EWMA error rate and current in-flight count. Backends
+    whose error rate crosses max_error_rate are ejected for eject_seconds, then
+    let back in through a single probe request.
+    """
+
+    def __init__(self, backends, alpha: float = 0.3, max_error_rate: float = 0.5,
+                 min_samples: int = 3, eject_seconds: float = 30.0, failover: bool = True):
+        """
+        Initializes the router.
+
+        Args:
+            backends: List of LLMInterface instances, or (name, backend) tuples.
+            alpha: EWMA smoothing factor for latency and error rate.
+            max_error_rate: EWMA error rate above which a backend is ejected.
+            min_samples: Requests a backend must serve before it can be ejected.
+            eject_seconds: How long an ejected backend sits out before a probe.
+            failover: Retry once on the next best backend when a call fails.
+        """
+        if not backends:
+            raise ValueError("RouterService needs at least one backend.")
+
+        self._states = []
+        for index, item in enumerate(backends):
+            if isinstance(item, tuple):
+                name, backend = item
+            else:
+                backend = item
+                name = f"{getattr(backend, 'model_name', type(backend).__name__)}#{index}"
+            self._states.append(_BackendState(name, backend))
+
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.eject_seconds = eject_seconds
+        self.failover = failover
+        self.model_name = "router(" + ",".join(state.name for state in self._states) + ")"
+        self._lock = threading.Lock()
+
+    def _score(self, state: _BackendState) -> float:
+        # Untried backends score 0 so they get sampled right away
+        latency = state.ewma_latency or 0.0
+        return latency * (1 + state.in_flight) * (1 + 4 * state.ewma_error)
+
+    def _acquire(self, exclude=()) -> _BackendState:
+        """
+        Picks the backend for the next call and marks it in flight.
+        """
+        with self._lock:
+            now = time.monotonic()
+            pool = [state for state in self._states if state not in exclude] or self._states
+
+            # An ejected backend whose time is up gets exactly one probe request
+            for state in pool:
+                if state.ejected and not state.probing and state.ejected_until <= now:
+                    state.probing = True
+                    state.in_flight += 1
+                    return state
+
+            candidates = [state for state in pool if not state.ejected]
+            if not candidates:
+                # Everything is ejected: use the backend that is due back soonest
+                candidates = [min(pool, key=lambda state: state.ejected_until)]
+
+            chosen = min(candidates, key=self._score)
+            chosen.in_flight += 1
+            return chosen
+
+    def _release(self, state: _BackendState, latency: float, failed: bool) -> None:
+        """
+        Records the outcome of a call and ejects or restores the backend.
+        """
+        with self._lock:
+            state.in_flight -= 1
+            state.requests += 1
+            state.samples += 1
+            if failed:
+                state.errors += 1
+            elif state.ewma_latency is None:
+                state.ewma_latency = latency
+            else:
+                state.ewma_latency += self.alpha * (latency - state.ewma_latency)
+            state.ewma_error += self.alpha * ((1.0 if failed else 0.0) - state.ewma_error)
+
+            if state.probing:
+                state.probing = False
+                if failed:
+                    self._eject(state)
+                else:
+                    state.ejected = False
+                    state.ewma_error = 0.0
+                    state.samples = 0
+                    print(f"[ROUTER] backend {state.name} passed its probe and is back in rotation")
+            elif (failed and not state.ejected and state.samples >= self.min_samples
+                    and state.ewma_error > self.max_error_rate):
+                self._eject(state)
+
+    def _abandon(self, state: _BackendState) -> None:
+        """
+        Releases a call that was cancelled before it finished. Its cut-short
+        time says nothing about the backend, so no sample is recorded, and a
+        cancelled probe leaves the backend ejected until a real probe completes.
+        """
+        with self._lock:
+            state.in_flight -= 1
+            state.probing = False
+
+    def _eject(self, state: _BackendState) -> None:
+        state.ejected = True
+        state.ejected_until = time.monotonic() + self.eject_seconds
+        state.ejections += 1
+        print(f"[ROUTER] ejected backend {state.name} for {self.eject_seconds}s (error rate {state.ewma_error:.2f})")
+
+    def _attempts(self) -> int:
+        return 2 if self.failover and len(self._states) > 1 else 1
+
+    def _counts_as_failure(self, error: Exception) -> bool:
+        # A rejected or expired request says nothing about the backend's health
+        return not isinstance(error, (InvalidRequestError, DeadlineExceededError))
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Sends the prompt to the best backend, failing over once on error.
+        """
+        tried = []
+        last_error = None
+        for _ in range(self._attempts()):
+            state = self._acquire(exclude=tried)
+            tried.append(state)
+            start = time.monotonic()
+            try:
+                result = state.backend.get_response(prompt, system_prompt=system_prompt)
+            except Exception as e:
+                failed = self._counts_as_failure(e)
+                self._release(state, time.monotonic() - start, failed)
+                if not failed:
+                    raise
+                last_error = e
+                continue
+            self._release(state, time.monotonic() - start, False)
+            return result
+        raise last_error
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Async variant of get_response using each backend's aget_response.
+        """
+        tried = []
+        last_error = None
+        for _ in range(self._attempts()):
+            state = self._acquire(exclude=tried)
+            tried.append(state)
+            start = time.monotonic()
+            try:
+                result = await state.backend.aget_response(prompt, system_prompt=system_prompt)
+            except asyncio.CancelledError:
+                self._abandon(state)
+                raise
+            except Exception as e:
+                failed = self._counts_as_failure(e)
+                self._release(state, time.monotonic() - start, failed)
+                if not failed:
+                    raise
+                last_error = e
+                continue
+            self._release(state, time.monotonic() - start, False)
+            return result
+        raise last_error
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Streams from the best backend; latency is measured to the last chunk.
+        """
+        state = self._acquire()
+        start = time.monotonic()
+        try:
+            yield from state.backend.stream_response(prompt, system_prompt=system_prompt)
+        except GeneratorExit:
+            # The reader went away mid-stream: like a cancelled call
+            self._abandon(state)
+            raise
         except Exception as e:
-            # Handle other runtime errors
-            return f"Error: An unexpected error occurred: {e}"
\ No newline at end of file
+            self._release(state, time.monotonic() - start, self._counts_as_failure(e))
+            raise
+        self._release(state, time.monotonic() - start, False)
+
+    def stats(self) -> list:
+        """
+        Returns per-backend latency, error and health statistics.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [state.snapshot(now) for state in self._states]
+
+
+# --- Hedged Requests ---
+
+class HedgedService(LLMInterface):
+    """
+    Opt-in wrapper that hedges slow async calls with a second identical call.
+
+    If the first call has not finished by the given percentile of recent
+    latencies, a second call is fired. The first to finish with an acceptable
+    result wins and the other is cancelled. Hedges are capped at
+    max_hedge_ratio of all requests so the extra cost stays bounded.
+    """
+
+    def __init__(self, backend: LLMInterface, percentile: float = 0.95,
+                 max_hedge_ratio: float = 0.1, min_samples: int = 20,
+                 default_delay: float = 30.0, window: int = 200, accept=None):
+        """
+        Initializes the wrapper.
+
+        Args:
+            backend: The LLMInterface to hedge.
+            percentile: Latency percentile (0-1) after which a hedge is fired.
+            max_hedge_ratio: Maximum fraction of requests allowed to hedge.
+            min_samples: Latency samples needed before the percentile is trusted.
+            default_delay: Hedge delay in seconds until min_samples is reached.
+            window: Number of recent latencies the percentile is computed over.
+            accept: Callable(text) -> bool deciding if a result can win the race.
+                Defaults to accepting any result that did not raise.
+        """
+        self.backend = backend
+        self.model_name = getattr(backend, "model_name", type(backend).__name__)
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.accept = accept or (lambda text: True)
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> float:
+        """
+        Seconds to wait on the first call before hedging.
+        """
+        if len(self._latencies) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return ordered[index]
+
+    def _may_hedge(self) -> bool:
+        return self.hedged < self.max_hedge_ratio * self.requests
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Sync calls are passed straight through; hedging needs the async path.
+        """
+        return self.backend.get_response(prompt, system_prompt=system_prompt)
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Streams are passed straight through; they cannot be raced chunk by chunk.
+        """
+        yield from self.backend.stream_response(prompt, system_prompt=system_prompt)
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Calls the backend, hedging with a second call when the first is slow.
+        """
+        self.requests += 1
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self.backend.aget_response(prompt, system_prompt=system_prompt))
+        pending = {primary}
+        tasks = [primary]
+
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if done or not self._may_hedge():
+                result = await primary
+                self._latencies.append(time.monotonic() - start)
+                return result
+
+            self.hedged += 1
+            hedge = asyncio.ensure_future(self.backend.aget_response(prompt, system_prompt=system_prompt))
+            pending.add(hedge)
+            tasks.append(hedge)
+            fallback = None
+            fallback_error = None
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        fallback_error = fallback_error or e
+                        continue
+                    if self.accept(result):
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        # A lower bound for the primary when the hedge won
+                        self._latencies.append(time.monotonic() - start)
+                        return result
+                    if fallback is None:
+                        fallback = result
+
+            # Neither call produced an acceptable result
+            if fallback is not None:
+                return fallback
+            raise fallback_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # A loser that finished alongside the winner: its error is not
+                    # needed, but must be retrieved or asyncio logs it as lost
+                    task.exception()
+
+    def stats(self) -> dict:
+        """
+        Returns hedge counters, the current hedge delay and backend stats if any.
+        """
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": self.hedge_delay(),
+            "max_hedge_ratio": self.max_hedge_ratio,
+            "backend": self.backend.stats() if hasattr(self.backend, "stats") else None,
+        }
+
+
+# --- Model Cascade ---
+
+class _CascadeTier:
+    """
+    One model of a CascadeService with its serving counters.
+    """
+
+    def __init__(self, backend: LLMInterface, window: int):
+        self.backend = backend
+        self.name = getattr(backend, "model_name", type(backend).__name__)
+        self.attempts = 0
+        self.served = 0
+        self.rejected = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=window)
+
+    def snapshot(self, total: int) -> dict:
+        ordered = sorted(self._latencies)
+
+        def percentile(q):
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+        return {
+            "model": self.name,
+            "attempts": self.attempts,
+            "served": self.served,
+            "served_fraction": self.served / total if total else 0.0,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "avg_latency": sum(ordered) / len(ordered) if ordered else 0.0,
+            "p50_latency": percentile(0.5),
+            "p95_latency": percentile(0.95),
+            "backend": self.backend.stats() if hasattr(self.backend, "stats") else None,
+        }
+
+
+class CascadeService(LLMInterface):
+    """
+    Tries cheaper, faster models first and escalates only when needed.
+
+    Tiers are ordered fast to strong. A tier's answer is returned when
+    accept(text) approves it; a rejected answer or a failed call moves on
+    to the next tier, and the last tier's answer is returned as is. Prompts
+    that is_complex(prompt) flags go straight to the last tier.
+    """
+
+    def __init__(self, tiers, accept=None, is_complex=None, window: int = 200):
+        """
+        Initializes the cascade.
+
+        Args:
+            tiers: LLMInterface backends ordered from fastest to strongest.
+            accept: Callable(text) -> bool deciding if a tier's answer is good enough.
+                Defaults to accepting any result that did not raise.
+            is_complex: Callable(prompt) -> bool; True skips the cheaper tiers.
+            window: Number of recent latencies kept per tier.
+        """
+        if not tiers:
+            raise ValueError("CascadeService needs at least one tier.")
+        self._tiers = [_CascadeTier(backend, window) for backend in tiers]
+        self.model_name = ">".join(tier.name for tier in self._tiers)
+        self.accept = accept or (lambda text: True)
+        self.is_complex = is_complex or (lambda prompt: False)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.complex = 0
+
+    def _start(self, prompt: str) -> list:
+        """
+        Counts the request and returns the tiers it should try, in order.
+        """
+        skip = self.is_complex(prompt)
+        with self._lock:
+            self.requests += 1
+            if skip:
+                self.complex += 1
+        return self._tiers[-1:] if skip else self._tiers
+
+    def _finish(self, tier: _CascadeTier, latency: float, result=None, error: Exception = None,
+                last: bool = False) -> bool:
+        """
+        Records one tier attempt and returns True when its result should be served.
+        """
+        with self._lock:
+            tier.attempts += 1
+            tier._latencies.append(latency)
+            if error is not None:
+                tier.errors += 1
+                return False
+            if last or self.accept(result):
+                tier.served += 1
+                return True
+            tier.rejected += 1
+            return False
+
+    def _escalates(self, error: Exception, last: bool) -> bool:
+        # A malformed request fails on every model alike, and an expired one has no time left
+        return not last and not isinstance(error, (InvalidRequestError, DeadlineExceededError))
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Returns the first acceptable answer, escalating tier by tier.
+        """
+        tiers = self._start(prompt)
+        for index, tier in enumerate(tiers):
+            last = index == len(tiers) - 1
+            start = time.monotonic()
+            try:
+                result = tier.backend.get_response(prompt, system_prompt=system_prompt)
+            except Exception as e:
+                self._finish(tier, time.monotonic() - start, error=e)
+                if not self._escalates(e, last):
+                    raise
+                print(f"[CASCADE] {tier.name} failed ({type(e).__name__}); escalating")
+                continue
+            if self._finish(tier, time.monotonic() - start, result, last=last):
+                return result
+            print(f"[CASCADE] {tier.name} answer rejected; escalating")
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Async variant of get_response.
+        """
+        tiers = self._start(prompt)
+        for index, tier in enumerate(tiers):
+            last = index == len(tiers) - 1
+            start = time.monotonic()
+            try:
+                result = await tier.backend.aget_response(prompt, system_prompt=system_prompt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._finish(tier, time.monotonic() - start, error=e)
+                if not self._escalates(e, last):
+                    raise
+                print(f"[CASCADE] {tier.name} failed ({type(e).__name__}); escalating")
+                continue
+            if self._finish(tier, time.monotonic() - start, result, last=last):
+                return result
+            print(f"[CASCADE] {tier.name} answer rejected; escalating")
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Streams the answer. Cheaper tiers are buffered so they can still be
+        checked and escalated; only the last tier streams live.
+        """
+        tiers = self._start(prompt)
+        for index, tier in enumerate(tiers):
+            last = index == len(tiers) - 1
+            start = time.monotonic()
+            chunks = []
+            try:
+                for chunk in tier.backend.stream_response(prompt, system_prompt=system_prompt):
+                    if last:
+                        yield chunk
+                    else:
+                        chunks.append(chunk)
+            except Exception as e:
+                self._finish(tier, time.monotonic() - start, error=e)
+                if not self._escalates(e, last):
+                    raise
+                print(f"[CASCADE] {tier.name} failed ({type(e).__name__}); escalating")
+                continue
+            if last:
+                self._finish(tier, time.monotonic() - start, last=True)
+                return
+            if self._finish(tier, time.monotonic() - start, "".join(chunks)):
+                yield from chunks
+                return
+            print(f"[CASCADE] {tier.name} answer rejected; escalating")
+
+    def stats(self) -> dict:
+        """
+        Returns the share of requests each tier served and its latency.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "complex": self.complex,
+                "tiers": [tier.snapshot(self.requests) for tier in self._tiers],
+            }
+
+
+# --- Truncation Recovery ---
+
+class ContinuationService(LLMInterface):
+    """
+    Resumes answers that were cut off by the output token limit instead of
+    throwing the generation away.
+
+    An answer is cut off when its finish reason is MAX_TOKENS or
+    is_truncated(text) says so. The model is then asked to continue from the
+    cut (build_continuation) and the pieces are joined with stitch, up to
+    max_continuations times. Only when the joined answer is not is_complete
+    is the prompt regenerated in full, once. Continuations are requested as
+    free text (see free_text_scope).
+
+    Streams are passed through: their chunks are already sent and cannot be
+    stitched afterwards.
+    """
+
+    def __init__(self, backend: LLMInterface, build_continuation, stitch, is_truncated,
+                 is_complete, max_continuations: int = 2, regenerate: bool = True):
+        """
+        Args:
+            backend: The LLMInterface to call.
+            build_continuation: Callable(prompt, partial) -> continuation prompt.
+            stitch: Callable(head, tail) -> joined text.
+            is_truncated: Callable(text) -> bool for answers cut off mid-structure.
+            is_complete: Callable(text) -> bool for answers that are usable.
+            max_continuations: Continuation calls allowed per answer.
+            regenerate: Regenerate in full when stitching fails; otherwise the
+                best joined text is returned.
+        """
+        self.backend = backend
+        self.model_name = getattr(backend, "model_name", type(backend).__name__)
+        self.build_continuation = build_continuation
+        self.stitch = stitch
+        self.is_truncated = is_truncated
+        self.is_complete = is_complete
+        self.max_continuations = max_continuations
+        self.regenerate = regenerate
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.truncated = 0
+        self.continuations = 0
+        self.stitched = 0
+        self.regenerated = 0
+
+    def _cut_off(self, text: str) -> bool:
+        return getattr(text, "finish_reason", None) == "MAX_TOKENS" or self.is_truncated(text)
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _joined(self, text: str, parts: list):
+        """
+        Returns (response to serve or None, whether to keep continuing).
+        """
+        if self.is_complete(text):
+            self._count("stitched")
+            return LLMResponse.combine(text, parts), False
+        # Stitching failed unless the joined answer is merely cut off again
+        return None, self.is_truncated(text)
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Calls the backend and resumes the answer while it is cut off.
+        """
+        self._count("requests")
+        result = self.backend.get_response(prompt, system_prompt=system_prompt)
+        if not self._cut_off(result):
+            return result
+        self._count("truncated")
+        parts, text = [result], result
+        for _ in range(self.max_continuations):
+            self._count("continuations")
+            with free_text_scope():
+                tail = self.backend.get_response(self.build_continuation(prompt, text), system_prompt=system_prompt)
+            parts.append(tail)
+            text = self.stitch(text, tail)
+            served, keep_going = self._joined(text, parts)
+            if served is not None:
+                return served
+            if not keep_going:
+                break
+        if not self.regenerate:
+            return LLMResponse.combine(text, parts)
+        print(f"[CONTINUE] stitching failed after {len(parts) - 1} continuation(s); regenerating in full")
+        self._count("regenerated")
+        full = self.backend.get_response(prompt, system_prompt=system_prompt)
+        return LLMResponse.combine(full, parts + [full])
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Async variant of get_response.
+        """
+        self._count("requests")
+        result = await self.backend.aget_response(prompt, system_prompt=system_prompt)
+        if not self._cut_off(result):
+            return result
+        self._count("truncated")
+        parts, text = [result], result
+        for _ in range(self.max_continuations):
+            self._count("continuations")
+            with free_text_scope():
+                tail = await self.backend.aget_response(
+                    self.build_continuation(prompt, text), system_prompt=system_prompt
+                )
+            parts.append(tail)
+            text = self.stitch(text, tail)
+            served, keep_going = self._joined(text, parts)
+            if served is not None:
+                return served
+            if not keep_going:
+                break
+        if not self.regenerate:
+            return LLMResponse.combine(text, parts)
+        print(f"[CONTINUE] stitching failed after {len(parts) - 1} continuation(s); regenerating in full")
+        self._count("regenerated")
+        full = await self.backend.aget_response(prompt, system_prompt=system_prompt)
+        return LLMResponse.combine(full, parts + [full])
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Streams are passed straight through.
+        """
+        yield from self.backend.stream_response(prompt, system_prompt=system_prompt)
+
+    def stats(self) -> dict:
+        """
+        Returns truncation and recovery counters and backend stats if any.
+        """
+        with self._lock:
+            counters = {
+                "requests": self.requests,
+                "truncated": self.truncated,
+                "continuations": self.continuations,
+                "stitched": self.stitched,
+                "regenerated": self.regenerated,
+            }
+        counters["backend"] = self.backend.stats() if hasattr(self.backend, "stats") else None
+        return counters
+
+
+# --- Retry and Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Fails fast while an upstream is down instead of piling up doomed calls.
+
+    After failure_threshold consecutive upstream failures the circuit opens and
+    every call is rejected with CircuitOpenError. Once reset_timeout has
+    passed, a single trial call is let through (half-open): success closes the
+    circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = "llm"):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit.
+            reset_timeout: Seconds the circuit stays open before a trial call.
+            name: Label used in log lines and stats.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        Raises CircuitOpenError unless a call may proceed right now.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(f"Circuit '{self.name}' is open; upstream considered down.")
+
+    def record_success(self) -> None:
+        """
+        Closes the circuit after a successful call.
+        """
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"[BREAKER] circuit '{self.name}' closed")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Exception) -> None:
+        """
+        Counts a failed call; request errors, expired deadlines and local
+        rate-limit waits (queue timeouts, every key cooling down) do not count
+        against the upstream.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+            if isinstance(error, (InvalidRequestError, DeadlineExceededError,
+                                  RateLimitQueueTimeout, KeysCoolingDownError)):
+                return
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"[BREAKER] circuit '{self.name}' opened after {self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def abandon_trial(self) -> None:
+        """
+        Frees the half-open trial slot when its call was cancelled without an outcome.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        """
+        Returns the circuit state and rejection counter.
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "rejected": self.rejected,
+            }
+
+
+class RetryingService(LLMInterface):
+    """
+    Wraps a backend with jittered exponential retry and an optional circuit breaker.
+
+    Only retryable LLMError classes (rate limits, timeouts, server errors) are
+    retried; everything else is raised immediately. No attempt is started
+    and no backoff slept past the request deadline.
+    """
+
+    def __init__(self, backend: LLMInterface, max_attempts: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 8.0, breaker: CircuitBreaker = None):
+        """
+        Args:
+            backend: The LLMInterface to call.
+            max_attempts: Total attempts per call, including the first.
+            base_delay: Backoff ceiling in seconds for the first retry; doubles each attempt.
+            max_delay: Upper bound on any single backoff.
+            breaker: Optional CircuitBreaker consulted before every attempt.
+        """
+        self.backend = backend
+        self.model_name = getattr(backend, "model_name", type(backend).__name__)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.retries = 0
+
+    def _backoff(self, attempt: int, error: LLMError) -> float:
+        # Full jitter keeps retrying clients from synchronizing
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        return (
+            isinstance(error, LLMError)
+            and error.retryable
+            and attempt + 1 < self.max_attempts
+        )
+
+    def _fits_deadline(self, delay: float) -> bool:
+        # Sleeping into the deadline would only delay the same failure
+        remaining = time_remaining()
+        return remaining is None or delay < remaining
+
+    def _record(self, error: Exception = None) -> None:
+        if self.breaker is None:
+            return
+        if error is None:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure(error)
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Calls the backend, retrying retryable failures with jittered backoff.
+        """
+        for attempt in range(self.max_attempts):
+            check_deadline()
+            if self.breaker:
+                self.breaker.before_call()
+            try:
+                result = self.backend.get_response(prompt, system_prompt=system_prompt)
+            except Exception as e:
+                error = translate_error(e)
+                self._record(error)
+                delay = self._backoff(attempt, error)
+                if not self._should_retry(error, attempt) or not self._fits_deadline(delay):
+                    raise error
+                self.retries += 1
+                time.sleep(delay)
+                continue
+            self._record()
+            return result
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Async variant of get_response.
+        """
+        for attempt in range(self.max_attempts):
+            check_deadline()
+            if self.breaker:
+                self.breaker.before_call()
+            try:
+                result = await self.backend.aget_response(prompt, system_prompt=system_prompt)
+            except asyncio.CancelledError:
+                if self.breaker:
+                    self.breaker.abandon_trial()
+                raise
+            except Exception as e:
+                error = translate_error(e)
+                self._record(error)
+                delay = self._backoff(attempt, error)
+                if not self._should_retry(error, attempt) or not self._fits_deadline(delay):
+                    raise error
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            self._record()
+            return result
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Streams from the backend, retrying only if no chunk has been sent yet.
+        """
+        for attempt in range(self.max_attempts):
+            check_deadline()
+            if self.breaker:
+                self.breaker.before_call()
+            started = False
+            try:
+                for chunk in self.backend.stream_response(prompt, system_prompt=system_prompt):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                # The consumer stopped reading (e.g. the client disconnected):
+                # no outcome, but a half-open trial must not stay taken
+                if self.breaker:
+                    self.breaker.abandon_trial()
+                raise
+            except Exception as e:
+                error = translate_error(e)
+                self._record(error)
+                delay = self._backoff(attempt, error)
+                if started or not self._should_retry(error, attempt) or not self._fits_deadline(delay):
+                    raise error
+                self.retries += 1
+                time.sleep(delay)
+                continue
+            self._record()
+            return
+
+    def stats(self) -> dict:
+        """
+        Returns the retry counter, breaker state and backend stats if any.
+        """
+        return {
+            "retries": self.retries,
+            "breaker": self.breaker.stats() if self.breaker else None,
+            "backend": self.backend.stats() if hasattr(self.backend, "stats") else None,
+        }
+
+
+# --- Record / Replay ---
+
+class ReplayService(LLMInterface):
+    """
+    Records real LLM responses to a cassette file and replays them offline.
+
+    In "record" mode every call goes to the wrapped backend, and the response
+    and its observed latency are stored under the SHA-256 of the system prompt
+    and prompt. In "replay" mode responses come from the cassette only; no
+    backend or network is needed. Replay can reproduce the recorded latency of each prompt, or
+    sample from the distribution of all recorded latencies.
+    """
+
+    RECORD = "record"
+    REPLAY = "replay"
+
+    def __init__(self, cassette_path: str, mode: str = "replay", backend: LLMInterface = None,
+                 latency: str = "none", speedup: float = 1.0, chunk_size: int = 64):
+        """
+        Args:
+            cassette_path: JSON Lines file holding the recorded interactions,
+                one per line. The older single-document JSON cassettes are
+                still read.
+            mode: "record" or "replay".
+            backend: The real LLMInterface to record from (record mode only).
+            latency: In replay, "none" answers at once, "recorded" sleeps the
+                latency recorded for that prompt, "distribution" sleeps a
+                latency sampled from all recordings.
+            speedup: Divides every reproduced latency (2.0 = twice as fast).
+            chunk_size: Characters per chunk when replaying a stream.
+        """
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError("mode must be 'record' or 'replay'.")
+        if mode == self.RECORD and backend is None:
+            raise ValueError("record mode needs a backend to record from.")
+        if latency not in ("none", "recorded", "distribution"):
+            raise ValueError("latency must be 'none', 'recorded' or 'distribution'.")
+
+        self.cassette_path = str(cassette_path)
+        self.mode = mode
+        self.backend = backend
+        self.latency = latency
+        self.speedup = speedup
+        self.chunk_size = chunk_size
+        self.model_name = getattr(backend, "model_name", "replay") if backend else "replay"
+        self._lock = threading.Lock()
+        self._cursor = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.missing = 0
+        self._interactions = self._load()
+
+    def _load(self) -> dict:
+        try:
+            interactions, legacy = self._read(self.cassette_path)
+        except FileNotFoundError:
+            if self.mode == self.REPLAY:
+                raise ValueError(f"Cassette not found: {self.cassette_path}")
+            return {}
+        if legacy and self.mode == self.RECORD:
+            # Appending lines to a single JSON document would corrupt it:
+            # convert it to JSON Lines once before recording into it
+            self._rewrite(interactions)
+        return interactions
+
+    @staticmethod
+    def _read(path: str) -> tuple:
+        """
+        Returns (interactions, legacy) where legacy is True for the older
+        single-document format ({"version": 1, "interactions": ...}).
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        try:
+            document = json.loads(text)
+        except json.JSONDecodeError:
+            document = None
+        if isinstance(document, dict) and "interactions" in document:
+            return document["interactions"], True
+
+        interactions = {}
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-append leaves at most the last line cut short
+                print(f"[REPLAY] skipping unreadable line {number} of {path}")
+                continue
+            interactions.setdefault(entry.pop("key"), []).append(entry)
+        return interactions, False
+
+    @classmethod
+    def read_cassette(cls, path: str) -> dict:
+        """
+        Reads a cassette into {prompt hash: [interaction, ...]}.
+
+        Raises:
+            FileNotFoundError: No cassette at path.
+        """
+        return cls._read(path)[0]
+
+    def _rewrite(self, interactions: dict) -> None:
+        # Write to a temp file first so a crash never leaves a truncated cassette
+        tmp_path = self.cassette_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, entries in interactions.items():
+                for entry in entries:
+                    f.write(json.dumps({"key": key, **entry}) + "\n")
+        os.replace(tmp_path, self.cassette_path)
+
+    @staticmethod
+    def prompt_hash(prompt: str, system_prompt: str = None) -> str:
+        """
+        Cassette key of a prompt and its system prompt.
+        """
+        text = system_prompt + "\n\n" + prompt if system_prompt else prompt
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _record(self, prompt: str, system_prompt: str, response: str, latency: float,
+                usage: dict = None) -> None:
+        key = self.prompt_hash(prompt, system_prompt)
+        entry = {
+            "response": str(response),
+            "latency": latency,
+            "usage": usage,
+            "recorded_at": time.time(),
+        }
+        with self._lock:
+            self._interactions.setdefault(key, []).append(entry)
+            self.recorded += 1
+            # One appended line per call keeps a long recording session linear
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, **entry}) + "\n")
+
+    def _lookup(self, prompt: str, system_prompt: str = None) -> dict:
+        """
+        Returns the next recorded interaction for prompt, cycling through repeats.
+
+        Raises:
+            InvalidRequestError: Nothing was recorded for this prompt.
+        """
+        key = self.prompt_hash(prompt, system_prompt)
+        with self._lock:
+            entries = self._interactions.get(key)
+            if not entries:
+                self.missing += 1
+                raise InvalidRequestError(f"No recorded response for prompt {key[:12]} in {self.cassette_path}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            self.replayed += 1
+            return entries[index % len(entries)]
+
+    def _replay_delay(self, entry: dict) -> float:
+        if self.latency == "recorded":
+            delay = entry["latency"]
+        elif self.latency == "distribution":
+            with self._lock:
+                delay = random.choice([e["latency"] for entries in self._interactions.values() for e in entries])
+        else:
+            delay = 0.0
+        return delay / self.speedup
+
+    @staticmethod
+    def _replayed(entry: dict, delay: float) -> LLMResponse:
+        usage = dict(entry.get("usage") or {})
+        usage["latency"] = delay
+        return LLMResponse(entry["response"], **usage)
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Records the backend's answer, or replays the recorded one.
+        """
+        if self.mode == self.RECORD:
+            start = time.monotonic()
+            response = self.backend.get_response(prompt, system_prompt=system_prompt)
+            self._record(prompt, system_prompt, response, time.monotonic() - start,
+                         response.usage() if isinstance(response, LLMResponse) else None)
+            return response
+
+        entry = self._lookup(prompt, system_prompt)
+        delay, cut_short = clip_to_deadline(self._replay_delay(entry))
+        time.sleep(delay)
+        if cut_short:
+            raise DeadlineExceededError("Request deadline passed during a replayed call.")
+        return self._replayed(entry, delay)
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Async variant of get_response.
+        """
+        if self.mode == self.RECORD:
+            start = time.monotonic()
+            response = await self.backend.aget_response(prompt, system_prompt=system_prompt)
+            await asyncio.to_thread(self._record, prompt, system_prompt, response, time.monotonic() - start,
+                                    response.usage() if isinstance(response, LLMResponse) else None)
+            return response
+
+        entry = self._lookup(prompt, system_prompt)
+        delay, cut_short = clip_to_deadline(self._replay_delay(entry))
+        await asyncio.sleep(delay)
+        if cut_short:
+            raise DeadlineExceededError("Request deadline passed during a replayed call.")
+        return self._replayed(entry, delay)
+
+    def stream_response(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        Records a live stream, or replays a recorded response in chunks.
+        """
+        if self.mode == self.RECORD:
+            start = time.monotonic()
+            chunks = []
+            usage = None
+            for chunk in self.backend.stream_response(prompt, system_prompt=system_prompt):
+                chunks.append(chunk)
+                if isinstance(chunk, LLMResponse):
+                    usage = chunk.usage()
+                yield chunk
+            self._record(prompt, system_prompt, "".join(chunks), time.monotonic() - start, usage)
+            return
+
+        entry = self._lookup(prompt, system_prompt)
+        response = entry["response"]
+        chunks = [response[i:i + self.chunk_size] for i in range(0, len(response), self.chunk_size)] or [""]
+        # Spread the reproduced latency evenly over the chunks
+        delay = self._replay_delay(entry)
+        for chunk in chunks:
+            wait, cut_short = clip_to_deadline(delay / len(chunks))
+            time.sleep(wait)
+            if cut_short:
+                raise DeadlineExceededError("Request deadline passed during a replayed stream.")
+            yield chunk
+        yield self._replayed(dict(entry, response=""), delay)
+
+    def stats(self) -> dict:
+        """
+        Returns the cassette size and record/replay counters.
+        """
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "cassette": self.cassette_path,
+                "prompts": len(self._interactions),
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "missing": self.missing,
+            }
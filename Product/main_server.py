@@ -5,8 +5,15 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.responses import HTMLResponse
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 import uvicorn
+import asyncio
 import json
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 
@@ -21,7 +28,32 @@ if ENV_PATH.exists():
 else:
     print(f"[INIT] WARNING: .env not found at {ENV_PATH}")
 
-app = FastAPI(title="Prompt Test Backend")
+def initialize_services():
+    """
+    Builds the LLM service and warms the in-memory caches. Blocking; runs on a thread.
+    """
+    try:
+        get_llm_service()
+        warm_caches()
+    except Exception as e:
+        # The next request retries the build and reports the error itself
+        print(f"[INIT] WARNING: background initialization failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Heavy initialization runs in the background so the server accepts requests at once
+    startup = asyncio.ensure_future(asyncio.to_thread(initialize_services))
+    # Generation workers share the event loop with the HTTP handlers
+    workers = start_workers(job_queue, resolve_job_prompt, JOB_WORKERS, name="http") if JOB_WORKERS else []
+    print(f"[JOBS] started {len(workers)} in-process job workers")
+    try:
+        yield
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(startup, *workers, return_exceptions=True)
+
+app = FastAPI(title="Prompt Test Backend", lifespan=lifespan)
 
 # CORS: allow all origins for development
 app.add_middleware(
@@ -40,52 +72,549 @@ def log_response(response):
 #======================================
 # LLM CALLING SERVICE
 
-from llm_service import GeminiService
+from llm_service import (
+    CascadeService, CircuitBreaker, DeadlineExceededError, GeminiService, HedgedService, InvalidRequestError,
+    LLMError, LLMResponse, LLMTimeoutError, RateLimitedError, RateLimiter, ReplayService, RetryingService,
+    RouterService, ContinuationService, deadline_scope
+)
+from ui_schema import PACKED_RESPONSE_SCHEMA, UI_RESPONSE_SCHEMA, is_truncated_json, stitch_continuation
+from prompt_builder import build_continuation_prompt
 API_KEY = "<PUT YOUR GEMEINI API KEY HERE>"
-llm_service = GeminiService(api_key=API_KEY)
-print("llm Service initialized.")
+# Comma separated pool of keys; falls back to the single API_KEY above
+API_KEYS = [k.strip() for k in os.getenv("GEMINI_API_KEYS", "").split(",") if k.strip()] or [API_KEY]
+# Comma separated; more than one model puts a latency-aware router in front
+GEMINI_MODELS = [m.strip() for m in os.getenv("GEMINI_MODELS", "gemini-2.5-pro").split(",") if m.strip()]
+# Optional fast model tried first; answers that fail the schema checks escalate to GEMINI_MODELS
+LLM_CASCADE_MODEL = os.getenv("LLM_CASCADE_MODEL", "").strip()
+
+# Latency modes a request can ask for, all presets in one place.
+# models=None means GEMINI_MODELS; None settings keep the model defaults;
+# cascade=True puts LLM_CASCADE_MODEL in front. LLM_MODE_PRESETS takes a
+# JSON object of per-mode overrides, e.g. {"fast": {"temperature": 0}}.
+LATENCY_MODES = {
+    "fast": {"models": ["gemini-2.5-flash-lite"], "thinking_budget": 0,
+             "max_output_tokens": 8192, "temperature": 0.2, "cascade": False},
+    "balanced": {"models": ["gemini-2.5-flash"], "thinking_budget": 1024,
+                 "max_output_tokens": 16384, "temperature": 0.4, "cascade": False},
+    "quality": {"models": None, "thinking_budget": None,
+                "max_output_tokens": None, "temperature": None, "cascade": True},
+}
+for _mode, _overrides in json.loads(os.getenv("LLM_MODE_PRESETS", "{}")).items():
+    LATENCY_MODES.setdefault(_mode, dict(LATENCY_MODES["quality"])).update(_overrides)
+DEFAULT_LATENCY_MODE = os.getenv("LLM_DEFAULT_MODE", "quality")
+if DEFAULT_LATENCY_MODE not in LATENCY_MODES:
+    raise ValueError(f"LLM_DEFAULT_MODE must be one of {sorted(LATENCY_MODES)}")
+
+# Ask the model for JSON matching the UI schema instead of relying on the
+# prompt text; fence stripping stays as the fallback for backends without it
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+
+def llm_response_schema():
+    """
+    The response schema backends are built with, or None when structured output is off.
+    """
+    # Packed calls ask for PACKED_RESPONSE_SCHEMA per call (see get_prompt_packer)
+    return UI_RESPONSE_SCHEMA if LLM_STRUCTURED_OUTPUT else None
+
+def mode_models(mode):
+    """
+    The model(s) a latency mode generates with.
+    """
+    return LATENCY_MODES[mode].get("models") or GEMINI_MODELS
+
+def build_gemini_backend(model_name, preset=None):
+    """
+    A Gemini backend over the key pool with per-key quota limiters,
+    retry/backoff and a circuit breaker, using a latency mode's generation settings.
+    """
+    preset = preset or {}
+    rate_limiter = None
+    if os.getenv("LLM_RPM") or os.getenv("LLM_TPM"):
+        # LLM_RPM / LLM_TPM are the quota of a single key
+        rate_limiter = lambda: RateLimiter(
+            rpm=float(os.getenv("LLM_RPM", "0")) or None,
+            tpm=float(os.getenv("LLM_TPM", "0")) or None,
+            max_wait=float(os.getenv("LLM_QUEUE_MAX_WAIT", "60"))
+        )
+    return with_retries(
+        GeminiService(
+            api_key=API_KEYS,
+            model_name=model_name,
+            rate_limiter=rate_limiter,
+            # The instruction prefix is registered once per key and referenced by every call
+            context_cache=os.getenv("LLM_CONTEXT_CACHE", "1") == "1",
+            context_cache_ttl=float(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600")),
+            thinking_budget=preset.get("thinking_budget"),
+            max_output_tokens=preset.get("max_output_tokens"),
+            temperature=preset.get("temperature"),
+            response_schema=llm_response_schema()
+        ),
+        model_name
+    )
+
+def build_synthetic_backend(model_name, preset=None):
+    """
+    A simulated backend (see synthetic_llm.py) behind the same retry/breaker
+    stack, for tuning concurrency, timeouts and retries without a quota.
+    Generation settings of the preset do not apply to the simulator.
+    """
+    from synthetic_llm import SyntheticLLM
+    return with_retries(
+        SyntheticLLM.from_env(model_name=model_name, response_schema=llm_response_schema()),
+        model_name
+    )
+
+def with_retries(backend, model_name):
+    """
+    Wraps a backend with retry/backoff and a circuit breaker.
+    """
+    return RetryingService(
+        backend,
+        max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+            name=model_name
+        )
+    )
+
+# "gemini" (default) or "synthetic" for the local simulator
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+build_backend = build_synthetic_backend if LLM_BACKEND == "synthetic" else build_gemini_backend
+
+def with_continuation(service):
+    """
+    Resumes answers cut off by the output token limit instead of regenerating
+    them (LLM_CONTINUATION=0 turns it off).
+    """
+    if os.getenv("LLM_CONTINUATION", "1") != "1":
+        return service
+    return ContinuationService(
+        service,
+        build_continuation=build_continuation_prompt,
+        stitch=stitch_continuation,
+        is_truncated=is_truncated_json,
+        is_complete=is_valid_json_response,
+        max_continuations=int(os.getenv("LLM_MAX_CONTINUATIONS", "2"))
+    )
+
+def uses_cascade(mode):
+    return bool(LLM_CASCADE_MODEL) and LATENCY_MODES[mode].get("cascade", False)
+
+def model_label(mode):
+    """
+    Cache label of a latency mode, known before its service is built.
+    """
+    label = "+".join(mode_models(mode))
+    if uses_cascade(mode):
+        label = LLM_CASCADE_MODEL + ">" + label
+    if LLM_BACKEND == "synthetic":
+        # Keep simulated schemas out of the real generation cache
+        label = "synthetic:" + label
+    return f"{mode}/{label}"
+
+def build_llm_service(mode=DEFAULT_LATENCY_MODE):
+    """
+    Builds the full LLM stack of a latency mode: Gemini backend(s), optional
+    router, cascade and hedging, or a record/replay cassette when
+    LLM_REPLAY_MODE is set.
+    """
+    preset = LATENCY_MODES[mode]
+    models = mode_models(mode)
+    replay_mode = os.getenv("LLM_REPLAY_MODE", "")
+    default_cassette = os.getenv("LLM_CASSETTE", str(CURRENT_DIR / "llm_cassette.jsonl"))
+    cassette = default_cassette
+    if mode != DEFAULT_LATENCY_MODE:
+        # Other modes answer with other models, so they keep their own recordings
+        cassette = str(Path(cassette).with_suffix(f".{mode}.jsonl"))
+    if replay_mode == "replay":
+        if cassette != default_cassette and not Path(cassette).exists():
+            # Nothing recorded for this mode: answer from the default recordings
+            print(f"[REPLAY] no cassette for mode {mode} at {cassette}, replaying {default_cassette}")
+            cassette = default_cassette
+        # Fully offline: no Gemini client is created
+        return with_continuation(ReplayService(
+            cassette,
+            mode="replay",
+            latency=os.getenv("LLM_REPLAY_LATENCY", "none"),
+            speedup=float(os.getenv("LLM_REPLAY_SPEEDUP", "1"))
+        ))
+
+    if len(models) > 1:
+        service = RouterService([build_backend(m, preset) for m in models])
+    else:
+        service = build_backend(models[0], preset)
+
+    # Opt-in: serve simple prompts from a faster model, escalating bad answers
+    if uses_cascade(mode):
+        service = CascadeService(
+            [build_backend(LLM_CASCADE_MODEL, preset), service],
+            accept=is_valid_ui_schema,
+            is_complex=lambda prompt: is_complex_prompt(
+                prompt,
+                max_words=int(os.getenv("LLM_CASCADE_MAX_WORDS", "40")),
+                max_features=int(os.getenv("LLM_CASCADE_MAX_FEATURES", "4"))
+            )
+        )
+        print(f"llm Service cascading {LLM_CASCADE_MODEL} -> {'+'.join(models)}.")
+
+    # Opt-in: race a second call once the first passes the latency percentile
+    if os.getenv("LLM_HEDGE", "0") == "1":
+        service = HedgedService(
+            service,
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+            max_hedge_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1")),
+            accept=is_valid_json_response
+        )
+        print("llm Service hedging enabled.")
+
+    if replay_mode == "record":
+        service = ReplayService(cassette, mode="record", backend=service)
+        print(f"llm Service recording to {cassette}")
+    # Outside the recorder, so continuation calls are recorded and replayed too
+    return with_continuation(service)
+
+# One service per latency mode, built on first use (the default one in the
+# background by the lifespan), never at import
+llm_services = {}
+_llm_service_lock = threading.Lock()
+
+def get_llm_service(mode=None):
+    """
+    Returns the LLM service of a latency mode, building it on first use.
+    Blocking; call from a thread.
+    """
+    mode = mode or DEFAULT_LATENCY_MODE
+    if mode not in llm_services:
+        with _llm_service_lock:
+            if mode not in llm_services:
+                started = time.perf_counter()
+                llm_services[mode] = build_llm_service(mode)
+                print(f"llm Service ({mode}) initialized in {time.perf_counter() - started:.2f}s.")
+    return llm_services[mode]
+
+async def aget_llm_service(mode=None):
+    """
+    Async accessor that never blocks the event loop while the service is built.
+    """
+    service = llm_services.get(mode or DEFAULT_LATENCY_MODE)
+    if service is not None:
+        return service
+    return await asyncio.to_thread(get_llm_service, mode)
 
 #======================================
 #======================================
 #text extraaction
-from prompt_builder import concatenate_files
-file_a = 'v1_python_dict_prompt.txt'
-file_b = 'v1_schema_prompt.txt'
+from prompt_builder import concatenate_files, is_complex_prompt
+file_a = str(CURRENT_DIR / 'v1_python_dict_prompt.txt')
+file_b = str(CURRENT_DIR / 'v1_schema_prompt.txt')
 combined_data = concatenate_files(file_a, file_b)
-print("Builded : ")
-print(combined_data)
+print(f"[INIT] prompt template loaded ({len(combined_data)} chars)")
+#======================================
+
+#======================================
+#response cache
+from cache_service import (
+    ResponseCache, SimilarityCache, SingleFlight, SQLiteCache, hash_text, make_cache_key
+)
+TEMPLATE_HASH = hash_text(combined_data)
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("PROMPT_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("PROMPT_CACHE_TTL", "3600"))
+)
+# Near-duplicate prompts (opt-in): wording this close can still ask for a
+# different UI, so nothing is served from it unless PROMPT_SIMILARITY=1.
+# The threshold comes from cache_service.threshold_report.
+PROMPT_SIMILARITY_ENABLED = os.getenv("PROMPT_SIMILARITY", "0") == "1"
+similarity_cache = SimilarityCache(
+    threshold=float(os.getenv("PROMPT_SIMILARITY_THRESHOLD", "0.9")),
+    max_entries=int(os.getenv("PROMPT_SIMILARITY_SIZE", "1024"))
+)
+# Shared across workers and restarts
+persistent_cache = SQLiteCache(
+    os.getenv("PROMPT_CACHE_DB", str(CURRENT_DIR / "generation_cache.sqlite3")),
+    max_bytes=int(os.getenv("PROMPT_CACHE_DB_BYTES", str(64 * 1024 * 1024)))
+)
+single_flight = SingleFlight()
+# PROMPT_CACHE=0 sends every request to the LLM, e.g. for load tests
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE", "1") != "0"
+
+def prompt_cache_key(prompt_text, mode=DEFAULT_LATENCY_MODE):
+    """
+    Cache key for a user prompt under the current template and the mode's model.
+    """
+    return make_cache_key(prompt_text, TEMPLATE_HASH, model_label(mode))
+
+def prompt_cache_namespace(mode=DEFAULT_LATENCY_MODE):
+    """
+    Scope for similarity lookups so template, mode or model changes never serve stale schemas.
+    """
+    return f"{model_label(mode)}:{TEMPLATE_HASH}"
+
+async def lookup_cached_response(prompt_text, cache_key, mode=DEFAULT_LATENCY_MODE):
+    """
+    Returns a cached schema for the prompt from the exact or the similarity cache.
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # SQLite may wait on another worker's write lock; keep that off the event loop
+    cached = await asyncio.to_thread(persistent_cache.get, cache_key)
+    if cached is not None:
+        response_cache.set(cache_key, cached)
+        return cached
+
+    if not PROMPT_SIMILARITY_ENABLED:
+        return None
+    similar = similarity_cache.lookup(prompt_text, prompt_cache_namespace(mode))
+    if similar is None:
+        return None
+    cached, similarity, matched_prompt = similar
+    print(f"[CACHE] near-duplicate of {matched_prompt!r} (jaccard={similarity:.2f})")
+    response_cache.set(cache_key, cached)
+    return cached
+
+async def store_cached_response(prompt_text, cache_key, static_response, mode=DEFAULT_LATENCY_MODE):
+    """
+    Stores a successfully parsed schema in every cache layer.
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return
+    namespace = prompt_cache_namespace(mode)
+    response_cache.set(cache_key, static_response)
+    if PROMPT_SIMILARITY_ENABLED:
+        similarity_cache.add(prompt_text, static_response, namespace)
+    await asyncio.to_thread(persistent_cache.set, cache_key, static_response, prompt=prompt_text, namespace=namespace)
+
+def warm_caches():
+    """
+    Loads the most recent persistent entries for this template and the
+    configured modes into memory.
+    """
+    namespaces = {prompt_cache_namespace(mode) for mode in LATENCY_MODES}
+    warmed = 0
+    for key, prompt, entry_namespace, value in persistent_cache.warm(response_cache.max_entries):
+        if entry_namespace not in namespaces:
+            continue
+        response_cache.set(key, value)
+        if PROMPT_SIMILARITY_ENABLED:
+            similarity_cache.add(prompt, value, entry_namespace)
+        warmed += 1
+    print(f"[CACHE] warm start loaded {warmed} generations from {persistent_cache.path}")
+
+#======================================
+
+#======================================
+#token and latency accounting
+from usage_tracker import UsageTracker
+usage_tracker = UsageTracker()
+# Usage is grouped per template, so edits to the prompt files show up as a new entry
+TEMPLATE_LABEL = f"{Path(file_a).stem}+{Path(file_b).stem}@{TEMPLATE_HASH[:8]}"
 #======================================
 
 #======================================
 #json stripper
-def strip_json_fence(text):
+from ui_schema import is_valid_json_response, is_valid_ui_schema, strip_json_fence
+
+def llm_error_response(error):
     """
-    Remove ```json or ``` from start/end of LLM response if present.
+    Maps a typed LLM failure to the /prompt error payload and an HTTP status.
     """
-    if text.startswith("```json"):
-        text = text[7:]
-    elif text.startswith("```"):
-        text = text[3:]
+    if isinstance(error, RateLimitedError):
+        status_code = 429
+    elif isinstance(error, LLMTimeoutError):
+        status_code = 504
+    elif isinstance(error, InvalidRequestError):
+        status_code = 400
+    else:
+        status_code = 503
+    payload = {
+        "success": "false",
+        "error": str(error),
+        "error_type": type(error).__name__,
+        "retryable": error.retryable
+    }
+    return payload, status_code
 
-    if text.endswith("```"):
-        text = text[:-3]
+def unknown_mode_response(mode):
+    """
+    The error payload for a request naming a latency mode that does not exist.
+    """
+    return {
+        "success": "false",
+        "error": f"Unknown mode {mode!r}; expected one of {sorted(LATENCY_MODES)}",
+        "error_type": "InvalidRequestError",
+        "retryable": False
+    }
 
-    return text.strip()
+#======================================
 
 #======================================
+#multi-prompt packing (opt-in)
+from prompt_builder import build_packed_prompt
+from prompt_packer import PromptPacker
 
+def build_user_prompt(prompt_text):
+    """
+    The variable part of the prompt for a single user request.
 
-@app.post("/prompt")
-async def receive_prompt(request: Request):
+    The static combined_data instructions are sent as the system prompt, a
+    fixed prefix the provider can cache, instead of trailing the user text.
+    """
+    return "USER REQUEST : " + prompt_text
+
+PACKING_MAX_PROMPT_CHARS = int(os.getenv("PROMPT_PACKING_MAX_CHARS", "200"))
+PROMPT_PACKING = os.getenv("PROMPT_PACKING", "0") == "1"
+# One packer per latency mode, since packed prompts share one generation
+prompt_packers = {}
+
+def get_prompt_packer(service, mode=DEFAULT_LATENCY_MODE):
+    """
+    Returns the PromptPacker of a latency mode, creating it on first use.
+    """
+    if mode not in prompt_packers:
+        prompt_packers[mode] = PromptPacker(
+            service,
+            build_prompt=build_user_prompt,
+            build_packed_prompt=build_packed_prompt,
+            parse=lambda text: json.loads(strip_json_fence(text)),
+            window=float(os.getenv("PROMPT_PACKING_WINDOW", "0.05")),
+            max_batch=int(os.getenv("PROMPT_PACKING_MAX_BATCH", "4")),
+            # An unpacked item missing functions/elements/css gets its own call
+            validate=lambda schema: is_valid_ui_schema(json.dumps(schema)),
+            system_prompt=combined_data,
+            packed_schema=PACKED_RESPONSE_SCHEMA if LLM_STRUCTURED_OUTPUT else None
+        )
+        print(f"Prompt packing enabled ({mode}).")
+    return prompt_packers[mode]
+
+#======================================
+
+#======================================
+#parallel section generation (opt-in)
+from prompt_builder import build_section_prompt, split_ui_sections
+from section_planner import SectionPlanner
+from ui_schema import merge_ui_schemas
+
+SECTION_PLANNING = os.getenv("SECTION_PLANNING", "0") == "1"
+# One planner per latency mode, like the packers
+section_planners = {}
+
+def plan_sections(prompt_text):
+    """
+    Only complex requests are split; simple ones are fast enough in one call.
+    """
+    if not is_complex_prompt(prompt_text):
+        return []
+    return split_ui_sections(prompt_text, max_sections=int(os.getenv("SECTION_PLANNING_MAX_SECTIONS", "4")))
+
+def get_section_planner(service, mode=DEFAULT_LATENCY_MODE):
+    """
+    Returns the SectionPlanner of a latency mode, creating it on first use.
+    """
+    if mode not in section_planners:
+        section_planners[mode] = SectionPlanner(
+            service,
+            plan=plan_sections,
+            build_section_prompt=build_section_prompt,
+            build_prompt=build_user_prompt,
+            parse=lambda text: json.loads(strip_json_fence(text)),
+            merge=merge_ui_schemas,
+            validate=lambda schema: is_valid_ui_schema(json.dumps(schema)),
+            system_prompt=combined_data
+        )
+        print(f"Section planning enabled ({mode}).")
+    return section_planners[mode]
+
+#======================================
+
+#======================================
+#request deadlines
+# Seconds a client waits for an answer, sent as the X-Request-Timeout header.
+# Every LLM call, retry and queue wait made for the request stops at its deadline.
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+# Used when the header is missing; 0 means no deadline
+REQUEST_TIMEOUT_DEFAULT = float(os.getenv("REQUEST_TIMEOUT_DEFAULT", "120"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "600"))
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+deadline_stats = {"disconnected": 0, "expired": 0}
+
+def request_timeout(request, default=REQUEST_TIMEOUT_DEFAULT):
+    """
+    The deadline of a request in seconds from now, or None for no deadline.
+    """
+    value = request.headers.get(REQUEST_TIMEOUT_HEADER)
     try:
-        data = await request.json()
-    except Exception:
-        data = {}
-    print("type : " ,type(data))
-    prompt_text = data.get("prompt")
-    log_request("/prompt [POST]", data)
-    # Get raw response from LLM
-    result = llm_service.get_response("USER REQUEST : " + prompt_text + combined_data)
+        timeout = float(value) if value else default
+    except ValueError:
+        timeout = default
+    if not timeout or timeout <= 0:
+        return None
+    return min(timeout, REQUEST_TIMEOUT_MAX)
+
+async def cancel_on_disconnect(request, coro):
+    """
+    Awaits coro, cancelling it as soon as the client disconnects.
+
+    Returns:
+        The result of coro, or None when the client went away first.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                deadline_stats["disconnected"] += 1
+                print(f"[DEADLINE] client left {request.url.path}; cancelling its generation")
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+def client_gone_response():
+    # 499 (client closed request): nobody reads it, but it shows up in access logs
+    return JSONResponse(content={"success": "false", "error": "Client disconnected"}, status_code=499)
+
+#======================================
+
+#======================================
+#server-sent events
+def sse_event(payload, event=None):
+    """
+    Format a payload as a single Server-Sent Events message.
+    """
+    message = ""
+    if event:
+        message += f"event: {event}\n"
+    message += f"data: {json.dumps(payload)}\n\n"
+    return message
+
+#======================================
+
+
+async def generate_ui(prompt_text, cache_key, route="/prompt", mode=DEFAULT_LATENCY_MODE):
+    """
+    Runs one LLM generation for a user request and returns the /prompt payload.
+    """
+    service = await aget_llm_service(mode)
+    # Large requests may be split into sections generated in parallel
+    result = None
+    if SECTION_PLANNING:
+        result = await get_section_planner(service, mode).generate(prompt_text)
+    # Get raw response from LLM; small prompts may share a packed generation
+    if result is not None:
+        usage_tracker.record(route, TEMPLATE_LABEL + "/sections", result, mode)
+    elif PROMPT_PACKING and len(prompt_text) <= PACKING_MAX_PROMPT_CHARS:
+        result = await get_prompt_packer(service, mode).submit(prompt_text)
+        usage_tracker.record(route, TEMPLATE_LABEL + "/packed", result, mode)
+    else:
+        result = await service.aget_response(build_user_prompt(prompt_text), system_prompt=combined_data)
+        usage_tracker.record(route, TEMPLATE_LABEL, result, mode)
     print("llm response:")
     print(result)
     print("===========================================================\nstripped\n")
@@ -99,23 +628,339 @@ async def receive_prompt(request: Request):
     except json.JSONDecodeError as e:
         # If parsing fails, return an error response
         print(f"JSON decode error: {e}")
-        return JSONResponse(content={
+        return {
             "success": "false",
             "error": "Failed to parse LLM response as JSON",
             "raw_response": result
-        })
+        }
 
     # Convert back to string if needed
     static_response = json.dumps(static_response_dict)
+    # Only responses that parsed as JSON are worth caching
+    await store_cached_response(prompt_text, cache_key, static_response, mode)
 
     # Build final response
-    response = {"success": "true", "data": static_response}
+    return {"success": "true", "data": static_response}
+
+
+async def resolve_prompt(prompt_text, route="/prompt", mode=DEFAULT_LATENCY_MODE):
+    """
+    Answers a user request from the caches or a (coalesced) LLM generation.
+
+    The route is only used to attribute LLM usage; mode picks the latency preset.
+
+    Returns:
+        The /prompt payload and its HTTP status code.
+    """
+    # Serve repeated prompts without another LLM round trip
+    cache_key = prompt_cache_key(prompt_text, mode)
+    cached = await lookup_cached_response(prompt_text, cache_key, mode)
+    if cached is not None:
+        return {"success": "true", "data": cached}, 200
+
+    # Identical prompts already being generated share that generation
+    try:
+        response = await single_flight.do(cache_key, lambda: generate_ui(prompt_text, cache_key, route, mode))
+    except LLMError as e:
+        print(f"LLM error: {type(e).__name__}: {e}")
+        if isinstance(e, DeadlineExceededError):
+            deadline_stats["expired"] += 1
+        return llm_error_response(e)
+    return response, 200
+
+
+@app.post("/prompt")
+async def receive_prompt(request: Request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    print("type : " ,type(data))
+    prompt_text = data.get("prompt")
+    log_request("/prompt [POST]", data)
+    # "fast", "balanced" or "quality"; see LATENCY_MODES
+    mode = data.get("mode") or DEFAULT_LATENCY_MODE
+    if mode not in LATENCY_MODES:
+        return JSONResponse(content=unknown_mode_response(mode), status_code=400)
+
+    # Stop generating once the deadline passes or the client leaves
+    with deadline_scope(request_timeout(request)):
+        outcome = await cancel_on_disconnect(request, resolve_prompt(prompt_text, mode=mode))
+    if outcome is None:
+        return client_gone_response()
+    response, status_code = outcome
 
     # Log and return
     log_response(response)
+    return JSONResponse(content=response, status_code=status_code)
+
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+@app.post("/prompt/batch")
+async def receive_prompt_batch(request: Request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    prompts = data.get("prompts") or []
+    if not isinstance(prompts, list):
+        log_request("/prompt/batch [POST]", {"prompts": prompts})
+        return JSONResponse(content={"success": "false", "error": "'prompts' must be a list"}, status_code=400)
+    log_request("/prompt/batch [POST]", {"prompts": len(prompts), "concurrency": data.get("concurrency")})
+
+    mode = data.get("mode") or DEFAULT_LATENCY_MODE
+    if mode not in LATENCY_MODES:
+        return JSONResponse(content=unknown_mode_response(mode), status_code=400)
+
+    try:
+        concurrency = int(data.get("concurrency") or BATCH_MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        return JSONResponse(
+            content={"success": "false", "error": "'concurrency' must be an integer"}, status_code=400
+        )
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    # One deadline for the whole batch; items still waiting for a slot when it passes are dropped
+    timeout = request_timeout(request)
+
+    async def run_item(index, prompt_text):
+        if not isinstance(prompt_text, str) or not prompt_text.strip():
+            return {"index": index, "success": "false", "error": "Prompt must be a non-empty string"}
+        async with semaphore:
+            try:
+                response, status_code = await resolve_prompt(prompt_text, route="/prompt/batch", mode=mode)
+            except Exception as e:
+                print(f"Batch item {index} failed: {e}")
+                response, status_code = {"success": "false", "error": str(e)}, 500
+        return {"index": index, "prompt": prompt_text, "status_code": status_code, **response}
+
+    async def ndjson_stream():
+        # Each item task takes the deadline along from here
+        with deadline_scope(timeout):
+            tasks = [asyncio.ensure_future(run_item(i, p)) for i, p in enumerate(prompts)]
+        try:
+            # One line per item, in completion order
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                log_response({"batch_index": item["index"], "success": item["success"]})
+                yield json.dumps(item) + "\n"
+        finally:
+            # Client went away: stop the items that have not finished
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+
+@app.post("/prompt/stream")
+async def receive_prompt_stream(request: Request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    prompt_text = data.get("prompt")
+    log_request("/prompt/stream [POST]", data)
+    if not isinstance(prompt_text, str) or not prompt_text.strip():
+        return JSONResponse(content={"success": "false", "error": "Prompt must be a non-empty string"}, status_code=400)
+    mode = data.get("mode") or DEFAULT_LATENCY_MODE
+    if mode not in LATENCY_MODES:
+        return JSONResponse(content=unknown_mode_response(mode), status_code=400)
+    cache_key = prompt_cache_key(prompt_text, mode)
+    timeout = request_timeout(request)
+
+    async def event_stream():
+        # Starlette stops iterating when the client disconnects; the deadline covers the rest
+        with deadline_scope(timeout):
+            try:
+                cached = await lookup_cached_response(prompt_text, cache_key, mode)
+                if cached is not None:
+                    response = {"success": "true", "data": cached}
+                    log_response(response)
+                    yield sse_event(response, event="done")
+                    return
+
+                chunks = []
+                usage = None
+                service = await aget_llm_service(mode)
+                # Forward every chunk as soon as the LLM yields it
+                try:
+                    async for chunk in iterate_in_threadpool(
+                        service.stream_response(build_user_prompt(prompt_text), system_prompt=combined_data)
+                    ):
+                        if isinstance(chunk, LLMResponse):
+                            usage = chunk
+                        if not chunk:
+                            continue
+                        chunks.append(chunk)
+                        yield sse_event({"chunk": chunk})
+                except LLMError as e:
+                    print(f"LLM error: {type(e).__name__}: {e}")
+                    response, _ = llm_error_response(e)
+                    log_response(response)
+                    yield sse_event(response, event="error")
+                    return
+
+                result = "".join(chunks)
+                # The usage of a stream arrives with its last chunk
+                usage_tracker.record("/prompt/stream", TEMPLATE_LABEL, usage if usage is not None else result, mode)
+                try:
+                    static_response_dict = json.loads(strip_json_fence(result))
+                except json.JSONDecodeError as e:
+                    print(f"JSON decode error: {e}")
+                    yield sse_event({
+                        "success": "false",
+                        "error": "Failed to parse LLM response as JSON",
+                        "raw_response": result
+                    }, event="error")
+                    return
+
+                static_response = json.dumps(static_response_dict)
+                await store_cached_response(prompt_text, cache_key, static_response, mode)
+                response = {"success": "true", "data": static_response}
+                log_response(response)
+                yield sse_event(response, event="done")
+            except Exception as e:
+                # Past this point the status is already 200: report the failure in-band
+                print(f"Stream failed: {type(e).__name__}: {e}")
+                response = {"success": "false", "error": str(e)}
+                log_response(response)
+                yield sse_event(response, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    log_request("/cache/stats [GET]", {})
+    response = {
+        "status": "success",
+        "cache": response_cache.stats(),
+        "similarity_cache": similarity_cache.stats(),
+        "persistent_cache": await asyncio.to_thread(persistent_cache.stats),
+        "single_flight": single_flight.stats()
+    }
+    log_response(response)
+    return JSONResponse(content=response)
+
+
+@app.post("/cache/purge")
+async def cache_purge():
+    log_request("/cache/purge [POST]", {})
+    purged = response_cache.purge() + similarity_cache.purge() + await asyncio.to_thread(persistent_cache.purge)
+    response = {"status": "success", "purged": purged}
+    log_response(response)
+    return JSONResponse(content=response)
+
+@app.get("/llm/stats")
+async def llm_stats():
+    log_request("/llm/stats [GET]", {})
+    # Reporting must not trigger a build; None means not initialized yet
+    modes = {}
+    for mode, preset in LATENCY_MODES.items():
+        service = llm_services.get(mode)
+        packer = prompt_packers.get(mode)
+        planner = section_planners.get(mode)
+        modes[mode] = {
+            "initialized": service is not None,
+            "model": getattr(service, "model_name", model_label(mode)),
+            "preset": {key: value for key, value in preset.items() if key != "models"},
+            "backends": service.stats() if hasattr(service, "stats") else None,
+            "packing": packer.stats() if packer else None,
+            "sections": planner.stats() if planner else None
+        }
+    response = {
+        "status": "success",
+        "default_mode": DEFAULT_LATENCY_MODE,
+        "modes": modes,
+        "deadlines": dict(deadline_stats)
+    }
+    log_response(response)
+    return JSONResponse(content=response)
+
+@app.get("/llm/usage")
+async def llm_usage():
+    log_request("/llm/usage [GET]", {})
+    response = {"status": "success", **usage_tracker.stats()}
+    log_response(response)
     return JSONResponse(content=response)
 
+#======================================
+#asynchronous jobs
+from job_queue import JobQueue, start_workers
+job_queue = JobQueue(
+    os.getenv("JOB_QUEUE_DB", str(CURRENT_DIR / "jobs.sqlite3")),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60"))
+)
+# 0 leaves generation to separate `python main_server.py worker` processes
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_WAIT_MAX = float(os.getenv("JOB_WAIT_MAX", "60"))
+
+async def resolve_job_prompt(prompt_text, timeout=None):
+    """
+    Job handler: resolve_prompt with usage attributed to /jobs, within what
+    is left of the job's deadline.
+    """
+    with deadline_scope(timeout):
+        return await resolve_prompt(prompt_text, route="/jobs", mode=DEFAULT_LATENCY_MODE)
+#======================================
+
 
+@app.post("/jobs")
+async def create_job(request: Request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    log_request("/jobs [POST]", data)
+    prompt_text = data.get("prompt")
+    if not isinstance(prompt_text, str) or not prompt_text.strip():
+        return JSONResponse(content={"success": "false", "error": "Prompt must be a non-empty string"}, status_code=400)
+
+    # Jobs have no deadline unless the client sends one
+    # SQLite may wait on another worker's write lock; keep that off the event loop
+    job_id = await asyncio.to_thread(job_queue.submit, prompt_text, timeout=request_timeout(request, default=None))
+    response = {"success": "true", "job_id": job_id, "status": JobQueue.QUEUED}
+    log_response(response)
+    return JSONResponse(content=response, status_code=202)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    log_request(f"/jobs/{job_id} [GET]", {})
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return JSONResponse(content={"success": "false", "error": "Unknown job id"}, status_code=404)
+    return JSONResponse(content={"success": "true", "job": job})
+
+
+@app.get("/jobs/{job_id}/wait")
+async def wait_job(job_id: str, timeout: float = 30.0):
+    log_request(f"/jobs/{job_id}/wait [GET]", {"timeout": timeout})
+    deadline = time.monotonic() + max(0.0, min(timeout, JOB_WAIT_MAX))
+    while True:
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job is None:
+            return JSONResponse(content={"success": "false", "error": "Unknown job id"}, status_code=404)
+        if job["status"] in (JobQueue.DONE, JobQueue.FAILED) or time.monotonic() >= deadline:
+            return JSONResponse(content={"success": "true", "job": job})
+        await asyncio.sleep(0.25)
+
+
+@app.get("/jobs")
+async def job_stats():
+    log_request("/jobs [GET]", {})
+    response = {"success": "true", "jobs": await asyncio.to_thread(job_queue.stats)}
+    log_response(response)
+    return JSONResponse(content=response)
 
 
 HTML_FILE_PATH = "./UI.html"  # <-- replace this with your HTML file path
@@ -135,7 +980,19 @@ async def root():
         return JSONResponse(content=response, status_code=404)
 
 
-if __name__ == "__main__":
+async def run_job_workers():
+    """
+    Runs generation workers without the HTTP server.
+    """
+    count = max(1, JOB_WORKERS)
+    await asyncio.to_thread(initialize_services)
+    print(f"[JOBS] running {count} standalone job workers on {job_queue.path}")
+    await asyncio.gather(*start_workers(job_queue, resolve_job_prompt, count, name="standalone"))
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["worker"]:
+    asyncio.run(run_job_workers())
+elif __name__ == "__main__":
     # Host/port from env with defaults
     host = os.getenv("PROMPT_HOST", "127.0.0.1")
     port = int(os.getenv("MAIN_SERVICE", "8000"))
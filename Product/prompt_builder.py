@@ -1,4 +1,6 @@
+import math
 import os
+import re
 
 def concatenate_files(file1_name: str, file2_name: str) -> str:
     """
@@ -43,4 +45,188 @@ def concatenate_files(file1_name: str, file2_name: str) -> str:
 
     # 3. Concatenate and return
     # A newline is added between contents to clearly separate the data from the two files.
-    return content1 + "\n\n" + content2
\ No newline at end of file
+    return content1 + "\n\n" + content2
+
+def build_packed_prompt(requests: dict, instructions: str = "") -> str:
+    """
+    Builds one prompt that asks for a separate schema per user request.
+
+    The model is told to answer with a single JSON object of the form
+    {"results": [{"id": <request id>, "schema": {...}}, ...]} so the
+    combined answer can be split back into one schema per request.
+
+    Args:
+        requests: Mapping of request id to user prompt text.
+        instructions: The shared instruction block (e.g. combined_data); leave
+            empty when it is sent separately as the system prompt.
+
+    Returns:
+        The packed prompt string.
+    """
+    lines = ["MULTIPLE USER REQUESTS (answer each one independently, as if it were the only request):"]
+    for request_id, prompt_text in requests.items():
+        lines.append(f"REQUEST {request_id} : {prompt_text}")
+
+    footer = (
+        "\n\nPACKED RESPONSE FORMAT (overrides the single-object rule of the instructions):\n"
+        "Return ONE JSON object of the form "
+        '{"results": [{"id": "<request id>", "schema": <the JSON object you would return for that request alone>}]}'
+        " with exactly one entry per request id listed above. Do not merge requests."
+    )
+    return "\n".join(lines) + "\n" + instructions + footer
+
+# Requests that tend to need the strongest model even when they are short
+COMPLEX_UI_KEYWORDS = (
+    "dashboard", "chart", "graph", "table", "spreadsheet", "calendar", "game", "editor",
+    "drag", "animation", "tabs", "wizard", "multi-step", "multiple pages", "api", "fetch",
+    "filter", "sort", "pagination", "validation", "localstorage", "timer",
+)
+
+def is_complex_prompt(prompt_text: str, max_words: int = 40, max_features: int = 4) -> bool:
+    """
+    Cheap heuristic for whether a UI request is too involved for a fast model.
+
+    A request is complex when it is long, lists many separate features, or
+    asks for something from COMPLEX_UI_KEYWORDS. For a section prompt (see
+    build_section_prompt) only the section itself is judged.
+
+    Args:
+        prompt_text: The user request, with or without the "USER REQUEST :" prefix.
+        max_words: Requests with more words than this are complex.
+        max_features: Requests listing at least this many features are complex.
+
+    Returns:
+        True if the request should go to the strongest model.
+    """
+    text = prompt_text.lower()
+    if SECTION_MARKER.lower() in text:
+        # "...SECTION 2 OF 3 : a pricing panel\n<instructions>"
+        text = text.split(SECTION_MARKER.lower(), 1)[1].split(":", 1)[-1].split("\n", 1)[0]
+    elif "user request :" in text:
+        text = text.split("user request :", 1)[1]
+    words = text.split()
+    if len(words) > max_words:
+        return True
+    # Every list separator roughly adds one more feature to build
+    features = 1 + sum(text.count(separator) for separator in (",", ";", "\n", " and ", " with ", " plus "))
+    if features >= max_features:
+        return True
+    return any(keyword in text for keyword in COMPLEX_UI_KEYWORDS)
+
+CONTINUATION_MARKER = "\n\nYOUR PREVIOUS ANSWER WAS CUT OFF BY THE OUTPUT LIMIT. IT ENDED HERE:\n"
+
+def build_continuation_prompt(prompt: str, partial: str) -> str:
+    """
+    Builds the prompt that asks the model to resume a cut-off answer.
+
+    The original prompt is repeated so the model has the same request, and
+    the whole partial answer is included so ids and functions stay consistent.
+
+    Args:
+        prompt: The prompt whose answer was cut off.
+        partial: The answer generated so far.
+
+    Returns:
+        The continuation prompt string.
+    """
+    return (
+        prompt + CONTINUATION_MARKER + partial + "\n<<<CUT>>>\n"
+        "Continue from the exact character where the answer stopped (marked <<<CUT>>>). "
+        "Output only the remaining text, so that appending it to the answer above gives the "
+        "complete JSON. Do not repeat anything, do not restart, and do not use code fences."
+    )
+
+def split_continuation_prompt(prompt: str):
+    """
+    Inverse of build_continuation_prompt, for simulated backends.
+
+    Returns:
+        (original prompt, partial answer), or None for any other prompt.
+    """
+    if CONTINUATION_MARKER not in prompt:
+        return None
+    original, rest = prompt.split(CONTINUATION_MARKER, 1)
+    return original, rest.rsplit("\n<<<CUT>>>\n", 1)[0]
+
+# Nouns that name a region of the page, or a self-contained widget, rather
+# than a feature. Only requests listing nothing but such parts are split: a
+# form's fields or a calculator's operations share state and must be
+# generated together, while a comments list and a post form do not.
+PAGE_SECTION_WORDS = {
+    "header", "navbar", "nav", "navigation", "sidebar", "footer", "banner", "hero",
+    "panel", "page", "section", "tab", "pane", "column",
+}
+WIDGET_SECTION_WORDS = {"list", "feed", "form", "stats", "chart", "graph", "table", "gallery"}
+
+def _names_page_section(part: str) -> bool:
+    words = re.findall(r"[a-z]+", part.lower())
+    if not words:
+        return False
+    last = words[-1]
+    names = PAGE_SECTION_WORDS | WIDGET_SECTION_WORDS
+    return last in names or last.rstrip("s") in names
+
+def split_ui_sections(prompt_text: str, max_sections: int = 4) -> list:
+    """
+    Cheap planner: splits a UI request into page-level sections that can be
+    generated independently.
+
+    "landing page with a header, a pricing panel and a footer" becomes
+    ["a header", "a pricing panel", "a footer"]; the subject before "with"
+    is left to the full request each section prompt repeats. A request is
+    only split when every listed part names a page region or a
+    self-contained widget (see PAGE_SECTION_WORDS and WIDGET_SECTION_WORDS):
+    "dashboard with comments list, a post form and stats panel" is split,
+    "contact form with name, email and message" stays one section.
+
+    Args:
+        prompt_text: The user request, with or without the "USER REQUEST :" prefix.
+        max_sections: Neighbouring parts are grouped to stay within this many sections.
+
+    Returns:
+        The section descriptions; a single section (the whole request) when
+        it is not split.
+    """
+    text = prompt_text
+    if "user request :" in text.lower():
+        text = text[text.lower().index("user request :") + len("user request :"):]
+    text = text.strip()
+    parts = re.split(r"\s+with\s+", text, maxsplit=1, flags=re.IGNORECASE)
+    listed = parts[-1]
+    sections = [
+        part.strip(" .")
+        for part in re.split(r"\s*(?:,|;|\n|\band\b|\bplus\b)\s*", listed, flags=re.IGNORECASE)
+        if part.strip(" .")
+    ]
+    if len(sections) < 2 or not all(_names_page_section(section) for section in sections):
+        return [text]
+    size = math.ceil(len(sections) / max_sections)
+    return [", ".join(sections[i:i + size]) for i in range(0, len(sections), size)]
+
+SECTION_MARKER = "\n\nSECTION "
+
+def build_section_prompt(prompt_text: str, section: str, index: int, count: int) -> str:
+    """
+    Builds the prompt for one section of a split UI request.
+
+    The whole request is repeated for context. Ids are prefixed per section
+    so the merged schema rarely needs renaming.
+
+    Args:
+        prompt_text: The full user request.
+        section: The section to build (see split_ui_sections).
+        index: Position of the section, from 0.
+        count: Number of sections the request was split into.
+
+    Returns:
+        The section prompt string.
+    """
+    prefix = f"s{index + 1}_"
+    return (
+        f"USER REQUEST : {prompt_text}{SECTION_MARKER}{index + 1} OF {count} : {section}\n"
+        "The request is generated in separate sections that are combined afterwards. "
+        "Return the schema for this section only: its own functions, elements and css, "
+        "not the rest of the UI. "
+        f'Start every function_id and element id with "{prefix}", and scope css selectors '
+        "to this section's ids or classes."
+    )
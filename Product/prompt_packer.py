@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import functools
+import json
+import time
+
+from llm_service import (
+    DeadlineExceededError, LLMInterface, LLMResponse, deadline_scope, response_schema_scope, time_remaining
+)
+
+
+class PromptPacker:
+    """
+    Packs several small concurrent prompts into a single LLM generation.
+
+    Prompts submitted within a short collection window are sent together with
+    one copy of the shared instructions, and the model answers with one schema
+    per request id. Items that are missing or fail validation in the packed
+    answer fall back to an individual call, as does the whole batch if the
+    packed call itself fails.
+
+    Every prompt keeps the request deadline it was submitted with. Prompts
+    whose deadline passes while they wait for the batch are dropped, as are
+    prompts whose caller went away, and the packed call may run until the
+    latest deadline in the batch.
+    """
+
+    def __init__(self, llm: LLMInterface, build_prompt, build_packed_prompt, parse,
+                 window: float = 0.05, max_batch: int = 4, validate=None, system_prompt: str = None,
+                 packed_schema: dict = None):
+        """
+        Args:
+            llm: The LLMInterface generations are sent to.
+            build_prompt: Callable(prompt_text) -> full prompt for an individual call.
+            build_packed_prompt: Callable({id: prompt_text}) -> packed prompt.
+            parse: Callable(raw_text) -> parsed JSON; raises ValueError on bad JSON.
+            window: Seconds to wait for more prompts after the first one arrives.
+            max_batch: Maximum prompts per packed call; a full batch is sent at once.
+            validate: Callable(schema) -> bool applied to every unpacked schema.
+            system_prompt: Static instructions sent as the system prompt of every call.
+            packed_schema: Response schema of packed calls, for backends built
+                with the single-answer schema (see response_schema_scope).
+        """
+        self.llm = llm
+        self.build_prompt = build_prompt
+        self.build_packed_prompt = build_packed_prompt
+        self.parse = parse
+        self.window = window
+        self.max_batch = max_batch
+        self.validate = validate or (lambda schema: isinstance(schema, dict))
+        self.system_prompt = system_prompt
+        self.packed_schema = packed_schema
+        self._pending = []
+        self._timer = None
+        # Running batches; the loop itself only keeps weak references to tasks
+        self._tasks = set()
+        self.packed_calls = 0
+        self.packed_items = 0
+        self.individual_calls = 0
+        self.fallbacks = 0
+        self.expired = 0
+        self.abandoned = 0
+
+    async def submit(self, prompt_text: str) -> str:
+        """
+        Queues a prompt for the next packed call and waits for its answer.
+
+        Returns:
+            The raw JSON text of this prompt's schema.
+        """
+        future = asyncio.get_running_loop().create_future()
+        remaining = time_remaining()
+        deadline = None if remaining is None else time.monotonic() + remaining
+        self._pending.append((prompt_text, future, deadline))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+
+        return await future
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Started in an empty context: the batch applies its own deadlines,
+            # not the one of whichever request triggered the flush
+            task = contextvars.Context().run(asyncio.ensure_future, self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(functools.partial(self._batch_done, batch))
+
+    def _batch_done(self, batch, task: asyncio.Task) -> None:
+        """
+        Forgets a finished batch task. If it crashed, its waiters get the error
+        instead of waiting forever.
+        """
+        self._tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        print(f"[PACKER] batch of {len(batch)} prompts crashed: {type(error).__name__}: {error}")
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    @staticmethod
+    def _seconds_left(deadline):
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _drop_expired(self, batch) -> list:
+        """
+        Fails the prompts whose deadline passed while queued, drops those
+        whose caller was cancelled (e.g. the client left) and returns the rest.
+        """
+        live = []
+        for prompt_text, future, deadline in batch:
+            if future.cancelled():
+                self.abandoned += 1
+            elif deadline is not None and deadline <= time.monotonic():
+                self.expired += 1
+                if not future.done():
+                    future.set_exception(DeadlineExceededError("Request deadline passed while waiting to be packed."))
+            else:
+                live.append((prompt_text, future, deadline))
+        return live
+
+    async def _individual(self, prompt_text: str, future: asyncio.Future, deadline: float = None) -> None:
+        self.individual_calls += 1
+        try:
+            with deadline_scope(self._seconds_left(deadline)):
+                result = await self.llm.aget_response(self.build_prompt(prompt_text), system_prompt=self.system_prompt)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def _run_batch(self, batch) -> None:
+        batch = self._drop_expired(batch)
+        if not batch:
+            return
+        if len(batch) == 1:
+            await self._individual(*batch[0])
+            return
+
+        requests = {f"r{index}": prompt_text for index, (prompt_text, _, _) in enumerate(batch)}
+        deadlines = [deadline for _, _, deadline in batch]
+        # The packed answer is still useful until the last of its requests gives up
+        latest = None if None in deadlines else max(deadlines)
+        self.packed_calls += 1
+        self.packed_items += len(batch)
+
+        schemas = {}
+        try:
+            with deadline_scope(self._seconds_left(latest)), response_schema_scope(self.packed_schema):
+                raw = await self.llm.aget_response(self.build_packed_prompt(requests), system_prompt=self.system_prompt)
+            packed = self.parse(raw)
+            for item in packed.get("results", []):
+                if isinstance(item, dict) and "id" in item:
+                    schemas[str(item["id"])] = item.get("schema")
+        except Exception as e:
+            print(f"[PACKER] packed call for {len(batch)} prompts failed, falling back: {e}")
+
+        fallbacks = []
+        for index, (prompt_text, future, deadline) in enumerate(batch):
+            if future.cancelled():
+                # The caller left during the packed call: no fallback for it
+                self.abandoned += 1
+                continue
+            schema = schemas.get(f"r{index}")
+            if schema is not None and self.validate(schema):
+                if not future.done():
+                    text = json.dumps(schema)
+                    # Each packed answer carries its share of the call's usage
+                    future.set_result(raw.share(text, len(batch)) if isinstance(raw, LLMResponse) else text)
+            else:
+                fallbacks.append(self._individual(prompt_text, future, deadline))
+
+        if fallbacks:
+            self.fallbacks += len(fallbacks)
+            await asyncio.gather(*fallbacks)
+
+    def stats(self) -> dict:
+        """
+        Returns packing counters; schemas_per_call is the quota efficiency.
+        """
+        calls = self.packed_calls + self.individual_calls
+        served = self.packed_items - self.fallbacks + self.individual_calls
+        return {
+            "packed_calls": self.packed_calls,
+            "packed_items": self.packed_items,
+            "individual_calls": self.individual_calls,
+            "fallbacks": self.fallbacks,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+            "schemas_per_call": served / calls if calls else 0.0,
+        }
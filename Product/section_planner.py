@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+from llm_service import LLMInterface, LLMResponse
+
+
+class SectionPlanner:
+    """
+    Generates a large UI request as independent sections in parallel.
+
+    The plan callable splits the request into sections, each section is
+    generated by its own concurrent call, and the section schemas are merged
+    into one. A single long generation becomes several short ones, so the
+    latency approaches that of the slowest section instead of the sum.
+
+    Requests the plan does not split are left to the caller. If any section
+    fails or does not validate, the whole request is generated in one call
+    instead, since a UI with a missing section is not a usable answer.
+    """
+
+    def __init__(self, llm: LLMInterface, plan, build_section_prompt, build_prompt, parse, merge,
+                 validate=None, system_prompt: str = None):
+        """
+        Args:
+            llm: The LLMInterface generations are sent to.
+            plan: Callable(prompt_text) -> list of section descriptions; fewer
+                than two means the request is not split.
+            build_section_prompt: Callable(prompt_text, section, index, count) -> section prompt.
+            build_prompt: Callable(prompt_text) -> full prompt for the one-call fallback.
+            parse: Callable(raw_text) -> parsed JSON; raises ValueError on bad JSON.
+            merge: Callable(list of section schemas) -> merged schema.
+            validate: Callable(schema) -> bool applied to every section schema.
+            system_prompt: Static instructions sent as the system prompt of every call.
+        """
+        self.llm = llm
+        self.plan = plan
+        self.build_section_prompt = build_section_prompt
+        self.build_prompt = build_prompt
+        self.parse = parse
+        self.merge = merge
+        self.validate = validate or (lambda schema: isinstance(schema, dict))
+        self.system_prompt = system_prompt
+        self.planned = 0
+        self.sections = 0
+        self.fallbacks = 0
+
+    async def generate(self, prompt_text: str):
+        """
+        Generates the request section by section if the plan splits it.
+
+        Returns:
+            The raw JSON text of the merged schema (an LLMResponse carrying
+            the usage of all section calls when the backend reports it), or
+            None when the request is not split and the caller should make
+            its usual call.
+        """
+        sections = self.plan(prompt_text)
+        if len(sections) < 2:
+            return None
+        self.planned += 1
+        self.sections += len(sections)
+        print(f"[PLANNER] generating {len(sections)} sections in parallel: {sections}")
+
+        results = await asyncio.gather(
+            *(
+                self.llm.aget_response(
+                    self.build_section_prompt(prompt_text, section, index, len(sections)),
+                    system_prompt=self.system_prompt
+                )
+                for index, section in enumerate(sections)
+            ),
+            return_exceptions=True
+        )
+        schemas = []
+        for section, result in zip(sections, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            try:
+                if isinstance(result, BaseException):
+                    raise result
+                schema = self.parse(result)
+            except Exception as e:
+                print(f"[PLANNER] section {section!r} failed, generating in one call: {e}")
+                break
+            if not self.validate(schema):
+                print(f"[PLANNER] section {section!r} is not a valid schema, generating in one call")
+                break
+            schemas.append(schema)
+        else:
+            text = json.dumps(self.merge(schemas))
+            return LLMResponse.combine(text, results, concurrent=True)
+
+        self.fallbacks += 1
+        result = await self.llm.aget_response(self.build_prompt(prompt_text), system_prompt=self.system_prompt)
+        # The discarded sections still cost tokens and time
+        spent = LLMResponse.combine("", [r for r in results if isinstance(r, str)], concurrent=True)
+        return LLMResponse.combine(result, [spent, result])
+
+    def stats(self) -> dict:
+        """
+        Returns planning counters.
+        """
+        return {
+            "planned": self.planned,
+            "sections": self.sections,
+            "fallbacks": self.fallbacks,
+            "sections_per_request": self.sections / self.planned if self.planned else 0.0,
+        }
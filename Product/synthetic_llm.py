@@ -0,0 +1,347 @@
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import Iterator
+
+from llm_service import (
+    ContextCache, DeadlineExceededError, LLMInterface, LLMResponse, LLMServerError,
+    LLMTimeoutError, LocalContextCache, RateLimitedError, clip_to_deadline, estimate_tokens,
+    free_text_requested
+)
+from prompt_builder import split_continuation_prompt
+
+
+# Built-in corpus of valid schemas, matched to prompts by keyword
+SCHEMA_CORPUS = {
+    "calculator": {
+        "functions": [
+            {"function_id": "parse_num", "params": [{"name": "x", "type": "string"}], "logic": "return Number(x);"},
+            {"function_id": "mul", "params": [{"name": "a", "type": "number"}, {"name": "b", "type": "number"}], "logic": "return a * b;"},
+            {"function_id": "calc", "params": [], "logic": "const a = await ALL_FUNCTIONS['parse_num'](document.getElementById('A').value); const b = await ALL_FUNCTIONS['parse_num'](document.getElementById('B').value); document.getElementById('result').textContent = await ALL_FUNCTIONS['mul'](a, b);"}
+        ],
+        "elements": [
+            {"type": "input", "id": "A", "attributes": {"placeholder": "A"}},
+            {"type": "input", "id": "B", "attributes": {"placeholder": "B"}},
+            {"type": "button", "text": "Compute", "events": [{"event": "click", "function_id": "calc", "params": []}]},
+            {"type": "p", "id": "result", "text": ""}
+        ],
+        "css": [{"selector": "button", "rules": "padding: 8px 12px;"}]
+    },
+    "login": {
+        "functions": [
+            {"function_id": "login", "params": [], "logic": "const user = document.getElementById('username').value; document.getElementById('status').textContent = 'Welcome ' + user;"}
+        ],
+        "elements": [
+            {"type": "input", "id": "username", "attributes": {"placeholder": "Username"}},
+            {"type": "input", "id": "password", "attributes": {"placeholder": "Password", "type": "password"}},
+            {"type": "button", "text": "Login", "events": [{"event": "click", "function_id": "login", "params": []}]},
+            {"type": "p", "id": "status", "text": ""}
+        ],
+        "css": [{"selector": "input", "rules": "display: block; margin: 4px 0;"}]
+    },
+    "counter": {
+        "functions": [
+            {"function_id": "change", "params": [{"name": "delta", "type": "number"}], "logic": "const el = document.getElementById('count'); el.textContent = Number(el.textContent) + delta;"}
+        ],
+        "elements": [
+            {"type": "h1", "id": "count", "text": "0"},
+            {"type": "button", "text": "+", "events": [{"event": "click", "function_id": "change", "params": [{"source": "literal", "value": 1, "type": "number"}]}]},
+            {"type": "button", "text": "-", "events": [{"event": "click", "function_id": "change", "params": [{"source": "literal", "value": -1, "type": "number"}]}]}
+        ],
+        "css": [{"selector": "#count", "rules": "font-size: 32px;"}]
+    },
+    "todo": {
+        "functions": [
+            {"function_id": "add_todo", "params": [], "logic": "const input = document.getElementById('todo_input'); const li = document.createElement('li'); li.textContent = input.value; document.getElementById('todo_list').appendChild(li); input.value = '';"}
+        ],
+        "elements": [
+            {"type": "input", "id": "todo_input", "attributes": {"placeholder": "New task"}},
+            {"type": "button", "text": "Add", "events": [{"event": "click", "function_id": "add_todo", "params": []}]},
+            {"type": "ul", "id": "todo_list", "children": []}
+        ],
+        "css": [{"selector": "#todo_list li", "rules": "padding: 2px 0;"}]
+    },
+}
+
+DEFAULT_SCHEMA = {
+    "functions": [
+        {"function_id": "say_hi", "params": [], "logic": "document.getElementById('out').textContent = 'hi';"}
+    ],
+    "elements": [
+        {"type": "button", "text": "Say hi", "events": [{"event": "click", "function_id": "say_hi", "params": []}]},
+        {"type": "p", "id": "out", "text": ""}
+    ],
+    "css": [{"selector": "button", "rules": "padding: 8px 12px;"}]
+}
+
+
+class SyntheticLLM(LLMInterface):
+    """
+    Simulated LLM backend for reproducing production behaviour locally.
+
+    Every call samples a time-to-first-token from the configured latency
+    distribution plus the time to read the uncached input, then "generates"
+    the response at tokens_per_second. A system prompt registered in the
+    context cache costs no input time.
+    Errors, timeouts and malformed JSON are injected at the configured rates:
+    cut-off JSON that a continuation can finish, and complete but broken JSON
+    (a mismatched bracket or trailing prose) that it cannot.
+    Responses come from SCHEMA_CORPUS, picked by keywords in the prompt.
+    With a response_schema (structured output) the JSON is never fenced or
+    wrapped in prose, but it can still be cut off or broken. A continuation prompt
+    (prompt_builder.build_continuation_prompt) gets the rest of the corpus
+    answer it continues. A call that would outlive
+    the request deadline waits until the deadline and then fails, like a real
+    per-call HTTP timeout.
+    """
+
+    def __init__(self, model_name: str = "synthetic", latency: str = "lognormal",
+                 latency_ms: float = 800.0, sigma: float = 0.6, slow_ms: float = 8000.0,
+                 slow_probability: float = 0.05, tokens_per_second: float = 200.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 timeout_rate: float = 0.0, timeout_seconds: float = 30.0,
+                 malformed_rate: float = 0.0, invalid_rate: float = 0.0, fence_rate: float = 0.3,
+                 prose_rate: float = 0.0, seed: int = None, prefill_tokens_per_second: float = 20000.0,
+                 context_cache: ContextCache = None, response_schema: dict = None):
+        """
+        Args:
+            model_name: Name reported as model_name.
+            latency: Time-to-first-token distribution: "fixed", "lognormal" or "bimodal".
+            latency_ms: Fixed latency, lognormal median, or the fast mode of bimodal.
+            sigma: Lognormal shape; larger values give a longer tail.
+            slow_ms: Slow mode of the bimodal distribution.
+            slow_probability: Probability of the slow mode in bimodal.
+            tokens_per_second: Output generation speed, also the streaming rate.
+            error_rate: Probability of an LLMServerError.
+            rate_limit_rate: Probability of a RateLimitedError.
+            timeout_rate: Probability of hanging timeout_seconds, then LLMTimeoutError.
+            timeout_seconds: How long an injected timeout hangs.
+            malformed_rate: Probability of returning truncated, unparseable JSON.
+            invalid_rate: Probability of a complete answer (finish reason
+                STOP) whose JSON is broken by a mismatched closing bracket or
+                trailing prose.
+            fence_rate: Probability of wrapping the JSON in a ```json fence.
+            prose_rate: Probability of chatty text around the JSON, which no
+                fence stripping can parse.
+            seed: Optional random seed for reproducible runs.
+            prefill_tokens_per_second: Input reading speed for uncached tokens.
+            context_cache: Optional ContextCache for system prompts.
+            response_schema: Optional response schema; its presence simulates
+                structured output.
+        """
+        if latency not in ("fixed", "lognormal", "bimodal"):
+            raise ValueError("latency must be 'fixed', 'lognormal' or 'bimodal'.")
+
+        self.model_name = model_name
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.slow_ms = slow_ms
+        self.slow_probability = slow_probability
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.malformed_rate = malformed_rate
+        self.invalid_rate = invalid_rate
+        self.fence_rate = fence_rate
+        self.prose_rate = prose_rate
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.context_cache = context_cache
+        self.response_schema = response_schema
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.injected = {"error": 0, "rate_limit": 0, "timeout": 0, "malformed": 0, "invalid": 0, "prose": 0}
+
+    @classmethod
+    def from_env(cls, model_name: str = "synthetic", response_schema: dict = None) -> "SyntheticLLM":
+        """
+        Builds a SyntheticLLM from SYNTH_* environment variables.
+        """
+        seed = os.getenv("SYNTH_SEED")
+        return cls(
+            model_name=model_name,
+            latency=os.getenv("SYNTH_LATENCY", "lognormal"),
+            latency_ms=float(os.getenv("SYNTH_LATENCY_MS", "800")),
+            sigma=float(os.getenv("SYNTH_SIGMA", "0.6")),
+            slow_ms=float(os.getenv("SYNTH_SLOW_MS", "8000")),
+            slow_probability=float(os.getenv("SYNTH_SLOW_PROBABILITY", "0.05")),
+            tokens_per_second=float(os.getenv("SYNTH_TOKENS_PER_SECOND", "200")),
+            error_rate=float(os.getenv("SYNTH_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("SYNTH_RATE_LIMIT_RATE", "0")),
+            timeout_rate=float(os.getenv("SYNTH_TIMEOUT_RATE", "0")),
+            timeout_seconds=float(os.getenv("SYNTH_TIMEOUT_SECONDS", "30")),
+            malformed_rate=float(os.getenv("SYNTH_MALFORMED_RATE", "0")),
+            invalid_rate=float(os.getenv("SYNTH_INVALID_RATE", "0")),
+            fence_rate=float(os.getenv("SYNTH_FENCE_RATE", "0.3")),
+            prose_rate=float(os.getenv("SYNTH_PROSE_RATE", "0")),
+            seed=int(seed) if seed else None,
+            prefill_tokens_per_second=float(os.getenv("SYNTH_PREFILL_TOKENS_PER_SECOND", "20000")),
+            context_cache=LocalContextCache() if os.getenv("SYNTH_CONTEXT_CACHE", "1") == "1" else None,
+            response_schema=response_schema,
+        )
+
+    def _input_tokens(self, prompt: str, system_prompt: str):
+        """
+        Returns (prompt_tokens, cached_tokens) of a call.
+        """
+        tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt or "")
+        if system_prompt and self.context_cache and self.context_cache.get(system_prompt):
+            return tokens, estimate_tokens(system_prompt)
+        return tokens, 0
+
+    def _plan(self, prompt: str, system_prompt: str = None):
+        """
+        Decides the outcome of one call.
+
+        Returns:
+            (first_token_delay, response, error) where error, if set, is raised
+            after first_token_delay instead of returning the LLMResponse.
+        """
+        with self._lock:
+            self.calls += 1
+            rng = self._random
+            if self.latency == "fixed":
+                delay = self.latency_ms
+            elif self.latency == "lognormal":
+                delay = self.latency_ms * math.exp(rng.gauss(0.0, self.sigma))
+            else:
+                delay = self.slow_ms if rng.random() < self.slow_probability else self.latency_ms
+            prompt_tokens, cached_tokens = self._input_tokens(prompt, system_prompt)
+            delay = delay / 1000.0 + (prompt_tokens - cached_tokens) / self.prefill_tokens_per_second
+
+            roll = rng.random()
+            if roll < self.timeout_rate:
+                self.injected["timeout"] += 1
+                return self.timeout_seconds, None, LLMTimeoutError("Synthetic timeout")
+            roll -= self.timeout_rate
+            if roll < self.error_rate:
+                self.injected["error"] += 1
+                return delay, None, LLMServerError("Synthetic 500 from upstream")
+            roll -= self.error_rate
+            if roll < self.rate_limit_rate:
+                self.injected["rate_limit"] += 1
+                return delay, None, RateLimitedError("Synthetic 429 quota exhausted", retry_after=1.0)
+
+            continuation = split_continuation_prompt(prompt)
+            text = json.dumps(self._pick_schema(continuation[0] if continuation else prompt))
+            if continuation is not None:
+                partial = self._unfence(continuation[1])
+                if text.startswith(partial):
+                    text = text[len(partial):]
+            finish_reason = "STOP"
+            if rng.random() < self.malformed_rate:
+                self.injected["malformed"] += 1
+                # Looks like a generation cut off by the output token limit
+                text = text[: rng.randint(1, max(1, len(text) - 1))]
+                finish_reason = "MAX_TOKENS"
+            elif self.invalid_rate and rng.random() < self.invalid_rate:
+                self.injected["invalid"] += 1
+                # Finished normally but broken: nothing to continue from
+                if rng.random() < 0.5:
+                    text = text[:-1] + "]"
+                else:
+                    text = text + "\nLet me know if you would like any changes."
+            # Structured output constrains decoding to bare JSON
+            if self.response_schema is None or free_text_requested():
+                if rng.random() < self.fence_rate:
+                    text = "```json\n" + text + "\n```"
+                if rng.random() < self.prose_rate:
+                    self.injected["prose"] += 1
+                    text = "Here is the UI schema you asked for:\n" + text
+            response = LLMResponse(
+                text,
+                model=self.model_name,
+                prompt_tokens=prompt_tokens,
+                output_tokens=estimate_tokens(text),
+                thinking_tokens=0,
+                cached_tokens=cached_tokens,
+                latency=delay + self._generation_time(text),
+                finish_reason=finish_reason
+            )
+            return delay, response, None
+
+    @staticmethod
+    def _pick_schema(prompt: str) -> dict:
+        # Only the user request counts, not the instruction block around it
+        request = prompt.lower()
+        if "user request :" in request:
+            request = request.split("user request :", 1)[1][:300]
+        for keyword, schema in SCHEMA_CORPUS.items():
+            if keyword in request:
+                return schema
+        return DEFAULT_SCHEMA
+
+    @staticmethod
+    def _unfence(text: str) -> str:
+        # Exactly the fence _plan adds, so a cut string keeps its whitespace
+        if text.startswith("```json\n"):
+            text = text[len("```json\n"):]
+        if text.endswith("\n```"):
+            text = text[:-len("\n```")]
+        return text
+
+    def _generation_time(self, text: str) -> float:
+        return estimate_tokens(text) / self.tokens_per_second
+
+    def get_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Returns a corpus schema after the simulated latency, or raises an injected error.
+        """
+        delay, response, error = self._plan(prompt, system_prompt)
+        wait, cut_short = clip_to_deadline(delay if error is not None else response.latency)
+        time.sleep(wait)
+        if cut_short:
+            raise DeadlineExceededError("Synthetic call cut off by the request deadline")
+        if error is not None:
+            raise error
+        return response
+
+    async def aget_response(self, prompt: str, system_prompt: str = None) -> str:
+        """
+        Async variant of get_response; sleeps without blocking the event loop.
+        """
+        delay, response, error = self._plan(prompt, system_prompt)
+        wait, cut_short = clip_to_deadline(delay if error is not None else response.latency)
+        await asyncio.sleep(wait)
+        if cut_short:
+            raise DeadlineExceededError("Synthetic call cut off by the request deadline")
+        if error is not None:
+            raise error
+        return response
+
+    def stream_response(self, prompt: str, system_prompt: str = None, chunk_tokens: int = 8) -> Iterator[str]:
+        """
+        Yields the response in chunks of about chunk_tokens at tokens_per_second,
+        then an empty LLMResponse carrying the usage.
+        """
+        delay, response, error = self._plan(prompt, system_prompt)
+        wait, cut_short = clip_to_deadline(delay)
+        time.sleep(wait)
+        if cut_short:
+            raise DeadlineExceededError("Synthetic stream cut off by the request deadline")
+        if error is not None:
+            raise error
+        text = response.text
+        chunk_chars = chunk_tokens * 4
+        for start in range(0, len(text), chunk_chars):
+            chunk = text[start:start + chunk_chars]
+            wait, cut_short = clip_to_deadline(self._generation_time(chunk))
+            time.sleep(wait)
+            if cut_short:
+                raise DeadlineExceededError("Synthetic stream cut off by the request deadline")
+            yield chunk
+        yield LLMResponse("", **response.usage())
+
+    def stats(self) -> dict:
+        """
+        Returns call and fault-injection counters.
+        """
+        with self._lock:
+            return {"model": self.model_name, "calls": self.calls, "injected": dict(self.injected)}
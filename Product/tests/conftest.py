@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The modules under Product/ import each other by bare name
+PRODUCT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PRODUCT_DIR))
+
+# main_server reads its configuration at import: point it at the simulator
+# with a fixed latency and keep every database out of the source tree
+_STATE_DIR = tempfile.mkdtemp(prefix="flexiframe-tests-")
+os.environ.update({
+    "LLM_BACKEND": "synthetic",
+    "SYNTH_LATENCY": "fixed",
+    "SYNTH_LATENCY_MS": "400",
+    "SYNTH_TOKENS_PER_SECOND": "1000000000",
+    "SYNTH_PREFILL_TOKENS_PER_SECOND": "1000000000",
+    "SYNTH_SEED": "1",
+    "PROMPT_CACHE": "0",
+    "PROMPT_CACHE_DB": os.path.join(_STATE_DIR, "generation_cache.sqlite3"),
+    "JOB_QUEUE_DB": os.path.join(_STATE_DIR, "jobs.sqlite3"),
+    "JOB_WORKERS": "0",
+})
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from llm_service import CascadeService, InvalidRequestError, LLMInterface, LLMServerError
+
+
+class FakeTier(LLMInterface):
+    """
+    Answers from a script, one entry per call; an exception entry is raised.
+    """
+
+    def __init__(self, name, answers):
+        self.model_name = name
+        self.answers = list(answers)
+        self.prompts = []
+
+    def _next(self, prompt):
+        self.prompts.append(prompt)
+        answer = self.answers[min(len(self.prompts), len(self.answers)) - 1]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def get_response(self, prompt, system_prompt=None):
+        return self._next(prompt)
+
+    def stream_response(self, prompt, system_prompt=None):
+        yield self._next(prompt)
+
+
+def cascade(fast, strong):
+    return CascadeService([fast, strong], accept=lambda text: text.startswith("good"),
+                          is_complex=lambda prompt: "dashboard" in prompt)
+
+
+def test_rejected_answer_moves_up_a_tier():
+    fast, strong = FakeTier("fast", ["good fast", "bad fast"]), FakeTier("strong", ["good strong"])
+    service = cascade(fast, strong)
+
+    assert service.get_response("a calculator") == "good fast"
+    assert service.get_response("a timer") == "good strong"
+    assert strong.prompts == ["a timer"]
+
+
+def test_failed_call_moves_up_a_tier_but_a_bad_request_does_not():
+    fast = FakeTier("fast", [LLMServerError("down"), InvalidRequestError("bad request")])
+    strong = FakeTier("strong", ["good strong"])
+    service = cascade(fast, strong)
+
+    assert asyncio.run(service.aget_response("a calculator")) == "good strong"
+    with pytest.raises(InvalidRequestError):
+        service.get_response("a timer")
+    assert len(strong.prompts) == 1
+
+
+def test_complex_prompt_goes_straight_to_the_last_tier():
+    fast, strong = FakeTier("fast", ["good fast"]), FakeTier("strong", ["bad strong"])
+    service = cascade(fast, strong)
+
+    # The last tier's answer is served even when accept rejects it
+    assert service.get_response("a dashboard") == "bad strong"
+    assert fast.prompts == []
+
+
+def test_served_fraction_per_tier():
+    fast = FakeTier("fast", ["good", "bad", "good", "bad"])
+    strong = FakeTier("strong", ["good strong"])
+    service = cascade(fast, strong)
+    for prompt in ("a", "b", "c", "d"):
+        service.get_response(prompt)
+
+    stats = service.stats()
+    fast_stats, strong_stats = stats["tiers"]
+    assert stats["requests"] == 4
+    assert (fast_stats["attempts"], fast_stats["served"], fast_stats["rejected"]) == (4, 2, 2)
+    assert fast_stats["served_fraction"] == 0.5
+    assert (strong_stats["attempts"], strong_stats["served_fraction"]) == (2, 0.5)
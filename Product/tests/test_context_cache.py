@@ -0,0 +1,91 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_service import InvalidRequestError, LocalContextCache
+
+PREFIX = "static instructions " * 50
+
+
+def test_prefix_is_registered_once():
+    cache = LocalContextCache()
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(cache.get(PREFIX))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(handles)) == 1
+    assert cache.prefixes == {handles[0]: PREFIX}
+    assert cache.stats()["registrations"] == 1
+    assert cache.stats()["hits"] == 7
+
+
+def test_prefix_is_refreshed_before_it_expires():
+    # Fresh for 0.05s, then within the refresh margin of its 1s lifetime
+    cache = LocalContextCache(ttl_seconds=1.0, refresh_margin=0.95)
+    handle = cache.get(PREFIX)
+    time.sleep(0.1)
+
+    assert cache.get(PREFIX) == handle
+    assert cache.stats()["refreshes"] == 1
+    assert cache.stats()["registrations"] == 1
+
+
+def test_failed_registration_sends_the_prefix_inline_for_a_while():
+    class FailingCache(LocalContextCache):
+        attempts = 0
+
+        def _create(self, prefix, ttl_seconds):
+            self.attempts += 1
+            raise RuntimeError("prefix too small to cache")
+
+    cache = FailingCache(retry_seconds=60.0)
+    assert cache.get(PREFIX) is None
+    assert cache.get(PREFIX) is None
+    assert cache.attempts == 1
+    assert cache.stats()["failures"] == 1
+
+
+class FakeModels:
+    """
+    generate_content that rejects cached prefixes the provider no longer has.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.configs = []
+
+    def generate_content(self, model, contents, config):
+        self.configs.append(config)
+        if config.cached_content and config.cached_content not in self.cache.prefixes:
+            raise InvalidRequestError(f"Cached content {config.cached_content} not found")
+        return SimpleNamespace(text="ok", usage_metadata=None, candidates=[])
+
+
+def test_rejected_prefix_is_invalidated_and_sent_inline():
+    pytest.importorskip("google.genai")
+    from llm_service import GeminiService
+
+    service = GeminiService("test-key", check_api_key=False, context_cache=False)
+    cache = LocalContextCache()
+    models = FakeModels(cache)
+    service._slots[0].context_cache = cache
+    service._slots[0].client = SimpleNamespace(models=models)
+
+    assert service.get_response("p", system_prompt=PREFIX) == "ok"
+    handle = models.configs[0].cached_content
+    assert handle is not None and models.configs[0].system_instruction is None
+
+    # The provider dropped the prefix: the call is repeated inline and the handle forgotten
+    del cache.prefixes[handle]
+    assert service.get_response("p", system_prompt=PREFIX) == "ok"
+    assert [config.cached_content for config in models.configs[1:]] == [handle, None]
+    assert models.configs[2].system_instruction == PREFIX
+
+    assert service.get_response("p", system_prompt=PREFIX) == "ok"
+    assert models.configs[3].cached_content not in (None, handle)
+    assert cache.stats()["registrations"] == 2
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("google.genai")
+
+from llm_service import GeminiService, deadline_scope, response_schema_scope  # noqa: E402
+from ui_schema import PACKED_RESPONSE_SCHEMA, UI_RESPONSE_SCHEMA  # noqa: E402
+
+
+def http_timeout(service):
+    config = service._config(None, None)
+    return config.http_options.timeout if config is not None and config.http_options else None
+
+
+@pytest.mark.parametrize("configured, deadline, expected", [
+    (10.0, 120.0, 10_000),
+    (10.0, 2.0, 2_000),
+    (None, 2.0, 2_000),
+])
+def test_call_timeout_is_the_shorter_of_timeout_and_deadline(configured, deadline, expected):
+    service = GeminiService("test-key", timeout=configured, check_api_key=False, context_cache=False)
+    with deadline_scope(deadline):
+        assert abs(http_timeout(service) - expected) <= 50
+
+
+def test_no_deadline_keeps_the_client_timeout():
+    service = GeminiService("test-key", timeout=10.0, check_api_key=False, context_cache=False)
+    assert http_timeout(service) is None
+
+
+def test_response_schema_can_be_replaced_per_call():
+    service = GeminiService("test-key", check_api_key=False, context_cache=False, response_schema=UI_RESPONSE_SCHEMA)
+    assert service._config(None, None).response_json_schema == UI_RESPONSE_SCHEMA
+    with response_schema_scope(PACKED_RESPONSE_SCHEMA):
+        assert service._config(None, None).response_json_schema == PACKED_RESPONSE_SCHEMA
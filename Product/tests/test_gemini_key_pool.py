@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.genai")
+
+from llm_service import GeminiService, KeysCoolingDownError, RateLimitedError, RateLimiter  # noqa: E402
+
+
+class FakeModels:
+    def __init__(self, rate_limited=False):
+        self.rate_limited = rate_limited
+        self.calls = 0
+
+    def generate_content(self, model, contents, config):
+        self.calls += 1
+        if self.rate_limited:
+            raise RateLimitedError("429 quota exhausted", retry_after=30.0)
+        return SimpleNamespace(text="ok", usage_metadata=None, candidates=[])
+
+
+def key_pool(count=3, rate_limiter=None):
+    service = GeminiService([f"key-{i}" for i in range(count)], rate_limiter=rate_limiter,
+                            check_api_key=False, context_cache=False)
+    for slot in service._slots:
+        slot.client = SimpleNamespace(models=FakeModels())
+    return service
+
+
+def test_key_with_most_headroom_is_chosen():
+    service = key_pool(rate_limiter=lambda: RateLimiter(rpm=10))
+    for slot, used in zip(service._slots, (5, 2, 4)):
+        for _ in range(used):
+            slot.rate_limiter.acquire()
+
+    slot = service._pick_slot()
+    assert slot.index == 1
+    assert slot.in_flight == 1
+    service._release_slot(slot)
+    assert slot.in_flight == 0
+
+
+def test_rate_limited_key_cools_down_and_traffic_moves_on():
+    service = key_pool(rate_limiter=lambda: RateLimiter(rpm=60))
+    limited = service._slots[0]
+    limited.client.models.rate_limited = True
+
+    # All keys look alike, so the first call lands on key 0 and gets the 429
+    with pytest.raises(RateLimitedError):
+        service.get_response("p")
+    assert limited.cooldowns == 1
+    assert limited.cooldown_until > 0
+
+    assert [service.get_response("p") for _ in range(6)] == ["ok"] * 6
+    assert limited.client.models.calls == 1
+    # Each call uses some of its key's quota, so the remaining keys take turns
+    assert [slot.client.models.calls for slot in service._slots[1:]] == [3, 3]
+
+
+def test_every_key_cooling_down_fails_fast():
+    service = key_pool(count=2)
+    for slot in service._slots:
+        slot.client.models.rate_limited = True
+        with pytest.raises(RateLimitedError):
+            service.get_response("p")
+
+    with pytest.raises(KeysCoolingDownError) as raised:
+        service.get_response("p")
+    assert 0 < raised.value.retry_after <= 30.0
+    assert sum(slot.client.models.calls for slot in service._slots) == 2
@@ -0,0 +1,108 @@
+import asyncio
+import gc
+import time
+
+from llm_service import HedgedService, LLMInterface, LLMServerError
+
+
+class FakeBackend(LLMInterface):
+    """
+    Answers after the next delay of its list (the last one repeats) and
+    counts the calls that were cancelled.
+    """
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.calls = 0
+        self.cancelled = 0
+
+    def get_response(self, prompt, system_prompt=None):
+        return "ok"
+
+    async def aget_response(self, prompt, system_prompt=None):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"answer {self.calls}"
+
+    def stream_response(self, prompt, system_prompt=None):
+        yield self.get_response(prompt, system_prompt)
+
+
+def test_slow_call_is_hedged_at_the_latency_percentile():
+    # Four quick calls set the percentile, then the primary is slow and the hedge quick
+    backend = FakeBackend([0.02, 0.02, 0.02, 0.02, 1.0, 0.02])
+    hedged = HedgedService(backend, percentile=0.5, min_samples=4, max_hedge_ratio=1.0, default_delay=10.0)
+
+    async def run():
+        for _ in range(4):
+            await hedged.aget_response("p")
+        assert hedged.hedge_delay() < 0.1
+        started = time.monotonic()
+        result = await hedged.aget_response("p")
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(run())
+    assert elapsed < 0.5
+    assert hedged.stats()["hedged"] == 1 and hedged.hedge_wins == 1
+    # The slow primary lost and was cancelled
+    assert backend.cancelled == 1
+
+
+def test_hedges_stay_within_the_budget():
+    backend = FakeBackend([0.05])
+    hedged = HedgedService(backend, max_hedge_ratio=0.25, min_samples=100, default_delay=0.01)
+
+    async def run():
+        for _ in range(8):
+            await hedged.aget_response("p")
+
+    asyncio.run(run())
+    assert hedged.requests == 8
+    assert hedged.hedged == 2
+
+
+def test_failed_loser_finishing_with_the_winner_is_not_reported_as_lost():
+    class RacingBackend(LLMInterface):
+        """
+        Both calls finish together: the primary fails, the hedge succeeds.
+        """
+
+        def __init__(self):
+            self.calls = 0
+            self.finish = None
+
+        def get_response(self, prompt, system_prompt=None):
+            return "ok"
+
+        async def aget_response(self, prompt, system_prompt=None):
+            self.calls += 1
+            call = self.calls
+            if call == 1:
+                self.finish = asyncio.Event()
+            else:
+                self.finish.set()
+            await self.finish.wait()
+            if call == 1:
+                raise LLMServerError("primary failed")
+            return "hedge answer"
+
+        def stream_response(self, prompt, system_prompt=None):
+            yield self.get_response(prompt, system_prompt)
+
+    lost = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: lost.append(context["message"]))
+        # Which task of the shared done set is looked at first varies, so race a few times
+        for _ in range(10):
+            hedged = HedgedService(RacingBackend(), max_hedge_ratio=1.0, default_delay=0.01)
+            assert await hedged.aget_response("p") == "hedge answer"
+            gc.collect()
+
+    asyncio.run(run())
+    assert lost == []
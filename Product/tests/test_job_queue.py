@@ -0,0 +1,53 @@
+import asyncio
+import sqlite3
+
+from job_queue import JobQueue, run_worker
+
+
+async def echo_handler(prompt, timeout):
+    return {"success": "true", "data": prompt}, 200
+
+
+def test_worker_runs_jobs(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3")
+    job_id = queue.submit("a calculator")
+
+    async def run():
+        worker = asyncio.ensure_future(run_worker(queue, echo_handler, "w1", poll_interval=0.01))
+        while queue.get(job_id)["status"] != JobQueue.DONE:
+            await asyncio.sleep(0.01)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    job = queue.get(job_id)
+    assert job["result"] == {"success": "true", "data": "a calculator"}
+    assert job["attempts"] == 1
+
+
+def test_locked_queue_does_not_stall_the_event_loop(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    queue = JobQueue(path)
+    queue.submit("a calculator")
+    # Another process holds the write lock, so claim waits on the busy timeout
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def run():
+        worker = asyncio.ensure_future(run_worker(queue, echo_handler, "w1", poll_interval=0.01))
+        # 20 short sleeps only add up to ~0.4s if the loop keeps running
+        for _ in range(20):
+            await asyncio.sleep(0.02)
+        other.execute("ROLLBACK")
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    elapsed = asyncio.run(_timed(run()))
+    assert elapsed < 1.5, elapsed
+
+
+async def _timed(coro):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await coro
+    return loop.time() - started
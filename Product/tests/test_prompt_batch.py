@@ -0,0 +1,31 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main_server
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main_server.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("body, error", [
+    ({"prompts": 5}, "'prompts' must be a list"),
+    ({"prompts": "a calculator"}, "'prompts' must be a list"),
+    ({"prompts": ["a calculator"], "concurrency": "many"}, "'concurrency' must be an integer"),
+    ({"prompts": ["a calculator"], "concurrency": [2]}, "'concurrency' must be an integer"),
+])
+def test_bad_input_is_rejected_with_400(client, body, error):
+    response = client.post("/prompt/batch", json=body)
+    assert response.status_code == 400
+    assert response.json() == {"success": "false", "error": error}
+
+
+def test_batch_streams_one_line_per_prompt(client):
+    response = client.post("/prompt/batch", json={"prompts": ["a calculator", "", "a login form"], "concurrency": "2"})
+    assert response.status_code == 200
+    items = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda item: item["index"])
+    assert [item["success"] for item in items] == ["true", "false", "true"]
@@ -0,0 +1,48 @@
+import pytest
+
+from prompt_builder import (
+    build_continuation_prompt, build_section_prompt, is_complex_prompt, split_continuation_prompt,
+    split_ui_sections
+)
+
+
+@pytest.mark.parametrize("prompt", [
+    "contact form with name, email and message",
+    "a calculator with add, subtract, multiply and divide",
+    "todo list with add, edit and delete",
+    "a timer with start and stop buttons",
+    "a login form with username field and password field",
+    "a calculator",
+])
+def test_features_of_one_ui_are_not_split(prompt):
+    assert split_ui_sections(prompt) == [prompt]
+
+
+def test_page_regions_are_split():
+    assert split_ui_sections("USER REQUEST : landing page with a header, a pricing panel and a footer") == [
+        "a header", "a pricing panel", "a footer"
+    ]
+    assert split_ui_sections("admin page with sidebar, users tab, settings tab, logs tab and footer",
+                             max_sections=3) == ["sidebar, users tab", "settings tab, logs tab", "footer"]
+
+
+def test_self_contained_widgets_are_split():
+    assert split_ui_sections("dashboard with comments list, a post form and stats panel") == [
+        "comments list", "a post form", "stats panel"
+    ]
+    assert split_ui_sections("news page with a feed, a sales chart and a users table") == [
+        "a feed", "a sales chart", "a users table"
+    ]
+
+
+def test_section_prompt_is_judged_by_its_section():
+    request = "landing page with a header, a pricing panel and a footer"
+    assert is_complex_prompt(request)
+    assert not is_complex_prompt(build_section_prompt(request, "a footer", 2, 3))
+    assert is_complex_prompt(build_section_prompt(request, "a sales chart panel", 1, 3))
+
+
+def test_continuation_prompt_round_trips():
+    prompt = build_continuation_prompt("USER REQUEST : a calculator", '{"functions": [')
+    assert split_continuation_prompt(prompt) == ("USER REQUEST : a calculator", '{"functions": [')
+    assert split_continuation_prompt("USER REQUEST : a calculator") is None
@@ -0,0 +1,38 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main_server
+
+LATENCY = 0.4
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main_server.app) as client:
+        # Build the service before timing anything
+        main_server.get_llm_service()
+        yield client
+
+
+def test_overlapping_prompts_are_not_serialized(client):
+    prompts = [f"a calculator number {i}" for i in range(6)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        responses = list(pool.map(lambda p: client.post("/prompt", json={"prompt": p}), prompts))
+    elapsed = time.perf_counter() - started
+
+    assert [r.status_code for r in responses] == [200] * len(prompts)
+    assert all(r.json()["success"] == "true" for r in responses)
+    # One latency plus overhead, far from len(prompts) latencies
+    assert elapsed < LATENCY * 2.5, elapsed
+
+
+def test_prompt_returns_corpus_schema(client):
+    response = client.post("/prompt", json={"prompt": "a calculator"})
+    assert response.status_code == 200
+    schema = json.loads(response.json()["data"])
+    assert {"functions", "elements", "css"} <= set(schema)
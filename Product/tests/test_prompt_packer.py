@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+from llm_service import LLMInterface, requested_response_schema
+from prompt_packer import PromptPacker
+
+
+class PackingBackend(LLMInterface):
+    """
+    Answers a packed prompt (a JSON object of id -> prompt) with one schema per id.
+    """
+
+    def __init__(self):
+        self.prompts = []
+        self.schemas = []
+
+    def get_response(self, prompt, system_prompt=None):
+        self.prompts.append(prompt)
+        self.schemas.append(requested_response_schema("single"))
+        if prompt.startswith("{"):
+            requests = json.loads(prompt)
+            return json.dumps({"results": [{"id": key, "schema": {"for": text}} for key, text in requests.items()]})
+        return json.dumps({"for": prompt})
+
+    def stream_response(self, prompt, system_prompt=None):
+        yield self.get_response(prompt, system_prompt)
+
+
+def make_packer(backend, **kwargs):
+    return PromptPacker(backend, build_prompt=lambda text: text, build_packed_prompt=json.dumps,
+                        parse=json.loads, window=0.05, **kwargs)
+
+
+def test_prompts_are_packed_into_one_call():
+    backend = PackingBackend()
+    packer = make_packer(backend)
+
+    async def run():
+        return await asyncio.gather(*(packer.submit(text) for text in ("a", "b", "c")))
+
+    results = asyncio.run(run())
+    assert [json.loads(result) for result in results] == [{"for": "a"}, {"for": "b"}, {"for": "c"}]
+    assert len(backend.prompts) == 1
+
+
+def test_cancelled_waiters_are_left_out_of_the_packed_call():
+    backend = PackingBackend()
+    packer = make_packer(backend)
+
+    async def run():
+        waiters = [asyncio.ensure_future(packer.submit(text)) for text in ("a", "gone", "c")]
+        await asyncio.sleep(0.01)
+        waiters[1].cancel()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert json.loads(backend.prompts[0]) == {"r0": "a", "r1": "c"}
+    assert packer.stats()["abandoned"] == 1
+
+
+def test_crashed_batch_fails_its_waiters():
+    def broken_validate(schema):
+        raise RuntimeError("validator bug")
+
+    packer = make_packer(PackingBackend(), validate=broken_validate)
+
+    async def run():
+        results = await asyncio.wait_for(
+            asyncio.gather(packer.submit("a"), packer.submit("b"), return_exceptions=True), timeout=2
+        )
+        return results, len(packer._tasks)
+
+    results, running = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert running == 0
+
+
+def test_only_packed_calls_ask_for_the_packed_schema():
+    backend = PackingBackend()
+    packer = make_packer(backend, packed_schema="packed")
+
+    async def run():
+        await asyncio.gather(*(packer.submit(text) for text in ("a", "b")))
+        await packer.submit("alone")
+
+    asyncio.run(run())
+    assert backend.schemas == ["packed", "single"]
+
+
+def test_cancelled_waiter_gets_no_fallback_call():
+    class SlowPackingBackend(PackingBackend):
+        async def aget_response(self, prompt, system_prompt=None):
+            await asyncio.sleep(0.1)
+            answer = json.loads(self.get_response(prompt, system_prompt))
+            # The second request is missing from the packed answer
+            answer["results"] = answer["results"][:1]
+            return json.dumps(answer)
+
+    backend = SlowPackingBackend()
+    packer = make_packer(backend)
+
+    async def run():
+        waiters = [asyncio.ensure_future(packer.submit(text)) for text in ("a", "gone")]
+        await asyncio.sleep(0.08)
+        waiters[1].cancel()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert json.loads(results[0]) == {"for": "a"}
+    assert len(backend.prompts) == 1
+    assert packer.stats()["abandoned"] == 1
+    assert packer.stats()["individual_calls"] == 0
+
+
+def test_server_packer_retries_incomplete_items_individually(monkeypatch):
+    import main_server
+
+    complete = {"functions": [], "elements": [{"type": "div"}], "css": []}
+
+    class ServerBackend(LLMInterface):
+        def __init__(self):
+            self.prompts = []
+
+        def get_response(self, prompt, system_prompt=None):
+            self.prompts.append(prompt)
+            if prompt.startswith("MULTIPLE USER REQUESTS"):
+                return json.dumps({"results": [{"id": "r0", "schema": complete}, {"id": "r1", "schema": {}}]})
+            return json.dumps(complete)
+
+        def stream_response(self, prompt, system_prompt=None):
+            yield self.get_response(prompt, system_prompt)
+
+    monkeypatch.setattr(main_server, "prompt_packers", {})
+    backend = ServerBackend()
+    packer = main_server.get_prompt_packer(backend)
+
+    async def run():
+        return await asyncio.gather(packer.submit("a calculator"), packer.submit("a login form"))
+
+    results = asyncio.run(run())
+    assert [json.loads(result) for result in results] == [complete, complete]
+    assert backend.prompts[1:] == [main_server.build_user_prompt("a login form")]
+    assert packer.stats()["fallbacks"] == 1
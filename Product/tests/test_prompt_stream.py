@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main_server
+from ui_schema import strip_json_fence
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main_server.app) as client:
+        yield client
+
+
+def sse_events(text):
+    """
+    Parses a Server-Sent Events body into (event, payload) pairs.
+    """
+    events = []
+    for message in text.strip().split("\n\n"):
+        event, payload = "message", None
+        for line in message.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                payload = json.loads(line[len("data: "):])
+        events.append((event, payload))
+    return events
+
+
+def test_stream_sends_chunks_then_done(client):
+    response = client.post("/prompt/stream", json={"prompt": "a calculator"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = sse_events(response.text)
+    chunks = [payload["chunk"] for event, payload in events[:-1]]
+    assert len(chunks) > 1 and all(event == "message" for event, _ in events[:-1])
+    event, done = events[-1]
+    assert event == "done" and done["success"] == "true"
+    assert json.loads(done["data"]) == json.loads(strip_json_fence("".join(chunks)))
+
+
+@pytest.mark.parametrize("body", [{}, {"prompt": ""}, {"prompt": "   "}, {"prompt": 5}, ["a calculator"]])
+def test_missing_prompt_is_rejected_before_streaming(client, body):
+    response = client.post("/prompt/stream", json=body)
+    assert response.status_code == 400
+    assert response.json() == {"success": "false", "error": "Prompt must be a non-empty string"}
+
+
+def test_unexpected_failure_ends_with_an_error_event(client, monkeypatch):
+    def broken_prompt(prompt_text):
+        raise RuntimeError("template missing")
+
+    monkeypatch.setattr(main_server, "build_user_prompt", broken_prompt)
+    response = client.post("/prompt/stream", json={"prompt": "a login form"})
+    assert sse_events(response.text) == [("error", {"success": "false", "error": "template missing"})]
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import llm_service
+from llm_service import RateLimiter, RateLimitQueueTimeout
+
+
+class FakeClock:
+    """
+    Stands in for time.monotonic in llm_service; asyncio.sleep moves it forward.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_service, "time", SimpleNamespace(monotonic=clock.monotonic, time=time.time))
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(seconds, result=None):
+        clock.advance(seconds)
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return clock
+
+
+def test_requests_per_minute(clock):
+    limiter = RateLimiter(rpm=2)
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == 0.0
+
+    # The next request is 30s away, longer than this caller may wait
+    with pytest.raises(RateLimitQueueTimeout):
+        limiter.acquire(max_wait=10)
+    clock.advance(30)
+    assert limiter.acquire() == 0.0
+
+    stats = limiter.stats()
+    assert (stats["acquired"], stats["timed_out"], stats["queue_depth"]) == (3, 1, 0)
+
+
+def test_tokens_per_minute_with_usage_correction(clock):
+    limiter = RateLimiter(tpm=100)
+    limiter.acquire(60)
+    assert limiter.stats()["tokens_available"] == 40
+
+    # The call really used 90 tokens
+    limiter.record_usage(60, 90)
+    assert limiter.stats()["tokens_available"] == 10
+
+    with pytest.raises(RateLimitQueueTimeout):
+        limiter.acquire(20, max_wait=5)
+    clock.advance(6)
+    limiter.acquire(20)
+    assert limiter.stats()["tokens_available"] == 0
+
+
+def test_oversized_request_is_capped_at_the_bucket(clock):
+    limiter = RateLimiter(tpm=100)
+    limiter.acquire(500)
+    assert limiter.stats()["tokens_available"] == 0
+
+
+def test_waiters_are_served_in_arrival_order(clock):
+    limiter = RateLimiter(tpm=60)
+    limiter.acquire(60)
+    order = []
+
+    async def caller(name, tokens):
+        await limiter.aacquire(tokens)
+        order.append((name, clock.now))
+
+    async def run():
+        large = asyncio.ensure_future(caller("large", 30))
+        await asyncio.sleep(0)
+        # A small request that could run sooner still queues behind the large one
+        small = asyncio.ensure_future(caller("small", 1))
+        await asyncio.gather(large, small)
+
+    started = clock.now
+    asyncio.run(run())
+    assert [name for name, _ in order] == ["large", "small"]
+    assert order[0][1] - started >= 30
+
+
+def test_async_waiter_gives_up_after_max_wait(clock):
+    limiter = RateLimiter(rpm=1, max_wait=5)
+    limiter.acquire()
+
+    with pytest.raises(RateLimitQueueTimeout):
+        asyncio.run(limiter.aacquire())
+    assert limiter.stats()["queue_depth"] == 0
@@ -0,0 +1,21 @@
+import main_server
+from llm_service import ReplayService
+
+
+def replay_cassette(service):
+    while not isinstance(service, ReplayService):
+        service = service.backend
+    return service.cassette_path
+
+
+def test_mode_without_a_cassette_replays_the_default_one(tmp_path, monkeypatch):
+    default = tmp_path / "llm_cassette.jsonl"
+    default.write_text("")
+    monkeypatch.setenv("LLM_REPLAY_MODE", "replay")
+    monkeypatch.setenv("LLM_CASSETTE", str(default))
+
+    assert replay_cassette(main_server.build_llm_service("fast")) == str(default)
+
+    own = tmp_path / "llm_cassette.fast.jsonl"
+    own.write_text("")
+    assert replay_cassette(main_server.build_llm_service("fast")) == str(own)
@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+from llm_service import LLMInterface, ReplayService
+
+
+class EchoBackend(LLMInterface):
+    model_name = "echo"
+
+    def get_response(self, prompt, system_prompt=None):
+        return f"answer to {prompt}"
+
+    async def aget_response(self, prompt, system_prompt=None):
+        return f"answer to {prompt}"
+
+    def stream_response(self, prompt, system_prompt=None):
+        yield f"answer to {prompt}"
+
+
+def test_recording_appends_one_line_per_call(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorder = ReplayService(path, mode="record", backend=EchoBackend())
+    recorder.get_response("a")
+    first = path.read_text()
+
+    asyncio.run(recorder.aget_response("b"))
+    recorder.get_response("a")
+
+    text = path.read_text()
+    assert text.startswith(first)
+    assert len(text.splitlines()) == 3
+
+    replay = ReplayService(path, mode="replay")
+    assert replay.get_response("b") == "answer to b"
+    assert replay.stats()["prompts"] == 2
+
+
+def test_legacy_json_cassette_is_read_and_converted(tmp_path):
+    path = tmp_path / "cassette.json"
+    key = ReplayService.prompt_hash("a")
+    entry = {"response": "old answer", "latency": 0.1, "usage": None, "recorded_at": 0}
+    path.write_text(json.dumps({"version": 1, "interactions": {key: [entry]}}))
+
+    assert ReplayService(path, mode="replay").get_response("a") == "old answer"
+
+    recorder = ReplayService(path, mode="record", backend=EchoBackend())
+    recorder.get_response("b")
+    assert [json.loads(line)["response"] for line in path.read_text().splitlines()] == ["old answer", "answer to b"]
+
+
+def test_cut_short_last_line_is_skipped(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    ReplayService(path, mode="record", backend=EchoBackend()).get_response("a")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "abc", "respon')
+
+    assert ReplayService(path, mode="replay").get_response("a") == "answer to a"
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main_server
+from cache_service import ResponseCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entry_expires_after_its_ttl():
+    cache = ResponseCache(ttl_seconds=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_hit_and_miss_counters():
+    cache = ResponseCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+
+def test_bad_size_is_rejected():
+    with pytest.raises(ValueError):
+        ResponseCache(max_entries=0)
+
+
+def test_purge_endpoint_empties_the_caches():
+    with TestClient(main_server.app) as client:
+        main_server.response_cache.set("a", "{}")
+        main_server.response_cache.set("b", "{}")
+
+        response = client.post("/cache/purge")
+        assert response.status_code == 200
+        assert response.json()["purged"] >= 2
+        assert main_server.response_cache.stats()["size"] == 0
+        assert client.post("/cache/purge").json() == {"status": "success", "purged": 0}
+        assert client.get("/cache/stats").json()["cache"]["size"] == 0
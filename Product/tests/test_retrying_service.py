@@ -0,0 +1,94 @@
+import pytest
+
+from llm_service import (
+    CircuitBreaker, CircuitOpenError, KeysCoolingDownError, LLMInterface, LLMServerError, RateLimiter,
+    RateLimitQueueTimeout, RetryingService
+)
+
+
+class FakeBackend(LLMInterface):
+    def __init__(self):
+        self.fail = False
+
+    def get_response(self, prompt, system_prompt=None):
+        if self.fail:
+            raise LLMServerError("down")
+        return "ok"
+
+    def stream_response(self, prompt, system_prompt=None):
+        if self.fail:
+            raise LLMServerError("down")
+        yield "o"
+        yield "k"
+
+
+def open_breaker(backend, breaker):
+    service = RetryingService(backend, max_attempts=1, breaker=breaker)
+    backend.fail = True
+    with pytest.raises(LLMServerError):
+        service.get_response("p")
+    backend.fail = False
+    assert breaker.state == CircuitBreaker.OPEN
+    return service
+
+
+def test_abandoned_stream_releases_half_open_trial():
+    backend = FakeBackend()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    service = open_breaker(backend, breaker)
+
+    # The half-open trial is a stream whose reader goes away after one chunk
+    stream = service.stream_response("p")
+    assert next(stream) == "o"
+    stream.close()
+
+    assert service.get_response("p") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.rejected == 0
+
+
+def test_half_open_admits_a_single_trial():
+    backend = FakeBackend()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    service = open_breaker(backend, breaker)
+
+    stream = service.stream_response("p")
+    next(stream)
+    with pytest.raises(CircuitOpenError):
+        service.get_response("p")
+    assert list(stream) == ["k"]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class QueuedBackend(LLMInterface):
+    """
+    Waits in a local rate-limit queue before answering.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def get_response(self, prompt, system_prompt=None):
+        self.limiter.acquire()
+        return "ok"
+
+    def stream_response(self, prompt, system_prompt=None):
+        yield self.get_response(prompt, system_prompt)
+
+
+def test_queue_timeouts_do_not_open_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60.0)
+    service = RetryingService(QueuedBackend(RateLimiter(rpm=1, max_wait=0.1)), max_attempts=1, breaker=breaker)
+    assert service.get_response("p") == "ok"
+
+    for _ in range(6):
+        with pytest.raises(RateLimitQueueTimeout):
+            service.get_response("p")
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_cooling_down_keys_do_not_count_against_the_upstream():
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure(KeysCoolingDownError("All 2 API keys are cooling down.", retry_after=1.0))
+    assert breaker.state == CircuitBreaker.CLOSED
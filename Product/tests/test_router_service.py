@@ -0,0 +1,117 @@
+import asyncio
+
+from llm_service import LLMInterface, LLMServerError, RouterService
+
+
+class FakeBackend(LLMInterface):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.fail = False
+        self.calls = 0
+
+    def get_response(self, prompt, system_prompt=None):
+        self.calls += 1
+        if self.fail:
+            raise LLMServerError("down")
+        return "ok"
+
+    async def aget_response(self, prompt, system_prompt=None):
+        await asyncio.sleep(self.delay)
+        return self.get_response(prompt, system_prompt)
+
+    def stream_response(self, prompt, system_prompt=None):
+        yield self.get_response(prompt, system_prompt)
+
+
+def ejected_router():
+    bad, good = FakeBackend(delay=1.0), FakeBackend()
+    router = RouterService([("bad", bad), ("good", good)], min_samples=1, max_error_rate=0.2,
+                           eject_seconds=0.0, failover=False)
+    bad.fail = True
+    state = router._states[0]
+    # Untried backends score 0, so the first call goes to "bad"
+    try:
+        router.get_response("p")
+    except LLMServerError:
+        pass
+    assert state.ejected
+    return router, bad, state
+
+
+def test_cancelled_probe_keeps_backend_ejected():
+    router, bad, state = ejected_router()
+    bad.fail = False
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(router.aget_response("p"))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    asyncio.run(cancel_probe())
+    assert state.ejected
+    assert not state.probing
+    assert state.in_flight == 0
+    assert state.ewma_latency is None
+
+
+def test_cancelled_call_records_no_latency():
+    backend = FakeBackend(delay=1.0)
+    router = RouterService([("only", backend)])
+    state = router._states[0]
+
+    async def cancel_call():
+        call = asyncio.ensure_future(router.aget_response("p"))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+
+    asyncio.run(cancel_call())
+    assert state.ewma_latency is None
+    assert state.requests == 0
+    assert state.in_flight == 0
+
+
+def test_completed_probe_restores_backend():
+    router, bad, state = ejected_router()
+    bad.fail = False
+    bad.delay = 0.0
+    assert asyncio.run(router.aget_response("p")) == "ok"
+    assert not state.ejected
+
+
+def test_traffic_follows_the_faster_backend():
+    fast, slow = FakeBackend(delay=0.01), FakeBackend(delay=0.08)
+    router = RouterService([("fast", fast), ("slow", slow)])
+
+    async def send(count):
+        for _ in range(count):
+            await router.aget_response("p")
+
+    # Both are sampled once, then the lower EWMA latency wins
+    asyncio.run(send(10))
+    assert slow.calls == 1 and fast.calls == 9
+
+    fast.delay = 0.3
+    asyncio.run(send(10))
+    assert slow.calls >= 9
+    assert router._states[0].ewma_latency > router._states[1].ewma_latency
+
+
+def test_backend_is_ejected_after_repeated_errors():
+    broken, healthy = FakeBackend(), FakeBackend()
+    broken.fail = True
+    router = RouterService([("broken", broken), ("healthy", healthy)], min_samples=3,
+                           max_error_rate=0.5, eject_seconds=60.0, failover=False)
+    state = router._states[0]
+
+    # Failed calls record no latency, so the broken backend keeps scoring best
+    for _ in range(3):
+        try:
+            router.get_response("p")
+        except LLMServerError:
+            pass
+    assert state.ejected and state.ejections == 1
+
+    assert [router.get_response("p") for _ in range(5)] == ["ok"] * 5
+    assert broken.calls == 3 and healthy.calls == 5
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import re
+import time
+
+from llm_service import LLMInterface
+from section_planner import SectionPlanner
+
+SECTION_DELAYS = {"comments list": 0.1, "a post form": 0.2, "stats panel": 0.3}
+
+
+class SectionBackend(LLMInterface):
+    """
+    Answers each section prompt after that section's delay.
+    """
+
+    def __init__(self):
+        self.prompts = []
+
+    def get_response(self, prompt, system_prompt=None):
+        raise NotImplementedError
+
+    async def aget_response(self, prompt, system_prompt=None):
+        self.prompts.append(prompt)
+        match = re.search(r"SECTION (\d+) OF \d+ : (.+)", prompt)
+        index, section = match.group(1), match.group(2)
+        await asyncio.sleep(SECTION_DELAYS[section])
+        return json.dumps({
+            "functions": [],
+            "elements": [{"type": "div", "id": f"s{index}_root", "text": section}],
+            "css": [],
+        })
+
+    def stream_response(self, prompt, system_prompt=None):
+        raise NotImplementedError
+
+
+def test_split_request_takes_about_as_long_as_its_slowest_section(monkeypatch):
+    import main_server
+
+    monkeypatch.setattr(main_server, "section_planners", {})
+    backend = SectionBackend()
+    planner = main_server.get_section_planner(backend)
+
+    started = time.monotonic()
+    result = asyncio.run(planner.generate("dashboard with comments list, a post form and stats panel"))
+    elapsed = time.monotonic() - started
+
+    assert len(backend.prompts) == 3
+    assert [element["text"] for element in json.loads(result)["elements"]] == list(SECTION_DELAYS)
+    slowest, total = max(SECTION_DELAYS.values()), sum(SECTION_DELAYS.values())
+    assert slowest <= elapsed < slowest + (total - slowest) / 2
+
+
+def test_unsplit_request_is_left_to_the_caller():
+    planner = SectionPlanner(SectionBackend(), plan=lambda text: [text], build_section_prompt=None,
+                             build_prompt=None, parse=json.loads, merge=None)
+    assert asyncio.run(planner.generate("a calculator")) is None
+    assert planner.stats()["planned"] == 0
@@ -0,0 +1,31 @@
+import pytest
+
+from cache_service import SimilarityCache, guard_terms, threshold_report
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("button that says yes", "button that says no"),
+    ("login form with remember me", "login form without remember me"),
+    ("form with 3 inputs", "form with 5 inputs"),
+    ("contact form with name and email", "contact form with name, email and phone"),
+])
+def test_different_requests_do_not_match(stored, asked):
+    cache = SimilarityCache()
+    cache.add(stored, "schema")
+    assert cache.lookup(asked) is None
+
+
+def test_rewordings_still_match():
+    cache = SimilarityCache()
+    cache.add("make a login form", "schema")
+    assert cache.lookup("login form please")[0] == "schema"
+
+
+def test_guard_terms_keep_negations_and_numbers():
+    assert guard_terms("form with 3 inputs and no labels") == {"3", "no"}
+    assert guard_terms("Login form without Remember-me") == {"without"}
+
+
+def test_default_threshold_has_no_false_positives_on_corpus():
+    row = next(row for row in threshold_report() if row["threshold"] == SimilarityCache().threshold)
+    assert row["false_positives"] == 0
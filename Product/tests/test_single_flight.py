@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from cache_service import SingleFlight
+
+
+class Work:
+    """
+    A shared call that takes delay seconds and counts its runs and cancellations.
+    """
+
+    def __init__(self, delay=0.05, error=None):
+        self.delay = delay
+        self.error = error
+        self.runs = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return {"run": self.runs}
+
+
+def test_concurrent_identical_requests_make_one_call():
+    flight, work = SingleFlight(), Work()
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert work.runs == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 4, "abandoned": 0}
+
+
+def test_every_waiter_gets_the_error_of_the_shared_call():
+    flight, work = SingleFlight(), Work(error=RuntimeError("upstream down"))
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert work.runs == 1
+    assert all(error is work.error for error in errors)
+
+    # The failed call is not remembered: the next request tries again
+    with pytest.raises(RuntimeError):
+        asyncio.run(flight.do("key", work))
+    assert work.runs == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    flight, work = SingleFlight(), Work(delay=0.1)
+
+    async def run():
+        leaving = asyncio.ensure_future(flight.do("key", work))
+        staying = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.02)
+        leaving.cancel()
+        return await staying, leaving
+
+    result, leaving = asyncio.run(run())
+    assert result == {"run": 1}
+    assert leaving.cancelled()
+    assert work.cancelled == 0
+    assert flight.stats()["abandoned"] == 0
+
+
+def test_call_is_cancelled_when_every_waiter_leaves():
+    flight, work = SingleFlight(), Work(delay=1.0)
+
+    async def run():
+        waiters = [asyncio.ensure_future(flight.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.02)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert work.cancelled == 1
+    assert flight.stats()["abandoned"] == 1
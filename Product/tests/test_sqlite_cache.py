@@ -0,0 +1,48 @@
+import sqlite3
+
+from cache_service import SQLiteCache
+
+
+def accessed_at(path, key):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT accessed_at FROM generations WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_hits_are_written_in_batches(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = SQLiteCache(path, touch_batch=3)
+    for key in ("a", "b", "c"):
+        cache.set(key, "v")
+    stored = accessed_at(path, "a")
+
+    # Repeated hits on one key take one slot of the batch
+    assert cache.get("a") == "v"
+    assert cache.get("a") == "v"
+    cache.get("b")
+    assert accessed_at(path, "a") == stored
+    cache.get("c")
+    assert accessed_at(path, "a") > stored
+    assert cache.stats()["hits"] == 4
+
+
+def test_hit_does_not_wait_for_the_write_lock(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = SQLiteCache(path)
+    cache.set("k", "v")
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        assert cache.get("k") == "v"
+    finally:
+        other.execute("ROLLBACK")
+
+
+def test_pending_hits_steer_eviction(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.sqlite3", max_bytes=2)
+    cache.set("old", "a")
+    cache.set("new", "b")
+    # "old" was used last, so adding a third entry evicts "new"
+    cache.get("old")
+    cache.set("third", "c")
+    assert cache.get("old") == "a"
+    assert cache.get("new") is None
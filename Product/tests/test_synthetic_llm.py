@@ -0,0 +1,27 @@
+from llm_service import ContinuationService
+from prompt_builder import build_continuation_prompt
+from synthetic_llm import SyntheticLLM
+from ui_schema import is_truncated_json, is_valid_json_response, stitch_continuation
+
+
+def continuing(backend):
+    return ContinuationService(backend, build_continuation=build_continuation_prompt, stitch=stitch_continuation,
+                               is_truncated=is_truncated_json, is_complete=is_valid_json_response)
+
+
+def test_invalid_answers_are_not_mistaken_for_cut_off_ones():
+    backend = SyntheticLLM(latency="fixed", latency_ms=0, tokens_per_second=1e9, prefill_tokens_per_second=1e9,
+                           invalid_rate=1.0, fence_rate=0.0, seed=3)
+    service = continuing(backend)
+
+    answers = [service.get_response(f"USER REQUEST : a calculator {i}") for i in range(20)]
+    assert all(answer.finish_reason == "STOP" for answer in answers)
+    assert not any(is_valid_json_response(answer) for answer in answers)
+    # Both kinds show up: a wrong closing bracket and prose after the JSON
+    assert any(answer.endswith("]") for answer in answers)
+    assert any(not answer.endswith(("}", "]")) for answer in answers)
+
+    stats = service.stats()
+    assert stats["truncated"] == 0 and stats["continuations"] == 0
+    assert stats["backend"]["injected"]["invalid"] == 20
+
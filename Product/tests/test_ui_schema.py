@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from ui_schema import (
+    is_truncated_json, is_valid_json_response, merge_ui_schemas, stitch_continuation
+)
+
+SCHEMA = {
+    "functions": [
+        {"function_id": "calc", "params": [],
+         "logic": "document.getElementById('out').textContent = await ALL_FUNCTIONS['double'](2);"},
+        {"function_id": "double", "params": [{"name": "x", "type": "number"}], "logic": "return x * 2;"},
+    ],
+    "elements": [
+        {"type": "div", "id": "box", "children": [{"type": "p", "id": "out", "text": "cut here: a, b"}]},
+        {"type": "button", "text": "Go", "events": [
+            {"event": "click", "function_id": "calc",
+             "params": [{"source": "element", "element_id": "out", "method": "text", "type": "string"}]},
+        ]},
+    ],
+    "css": [{"selector": "#out", "rules": "color: red;"}, {"selector": "button", "rules": "padding: 4px;"}],
+}
+TEXT = json.dumps(SCHEMA)
+
+
+@pytest.mark.parametrize("cut", [1, 17, TEXT.index("cut here") + 4, len(TEXT) // 2, len(TEXT) - 1])
+def test_stitch_exact_continuation(cut):
+    head, tail = TEXT[:cut], TEXT[cut:]
+    assert is_truncated_json(head)
+    assert json.loads(stitch_continuation(head, tail)) == SCHEMA
+
+
+@pytest.mark.parametrize("cut", [40, len(TEXT) // 2])
+def test_stitch_removes_repeated_overlap_and_fences(cut):
+    head = "```json\n" + TEXT[:cut]
+    tail = "```json\n" + TEXT[cut - 20:] + "\n```"
+    assert json.loads(stitch_continuation(head, tail)) == SCHEMA
+
+
+def test_stitch_accepts_a_restarted_answer():
+    assert json.loads(stitch_continuation(TEXT[:50], TEXT)) == SCHEMA
+
+
+def test_stitch_of_a_cut_continuation_stays_resumable():
+    cut = len(TEXT) // 3
+    joined = stitch_continuation(TEXT[:cut], TEXT[cut:2 * cut])
+    assert is_truncated_json(joined)
+    assert json.loads(stitch_continuation(joined, TEXT[2 * cut:])) == SCHEMA
+
+
+def test_malformed_json_is_not_truncated():
+    assert not is_truncated_json('{"a": [1, 2}')
+    assert not is_truncated_json("Here is your UI: {")
+    assert not is_valid_json_response('{"a": [1, 2}')
+
+
+def test_merge_renames_colliding_ids_and_references():
+    merged = merge_ui_schemas([SCHEMA, SCHEMA])
+    function_ids = [f["function_id"] for f in merged["functions"]]
+    assert function_ids == ["calc", "double", "calc_2", "double_2"]
+    second = merged["functions"][2]["logic"]
+    assert "ALL_FUNCTIONS['double_2']" in second and "getElementById('out_2')" in second
+    box = merged["elements"][2]
+    assert box["id"] == "box_2" and box["children"][0]["id"] == "out_2"
+    event = merged["elements"][3]["events"][0]
+    assert event["function_id"] == "calc_2" and event["params"][0]["element_id"] == "out_2"
+    # Untouched input
+    assert SCHEMA["elements"][0]["id"] == "box"
+
+
+def test_merge_dedupes_css():
+    other = {"functions": [], "elements": [{"type": "p"}],
+             "css": [{"selector": "button", "rules": "padding:  4px;"}, {"selector": "button", "rules": "margin: 0;"}]}
+    merged = merge_ui_schemas([SCHEMA, other])
+    assert merged["css"] == [
+        {"selector": "#out", "rules": "color: red;"},
+        {"selector": "button", "rules": "padding: 4px; margin: 0;"},
+    ]
@@ -0,0 +1,54 @@
+import pytest
+
+from llm_service import LLMResponse
+from usage_tracker import UsageTracker
+
+
+def response(model="gemini-2.5-pro", prompt=100, output=200, thinking=50, cached=40, latency=1.0, finish="STOP"):
+    return LLMResponse("{}", model=model, prompt_tokens=prompt, output_tokens=output, thinking_tokens=thinking,
+                       cached_tokens=cached, latency=latency, finish_reason=finish)
+
+
+def test_totals_are_grouped_by_route_template_mode_and_model():
+    tracker = UsageTracker()
+    tracker.record("/prompt", "v1", response(latency=1.0), "quality")
+    tracker.record("/prompt", "v1", response(model="gemini-2.5-flash", latency=3.0, finish="MAX_TOKENS"), "fast")
+    tracker.record("/prompt/stream", "v1", response(latency=2.0), "quality")
+
+    stats = tracker.stats()
+    total = stats["total"]
+    assert (total["calls"], total["prompt_tokens"], total["output_tokens"]) == (3, 300, 600)
+    assert (total["thinking_tokens"], total["cached_tokens"]) == (150, 120)
+    assert total["avg_output_tokens"] == 250
+    assert total["avg_latency"] == pytest.approx(2.0)
+    assert total["max_latency"] == 3.0
+    assert total["finish_reasons"] == {"STOP": 2, "MAX_TOKENS": 1}
+
+    assert stats["routes"]["/prompt"]["calls"] == 2
+    assert stats["templates"]["v1"]["calls"] == 3
+    assert stats["modes"]["fast"]["output_tokens"] == 200
+    assert stats["models"]["gemini-2.5-pro"]["calls"] == 2
+
+
+def test_packed_answers_split_the_call_usage():
+    tracker = UsageTracker()
+    packed = response(prompt=400, output=900, thinking=0, cached=300, latency=2.0)
+    for index in range(3):
+        tracker.record("/prompt", "v1/packed", packed.share(f'{{"id": {index}}}', 3))
+
+    total = tracker.stats()["templates"]["v1/packed"]
+    assert total["calls"] == 3
+    # Integer shares never add up to more than the one call used
+    assert (total["prompt_tokens"], total["output_tokens"], total["cached_tokens"]) == (399, 900, 300)
+    assert total["avg_latency"] == 2.0
+
+
+def test_plain_text_results_count_as_unreported():
+    tracker = UsageTracker()
+    tracker.record("/prompt", "v1", "{}")
+    tracker.record("/prompt", "v1", response(prompt=10, output=20))
+
+    total = tracker.stats()["total"]
+    assert (total["calls"], total["unreported"]) == (2, 1)
+    assert total["avg_prompt_tokens"] == 10
+    assert tracker.stats()["models"]["unknown"]["calls"] == 1
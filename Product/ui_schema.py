@@ -0,0 +1,312 @@
+import json
+import re
+
+# JSON Schema of the functions/elements/css object described in
+# v1_schema_prompt.txt, sent as the structured-output response schema.
+# Field names cover both the prompt (source/value) and the renderer in
+# UI.html (element_id/literal/method).
+_SCHEMA_DEFS = {
+    "event_param": {
+        "type": "object",
+        "properties": {
+            "source": {"type": "string", "enum": ["element", "literal", "constant", "global"]},
+            "element_id": {"type": "string"},
+            "method": {"type": "string", "enum": ["value", "text", "element"]},
+            "value": {"type": ["string", "number", "boolean"]},
+            "literal": {"type": ["string", "number", "boolean"]},
+            "type": {"type": "string", "enum": ["number", "string", "boolean", "element", "object", "array"]},
+        },
+        "required": ["source", "type"],
+    },
+    "event": {
+        "type": "object",
+        "properties": {
+            "event": {"type": "string"},
+            "function_id": {"type": "string"},
+            "params": {"type": "array", "items": {"$ref": "#/$defs/event_param"}},
+        },
+        "required": ["event", "function_id", "params"],
+    },
+    "element": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string"},
+            "id": {"type": "string"},
+            "class": {"type": "string"},
+            "text": {"type": "string"},
+            "attributes": {"type": "object", "additionalProperties": {"type": "string"}},
+            "children": {"type": "array", "items": {"$ref": "#/$defs/element"}},
+            "events": {"type": "array", "items": {"$ref": "#/$defs/event"}},
+        },
+        "required": ["type"],
+    },
+}
+
+_UI_OBJECT = {
+    "type": "object",
+    "properties": {
+        "functions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "function_id": {"type": "string"},
+                    "name": {"type": "string"},
+                    "params": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {"name": {"type": "string"}, "type": {"type": "string"}},
+                            "required": ["name", "type"],
+                        },
+                    },
+                    "logic": {"type": "string"},
+                },
+                "required": ["function_id", "params", "logic"],
+            },
+        },
+        "elements": {"type": "array", "items": {"$ref": "#/$defs/element"}},
+        "css": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"selector": {"type": "string"}, "rules": {"type": "string"}},
+                "required": ["selector", "rules"],
+            },
+        },
+    },
+    "required": ["functions", "elements", "css"],
+}
+
+UI_RESPONSE_SCHEMA = {"$defs": _SCHEMA_DEFS, **_UI_OBJECT}
+
+# Answer of a packed prompt (see prompt_builder.build_packed_prompt), asked
+# for per call so single prompts keep the plain UI schema
+PACKED_RESPONSE_SCHEMA = {
+    "$defs": _SCHEMA_DEFS,
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, "schema": _UI_OBJECT},
+                "required": ["id", "schema"],
+            },
+        },
+    },
+    "required": ["results"],
+}
+
+def strip_json_fence(text):
+    """
+    Remove ```json or ``` from start/end of LLM response if present.
+    """
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+
+    if text.endswith("```"):
+        text = text[:-3]
+
+    return text.strip()
+
+
+def is_valid_json_response(text):
+    """
+    True when the LLM response parses as JSON once its fence is stripped.
+    """
+    try:
+        json.loads(strip_json_fence(text))
+        return True
+    except (TypeError, json.JSONDecodeError):
+        return False
+
+
+def is_valid_ui_schema(text):
+    """
+    True when the LLM response parses as JSON and has the functions/elements/css
+    lists the UI renderer needs.
+    """
+    try:
+        schema = json.loads(strip_json_fence(text))
+    except (TypeError, json.JSONDecodeError):
+        return False
+    if not isinstance(schema, dict):
+        return False
+    if not all(isinstance(schema.get(key), list) for key in ("functions", "elements", "css")):
+        return False
+    # An empty UI is never a useful answer
+    return bool(schema["elements"])
+
+
+def is_truncated_json(text):
+    """
+    True when the response is the start of a JSON object or array that was
+    cut off: it ends inside a string or with brackets still open.
+    """
+    text = strip_json_fence(text or "")
+    if not text.startswith(("{", "[")):
+        return False
+    open_brackets = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            open_brackets.append(char)
+        elif char in "}]":
+            if not open_brackets or "{[".index(open_brackets.pop()) != "}]".index(char):
+                # Malformed rather than cut off
+                return False
+    return in_string or bool(open_brackets)
+
+
+def _unfence(text):
+    """
+    strip_json_fence that keeps surrounding whitespace, which may belong to
+    a string the cut went through.
+    """
+    if text.startswith("```"):
+        text = text[7:] if text.startswith("```json") else text[3:]
+        text = text.lstrip("\n")
+    if text.rstrip().endswith("```"):
+        text = text.rstrip()[:-3].rstrip("\n")
+    return text
+
+
+def stitch_continuation(head, tail, min_overlap=8, max_overlap=200):
+    """
+    Joins a cut-off response and the continuation the model produced for it.
+
+    Models sometimes repeat the last characters before the cut or wrap the
+    continuation in a fence, so both are removed; repeats shorter than
+    min_overlap are treated as coincidence. A continuation that restarted
+    from scratch and parses on its own replaces the head.
+
+    Returns:
+        The joined text without fences. It parses as JSON when stitching
+        worked, and is still cut off when the continuation was too.
+    """
+    head = _unfence(head or "")
+    tail = _unfence(tail or "")
+    candidates = [
+        head + tail[size:]
+        for size in range(min(max_overlap, len(head), len(tail)), min_overlap - 1, -1)
+        if head.endswith(tail[:size])
+    ]
+    candidates.append(head + tail)
+    for candidate in candidates:
+        if is_valid_json_response(candidate):
+            return candidate
+    if is_valid_ui_schema(tail):
+        return tail
+    # Nothing parses yet: keep a join that is still a clean prefix for the next continuation
+    return next((candidate for candidate in candidates if is_truncated_json(candidate)), candidates[-1])
+
+
+def _unique(name, taken, section):
+    """
+    name, or name with a section suffix when another section already uses it.
+    """
+    candidate, counter = name, section
+    while candidate in taken:
+        candidate = f"{name}_{counter}"
+        counter += 1
+    taken.add(candidate)
+    return candidate
+
+
+def _rename_in_logic(logic, function_ids, element_ids):
+    """
+    Rewrites the ALL_FUNCTIONS, getElementById and #id references of a
+    logic body or selector.
+    """
+    for old, new in function_ids.items():
+        logic = re.sub(r"""(ALL_FUNCTIONS\[\s*['"])""" + re.escape(old) + r"""(['"]\s*\])""", rf"\g<1>{new}\g<2>", logic)
+    for old, new in element_ids.items():
+        logic = re.sub(r"""(getElementById\(\s*['"])""" + re.escape(old) + r"""(['"]\s*\))""", rf"\g<1>{new}\g<2>", logic)
+        logic = re.sub(r"#" + re.escape(old) + r"(?![\w-])", f"#{new}", logic)
+    return logic
+
+
+def _walk_elements(elements):
+    for element in elements:
+        if isinstance(element, dict):
+            yield element
+            yield from _walk_elements(element.get("children") or [])
+
+
+def merge_ui_schemas(schemas):
+    """
+    Combines the schemas of separately generated sections into one.
+
+    A function_id or element id already used by an earlier section gets a
+    numeric suffix, and the references to it in that section are rewritten
+    (events, element params, logic and css selectors). css rules are merged
+    per selector, dropping repeated rules.
+
+    Args:
+        schemas: Parsed section schemas, in display order.
+
+    Returns:
+        One schema whose elements are the sections' elements in order.
+    """
+    merged = {"functions": [], "elements": [], "css": []}
+    taken_functions, taken_elements = set(), set()
+    css_rules = {}
+    for section, schema in enumerate(schemas, start=1):
+        functions = [f for f in schema.get("functions") or [] if isinstance(f, dict)]
+        elements = [e for e in schema.get("elements") or [] if isinstance(e, dict)]
+        function_ids = {}
+        for function in functions:
+            if "function_id" in function:
+                function_ids[function["function_id"]] = _unique(function["function_id"], taken_functions, section)
+        element_ids = {}
+        for element in _walk_elements(elements):
+            if "id" in element:
+                element_ids[element["id"]] = _unique(element["id"], taken_elements, section)
+        function_ids = {old: new for old, new in function_ids.items() if old != new}
+        element_ids = {old: new for old, new in element_ids.items() if old != new}
+
+        for function in functions:
+            function = dict(function)
+            function["function_id"] = function_ids.get(function.get("function_id"), function.get("function_id"))
+            if isinstance(function.get("logic"), str):
+                function["logic"] = _rename_in_logic(function["logic"], function_ids, element_ids)
+            merged["functions"].append(function)
+
+        elements = json.loads(json.dumps(elements))
+        for element in _walk_elements(elements):
+            if "id" in element:
+                element["id"] = element_ids.get(element["id"], element["id"])
+            for event in element.get("events") or []:
+                if not isinstance(event, dict):
+                    continue
+                event["function_id"] = function_ids.get(event.get("function_id"), event.get("function_id"))
+                for param in event.get("params") or []:
+                    if isinstance(param, dict) and param.get("source") == "element":
+                        for key in ("element_id", "value"):
+                            if param.get(key) in element_ids:
+                                param[key] = element_ids[param[key]]
+        merged["elements"].extend(elements)
+
+        for rule in schema.get("css") or []:
+            if not isinstance(rule, dict) or "selector" not in rule:
+                continue
+            selector = _rename_in_logic(str(rule["selector"]), {}, element_ids)
+            rules = css_rules.setdefault(selector, [])
+            text = " ".join(str(rule.get("rules", "")).split())
+            if text and text not in rules:
+                rules.append(text)
+    merged["css"] = [{"selector": selector, "rules": " ".join(rules)} for selector, rules in css_rules.items()]
+    return merged
@@ -0,0 +1,100 @@
+import threading
+from collections import deque
+
+
+class _UsageTotals:
+    """
+    Running totals for one group of LLM calls.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.calls = 0
+        self.unreported = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.thinking_tokens = 0
+        self.cached_tokens = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.finish_reasons = {}
+        self._latencies = deque(maxlen=window)
+
+    def add(self, response) -> None:
+        self.calls += 1
+        if getattr(response, "prompt_tokens", None) is None:
+            # Plain str result: the backend reported no usage
+            self.unreported += 1
+            return
+        self.prompt_tokens += response.prompt_tokens or 0
+        self.output_tokens += response.output_tokens or 0
+        self.thinking_tokens += response.thinking_tokens or 0
+        self.cached_tokens += response.cached_tokens or 0
+        latency = response.latency or 0.0
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self._latencies.append(latency)
+        reason = response.finish_reason or "UNKNOWN"
+        self.finish_reasons[reason] = self.finish_reasons.get(reason, 0) + 1
+
+    def _percentile(self, q: float) -> float:
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def snapshot(self) -> dict:
+        reported = self.calls - self.unreported
+        return {
+            "calls": self.calls,
+            "unreported": self.unreported,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "thinking_tokens": self.thinking_tokens,
+            "cached_tokens": self.cached_tokens,
+            "avg_prompt_tokens": self.prompt_tokens / reported if reported else 0.0,
+            "avg_output_tokens": (self.output_tokens + self.thinking_tokens) / reported if reported else 0.0,
+            "avg_latency": self.latency_total / reported if reported else 0.0,
+            "p50_latency": self._percentile(0.5),
+            "p95_latency": self._percentile(0.95),
+            "max_latency": self.latency_max,
+            "finish_reasons": dict(self.finish_reasons),
+        }
+
+
+class UsageTracker:
+    """
+    Aggregates the usage of LLMResponse results per route, prompt template,
+    latency mode and model.
+
+    Results without usage metadata (plain str from a backend that does not
+    report it) are counted as calls but marked unreported.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total = _UsageTotals()
+        self._groups = {"routes": {}, "templates": {}, "modes": {}, "models": {}}
+
+    def record(self, route: str, template: str, response, mode: str = "default") -> None:
+        """
+        Adds one LLM result to the totals.
+
+        Args:
+            route: The API route that made the call (e.g. "/prompt").
+            template: Label of the prompt template the call used.
+            response: The LLMResponse (or plain str) the backend returned.
+            mode: The latency mode the request asked for.
+        """
+        model = getattr(response, "model", None) or "unknown"
+        with self._lock:
+            self._total.add(response)
+            for group, name in (("routes", route), ("templates", template), ("modes", mode), ("models", model)):
+                self._groups[group].setdefault(name, _UsageTotals()).add(response)
+
+    def stats(self) -> dict:
+        """
+        Returns the running totals overall and per route, template, mode and model.
+        """
+        with self._lock:
+            stats = {"total": self._total.snapshot()}
+            for group, totals in self._groups.items():
+                stats[group] = {name: entry.snapshot() for name, entry in totals.items()}
+            return stats